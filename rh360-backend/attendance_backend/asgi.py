@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Después de cargar Django: el kiosco usa los modelos
+from facial_recognition.kiosk import KIOSK_PATH, kiosk_websocket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """HTTP va a Django; los WebSocket del kiosco a facial_recognition.kiosk"""
+    if scope['type'] == 'websocket':
+        if scope['path'] == KIOSK_PATH:
+            return await kiosk_websocket(scope, receive, send)
+        await receive()
+        return await send({'type': 'websocket.close', 'code': 4404})
+    return await django_application(scope, receive, send)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+import django
+
+# Los benchmarks se ejecutan con pytest desde rh360-backend, fuera de manage.py test
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_backend.settings')
+django.setup()
@@ -0,0 +1,76 @@
+"""Benchmarks de la etapa de matching sobre galerías sintéticas
+
+    pip install pytest pytest-benchmark
+    pytest benchmarks --benchmark-json=resultados.json
+    pytest benchmarks --benchmark-compare=0001 --benchmark-compare-fail=median:25%
+
+La galería de 100k empleados ocupa ~1.3 GB; se incluye con FACE_BENCH_LARGE=1.
+"""
+import itertools
+import os
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from facial_recognition.benchmarks import (  # noqa: E402
+    StaticGallery, snapshot_nbytes, stored_face_data, synthetic_gallery, synthetic_probes, traced_peak
+)
+from facial_recognition.face_recognition_utils import AdvancedFaceRecognitionService  # noqa: E402
+
+SIZES = [100, 1000, 10000] + ([100000] if os.environ.get('FACE_BENCH_LARGE') else [])
+QUERIES = 50
+
+_galleries = {}
+
+
+def gallery_for(size):
+    # Se conserva solo la última galería generada para no acumular memoria entre tamaños
+    if size not in _galleries:
+        _galleries.clear()
+        snapshot, centers, landmark_shapes = synthetic_gallery(size, seed=0)
+        probes, probe_landmarks, _ = synthetic_probes(centers, landmark_shapes, QUERIES, seed=1)
+        _galleries[size] = snapshot, list(zip(probes, probe_landmarks))
+    return _galleries[size]
+
+
+@pytest.fixture(scope='module')
+def service():
+    return AdvancedFaceRecognitionService()
+
+
+def run_match(benchmark, size, config):
+    snapshot, queries = gallery_for(size)
+    gallery = StaticGallery(snapshot)
+    cycle = itertools.cycle(queries)
+
+    _, peak_bytes = traced_peak(gallery.match, *queries[0], config)
+    benchmark.extra_info['gallery_bytes'] = snapshot_nbytes(snapshot)
+    benchmark.extra_info['peak_bytes'] = peak_bytes
+
+    def match():
+        probe, landmarks = next(cycle)
+        return gallery.match(probe, landmarks, config)
+
+    benchmark.pedantic(match, rounds=len(queries) * 2, warmup_rounds=1)
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_gallery_match(benchmark, service, size):
+    run_match(benchmark, size, service.ADVANCED_CONFIG)
+
+
+@pytest.mark.parametrize('size', SIZES)
+def test_gallery_match_exhaustive(benchmark, service, size):
+    run_match(benchmark, size, dict(service.ADVANCED_CONFIG, coarse_enabled=False))
+
+
+def test_advanced_face_comparison(benchmark, service):
+    snapshot, queries = gallery_for(SIZES[0])
+    stored = [stored_face_data(snapshot, index) for index in range(len(queries))]
+    calls = itertools.cycle([(data, probe, landmarks) for data, (probe, landmarks) in zip(stored, queries)])
+
+    _, peak_bytes = traced_peak(service.advanced_face_comparison, *next(calls))
+    benchmark.extra_info['peak_bytes'] = peak_bytes
+
+    benchmark(lambda: service.advanced_face_comparison(*next(calls)))
@@ -0,0 +1,260 @@
+"""Vistas async para servir con ASGI (uvicorn attendance_backend.asgi:application)
+
+Con WSGI cada verificación facial ocupa un worker completo mientras espera al pool de dlib.
+Aquí el event loop solo espera: advanced_verify corre en un hilo del ejecutor y la base de
+datos se consulta con el ORM async, así que el proceso sigue aceptando solicitudes.
+"""
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .face_metrics import timed_stage
+from .face_motion import device_key
+from .face_workers import WorkerPoolBusy
+from .models import AttendanceRecord, Employee, normalize_rut
+from .parsers import MAX_RAW_IMAGE_BYTES
+from .views import (
+    ADVANCED_CONFIG, NO_CHANGE_PAYLOAD, SERVER_BUSY_PAYLOAD, _duplicate_queryset, _face_attendance_payload,
+    _face_not_recognized_payload, _face_record_values, _manual_attendance_payload, _manual_record_values,
+    _qr_attendance_payload, _qr_duplicate_payload, _qr_record_values, _qr_rut, face_recognition_service,
+    validate_chilean_rut
+)
+
+# advanced_verify bloquea su hilo mientras espera al pool de procesos (y consulta la galería con el
+# ORM síncrono), por eso corre en hilos propios y no en el event loop
+verification_executor = ThreadPoolExecutor(
+    max_workers=ADVANCED_CONFIG['async_verification_threads'],
+    thread_name_prefix='async-verification'
+)
+
+
+def _with_fresh_connections(function, *args):
+    # Los hilos del ejecutor viven más que una solicitud: sus conexiones se cierran como en Django
+    close_old_connections()
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+async def run_in_executor(function, *args):
+    """Ejecuta una función bloqueante en el ejecutor de verificación sin detener el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(verification_executor, _with_fresh_connections, function, *args)
+
+
+def request_data(request):
+    """Datos de la solicitud con las mismas reglas que PHOTO_PARSERS (JSON, formulario o image/*)"""
+    content_type = request.content_type or ''
+    if content_type == 'application/json':
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError('Se esperaba un objeto JSON')
+        return data
+    if content_type.startswith('image/'):
+        if len(request.body) > MAX_RAW_IMAGE_BYTES:
+            raise ValueError('Imagen demasiado grande')
+        data = request.GET.dict()
+        data['photo'] = request.body
+        return data
+    data = request.POST.dict()
+    data.update(request.FILES.dict())
+    return data
+
+
+def async_api_view(view):
+    """Equivalente async de @api_view(['POST']): solo POST, sin CSRF y con los datos ya leídos"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return JsonResponse({'detail': f'Método "{request.method}" no permitido.'}, status=405)
+        try:
+            data = request_data(request)
+        except ValueError as e:
+            return JsonResponse({'detail': f'Solicitud inválida: {e}'}, status=400)
+        return await view(request, data, *args, **kwargs)
+
+    # Los decoradores de Django 4.2 (csrf_exempt, require_POST) envuelven la vista en una función síncrona
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def _json(payload, status=200):
+    return JsonResponse(payload, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+async def acheck_duplicate_attendance(employee, attendance_type, timestamp_str, tolerance_minutes=5):
+    """check_duplicate_attendance con el ORM async"""
+    try:
+        # select_related: el serializer lee el empleado y en async no puede cargarlo de forma perezosa
+        return await _duplicate_queryset(
+            employee, attendance_type, timestamp_str, tolerance_minutes
+        ).select_related('employee').afirst()
+    except Exception as e:
+        print(f"Error verificando duplicado: {str(e)}")
+        return None
+
+
+async def asearch_employee_by_rut(rut):
+    """search_employee_by_rut con el ORM async"""
+    try:
+        clean_search = normalize_rut(rut)
+        if not clean_search:
+            return None
+        return await Employee.objects.filter(rut_normalized=clean_search, is_active=True).afirst()
+    except Exception as e:
+        print(f"Error buscando empleado por RUT: {str(e)}")
+        return None
+
+
+async def _verify_face(data):
+    photo_data = data.get('photo', '')
+    attendance_type = data.get('type', 'entrada').lower()
+
+    if not photo_data:
+        return _json({'success': False, 'message': 'Foto requerida para verificación'}, status=400)
+
+    start_time = time.time()
+    try:
+        verification_result, error = await run_in_executor(
+            face_recognition_service.advanced_verify, photo_data, None, device_key(data.get('device_info'))
+        )
+    except WorkerPoolBusy:
+        return _json(SERVER_BUSY_PAYLOAD, status=503)
+    elapsed_time = time.time() - start_time
+
+    if verification_result and verification_result.get('no_change'):
+        return _json(NO_CHANGE_PAYLOAD)
+
+    if error or not verification_result or not verification_result.get('best_match'):
+        return _json(_face_not_recognized_payload(error), status=400)
+
+    employee_obj = await Employee.objects.aget(id=verification_result['best_match']['id'])
+    best_confidence = verification_result['best_confidence']
+
+    with timed_stage('verification', 'db_write'):
+        existing_record = await acheck_duplicate_attendance(employee_obj, attendance_type, timezone.now())
+    if existing_record:
+        return _json(_face_attendance_payload(employee_obj, attendance_type, best_confidence, elapsed_time, None))
+
+    with timed_stage('verification', 'db_write'):
+        attendance_record = await AttendanceRecord.objects.acreate(**_face_record_values(
+            employee_obj, attendance_type, best_confidence,
+            data.get('latitude'), data.get('longitude'), data.get('address', '')
+        ))
+    return _json(_face_attendance_payload(employee_obj, attendance_type, best_confidence, elapsed_time, attendance_record))
+
+
+async def _verify_qr(data):
+    qr_data = data.get('qr_data', '').strip()
+    attendance_type = data.get('type', 'entrada').lower()
+
+    if not qr_data:
+        return _json({'success': False, 'message': 'Código QR requerido'}, status=400)
+
+    formatted_rut, error = _qr_rut(qr_data)
+    if error:
+        return _json({'success': False, 'message': error}, status=400)
+
+    employee = await asearch_employee_by_rut(formatted_rut)
+    if not employee:
+        return _json({
+            'success': False,
+            'message': f'Empleado con RUT {formatted_rut} no encontrado en el sistema'
+        }, status=404)
+
+    existing_record = await acheck_duplicate_attendance(employee, attendance_type, timezone.now())
+    if existing_record:
+        return _json(_qr_duplicate_payload(employee, attendance_type, existing_record), status=400)
+
+    attendance_record = await AttendanceRecord.objects.acreate(**_qr_record_values(
+        employee, attendance_type, formatted_rut, data.get('latitude'), data.get('longitude'), data.get('address', '')
+    ))
+    return _json(_qr_attendance_payload(employee, attendance_type, formatted_rut, qr_data, attendance_record))
+
+
+async def _find_employee(employee_id_or_rut, employee_name):
+    """(empleado, mensaje de error) con la misma prioridad que mark_attendance: RUT, ID interno y nombre"""
+    employee = None
+    if employee_id_or_rut and validate_chilean_rut(employee_id_or_rut):
+        employee = await asearch_employee_by_rut(employee_id_or_rut)
+
+    if not employee and employee_id_or_rut:
+        try:
+            employee = await Employee.objects.aget(employee_id=employee_id_or_rut, is_active=True)
+        except Employee.DoesNotExist:
+            pass
+
+    if not employee and employee_name:
+        try:
+            employee = await Employee.objects.aget(name__icontains=employee_name, is_active=True)
+        except Employee.DoesNotExist:
+            return None, 'No se encontró un empleado con el RUT o nombre proporcionado.'
+        except Employee.MultipleObjectsReturned:
+            return None, 'Múltiples empleados encontrados con ese nombre. Por favor, especifique el RUT.'
+
+    if not employee:
+        return None, 'No se encontró un empleado con el RUT o nombre proporcionado.'
+    return employee, None
+
+
+@async_api_view
+async def verify_attendance_face(request, data):
+    """verify_attendance_face para ASGI: el reconocimiento corre en el ejecutor"""
+    try:
+        return await _verify_face(data)
+    except Exception as e:
+        return _json({
+            'success': False,
+            'message': f'Error crítico: {str(e)}',
+            'error_type': 'SYSTEM_ERROR',
+            'system_mode': 'BALANCED'
+        }, status=500)
+
+
+@async_api_view
+async def verify_qr(request, data):
+    """verify_qr para ASGI"""
+    try:
+        return await _verify_qr(data)
+    except Exception as e:
+        return _json({
+            'success': False,
+            'message': f'Error verificando QR: {str(e)}',
+            'error_type': 'QR_VERIFICATION_ERROR'
+        }, status=500)
+
+
+@async_api_view
+async def mark_attendance(request, data):
+    """mark_attendance para ASGI: foto, QR o registro manual"""
+    if data.get('photo'):
+        return await verify_attendance_face(request)
+    if data.get('qr_data'):
+        return await verify_qr(request)
+
+    try:
+        employee, error = await _find_employee(
+            data.get('employee_id', '').strip(), data.get('employee_name', '').strip()
+        )
+        if error:
+            return _json({'success': False, 'message': error}, status=400)
+
+        attendance_type = data.get('type', 'entrada').lower()
+        offline_timestamp = data.get('offline_timestamp')
+        existing_record = await acheck_duplicate_attendance(
+            employee, attendance_type, offline_timestamp or timezone.now()
+        )
+        attendance_record = existing_record or await AttendanceRecord.objects.acreate(**_manual_record_values(
+            employee, attendance_type, data.get('latitude'), data.get('longitude'), data.get('address', ''),
+            data.get('notes', ''), data.get('is_offline_sync', False), offline_timestamp
+        ))
+        return _json(_manual_attendance_payload(employee, attendance_record))
+    except Exception as e:
+        return _json({'success': False, 'message': f'Error: {str(e)}'}, status=500)
@@ -0,0 +1,159 @@
+import time
+import tracemalloc
+
+import numpy as np
+
+from .face_gallery import ENCODING_SIZE, FaceGallery, GallerySnapshot
+
+# Escalas aproximadas de los encodings dlib: distancia entre personas ~0.9, misma persona ~0.35
+IDENTITY_SPREAD = 0.056
+PHOTO_NOISE = 0.02
+ADAPTATION_NOISE = 0.015
+LANDMARK_POINTS = 72
+
+
+def synthetic_face_data(rng, center, photos=5, adaptations_per_photo=3, landmark_shape=None):
+    """Datos de rostro de un empleado con la misma forma que produce el registro"""
+    encodings = center + rng.normal(0, PHOTO_NOISE, (photos, ENCODING_SIZE))
+    adaptations = np.repeat(encodings, adaptations_per_photo, axis=0)
+    adaptations = adaptations + rng.normal(0, ADAPTATION_NOISE, adaptations.shape)
+    if landmark_shape is None:
+        landmark_shape = rng.uniform(100, 400, LANDMARK_POINTS * 2)
+    landmarks = landmark_shape + rng.normal(0, 4, (photos, LANDMARK_POINTS * 2))
+    return {
+        'has_encodings': True,
+        'encodings': list(encodings),
+        'adaptations': list(adaptations),
+        'landmarks': list(landmarks),
+    }
+
+
+def synthetic_gallery(num_employees, seed=0, photos=5, adaptations_per_photo=3, chunk_size=10000):
+    """Galería sintética con identidades, fotos, adaptaciones y landmarks realistas
+
+    Se construye por bloques de chunk_size empleados para no mantener en memoria los datos
+    parseados de toda la galería (con 100k empleados serían varios GB en float64).
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, IDENTITY_SPREAD, (num_employees, ENCODING_SIZE))
+    landmark_shapes = rng.uniform(100, 400, (num_employees, LANDMARK_POINTS * 2))
+
+    snapshot = None
+    employees = []
+    parsed_faces = []
+    for index in range(num_employees):
+        employees.append({
+            'id': index,
+            'name': f'Empleado {index:06d}',
+            'employee_id': f'SYN{index:06d}',
+            'rut': '',
+            'department': 'Sintético',
+        })
+        parsed_faces.append(synthetic_face_data(
+            rng, centers[index], photos, adaptations_per_photo, landmark_shapes[index]
+        ))
+        if len(employees) == chunk_size or index == num_employees - 1:
+            chunk = GallerySnapshot(employees, parsed_faces)
+            snapshot = chunk if snapshot is None else GallerySnapshot.concat(snapshot, chunk)
+            employees = []
+            parsed_faces = []
+
+    if snapshot is None:
+        snapshot = GallerySnapshot([], [])
+    return snapshot, centers, landmark_shapes
+
+
+def stored_face_data(snapshot, index):
+    """Datos de un empleado de la galería en el formato JSON de face_encoding"""
+    def rows(prefix, matrix):
+        offsets = snapshot.offsets[prefix]
+        return matrix[offsets[index]:offsets[index + 1]].astype(np.float64)
+
+    landmark_lengths = snapshot.landmark_lengths[snapshot.offsets['landmark'][index]:]
+    return {
+        'encodings': [row.tolist() for row in rows('encoding', snapshot.encodings)],
+        'landmarks': [
+            row[:length].tolist()
+            for row, length in zip(rows('landmark', snapshot.landmarks), landmark_lengths)
+        ],
+        'environmental_adaptations': [[
+            {'encoding': row.tolist(), 'condition': 'synthetic'}
+            for row in rows('adaptation', snapshot.adaptations)
+        ]],
+    }
+
+
+class StaticGallery(FaceGallery):
+    """Galería con una instantánea fija, sin base de datos, para medir la etapa de matching"""
+
+    def __init__(self, snapshot):
+        super().__init__()
+        self._snapshot = snapshot
+
+    def get_snapshot(self):
+        return self._snapshot
+
+
+def snapshot_nbytes(snapshot):
+    """Bytes ocupados por las matrices de la galería"""
+    arrays = [value for value in vars(snapshot).values() if isinstance(value, np.ndarray)]
+    arrays.extend(snapshot.offsets.values())
+    return int(sum(array.nbytes for array in arrays))
+
+
+def synthetic_probes(centers, landmark_shapes, count, seed=1, impostor_ratio=0.1):
+    """Encodings de consulta: la mayoría de empleados conocidos y algunos impostores"""
+    rng = np.random.default_rng(seed)
+    owners = rng.integers(0, len(centers), count)
+    probes = centers[owners] + rng.normal(0, PHOTO_NOISE, (count, ENCODING_SIZE))
+    landmarks = landmark_shapes[owners] + rng.normal(0, 4, (count, LANDMARK_POINTS * 2))
+
+    impostors = rng.random(count) < impostor_ratio
+    probes[impostors] = rng.normal(0, IDENTITY_SPREAD, (impostors.sum(), ENCODING_SIZE))
+    owners = np.where(impostors, -1, owners)
+    return probes, landmarks, owners
+
+
+def best_match_index(scores):
+    """Índice del mejor match (mismo criterio que advanced_verify) o -1"""
+    confidence = np.where(scores['is_match'], scores['confidence'], 0.0)
+    if not confidence.size or confidence.max() <= 0:
+        return -1
+    return int(np.argmax(confidence))
+
+
+def latency_summary(latencies):
+    """Percentiles de latencia en milisegundos"""
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    if not values.size:
+        return {'count': 0}
+    return {
+        'count': int(values.size),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+        'max_ms': float(values.max()),
+    }
+
+
+def timed(function, *args, **kwargs):
+    """Ejecuta la función y retorna (resultado, segundos)"""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def traced_peak(function, *args, **kwargs):
+    """Ejecuta la función y retorna (resultado, pico de memoria asignada en bytes)"""
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        result = function(*args, **kwargs)
+        return result, tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
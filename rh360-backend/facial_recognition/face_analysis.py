@@ -0,0 +1,108 @@
+import time
+from contextlib import contextmanager
+
+import cv2
+import dlib
+import numpy as np
+from face_recognition import api as face_api
+
+# Puntos del modelo de 68 landmarks por rasgo, en el mismo orden que face_recognition.face_landmarks
+LANDMARK_FEATURES = {
+    'chin': list(range(0, 17)),
+    'left_eyebrow': list(range(17, 22)),
+    'right_eyebrow': list(range(22, 27)),
+    'nose_bridge': list(range(27, 31)),
+    'nose_tip': list(range(31, 36)),
+    'left_eye': list(range(36, 42)),
+    'right_eye': list(range(42, 48)),
+    'top_lip': list(range(48, 55)) + [64, 63, 62, 61, 60],
+    'bottom_lip': list(range(54, 60)) + [48, 60, 67, 66, 65, 64],
+}
+
+
+def _rectangle(face_location):
+    top, right, bottom, left = face_location
+    return dlib.rectangle(left, top, right, bottom)
+
+
+def shape_landmarks(shape):
+    """Landmarks por rasgo a partir de una forma de dlib, con el formato de face_recognition.face_landmarks"""
+    points = [(point.x, point.y) for point in shape.parts()]
+    return {feature: [points[i] for i in indices] for feature, indices in LANDMARK_FEATURES.items()}
+
+
+def encode_faces(image_array, face_locations, num_jitters=1):
+    """Encodings y landmarks de todos los rostros de una imagen; dlib codifica el lote en una sola llamada"""
+    shapes = dlib.full_object_detections()
+    for face_location in face_locations:
+        shapes.append(face_api.pose_predictor_68_point(image_array, _rectangle(face_location)))
+    if not len(shapes):
+        return [], []
+    descriptors = face_api.face_encoder.compute_face_descriptor(image_array, shapes, num_jitters)
+    return [np.array(descriptor) for descriptor in descriptors], [shape_landmarks(shape) for shape in shapes]
+
+
+class FaceAnalysis:
+    """Contexto de análisis de una foto: escala de grises, ubicación y forma de 68 puntos se calculan una vez"""
+
+    def __init__(self, image_array):
+        self.image_array = image_array
+        self.face_array = None
+        self.face_location = None
+        self._gray = None
+        self._shape = None
+        self._landmarks = None
+        self.timings = {}
+        self.passes = {'detector': 0, 'shape': 0, 'encoding': 0}
+
+    @contextmanager
+    def stage(self, name):
+        """Acumula el tiempo de la etapa en timings"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.perf_counter() - start)
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.image_array, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    def set_face(self, face_location, face_array):
+        """Fija el rostro detectado (top, right, bottom, left) y la imagen sobre la que se ubicó"""
+        self.face_location = face_location
+        self.face_array = face_array
+        self._shape = None
+        self._landmarks = None
+
+    @property
+    def shape(self):
+        """Forma de 68 puntos de dlib, compartida por landmarks, encoding y adaptaciones"""
+        if self._shape is None:
+            self.passes['shape'] += 1
+            self._shape = face_api.pose_predictor_68_point(self.face_array, _rectangle(self.face_location))
+        return self._shape
+
+    def landmarks(self):
+        """Landmarks por rasgo, con el formato de face_recognition.face_landmarks"""
+        if self._landmarks is None:
+            self._landmarks = shape_landmarks(self.shape)
+        return self._landmarks
+
+    def encode(self, num_jitters=1, image_array=None):
+        """Encoding de 128 dimensiones; image_array permite codificar una variante con la misma forma"""
+        self.passes['encoding'] += 1
+        image_array = self.face_array if image_array is None else image_array
+        return np.array(face_api.face_encoder.compute_face_descriptor(image_array, self.shape, num_jitters))
+
+    def report(self):
+        """Tiempos por etapa en milisegundos y número de pasadas de cada modelo"""
+        return {
+            'timings_ms': {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()},
+            'passes': dict(self.passes),
+        }
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Hash perceptual: DCT de la imagen en gris a 32x32, se conservan las 8x8 frecuencias más bajas
+PHASH_SIZE = 32
+PHASH_LOW_FREQUENCIES = 8
+
+
+def photo_fingerprint(data):
+    """(hash perceptual, digest) de la foto decodificada a 1/8 en escala de grises"""
+    gray = cv2.imdecode(
+        np.frombuffer(data, dtype=np.uint8),
+        cv2.IMREAD_REDUCED_GRAYSCALE_8 | cv2.IMREAD_IGNORE_ORIENTATION
+    )
+    if gray is None:
+        raise ValueError("No se pudo decodificar la foto")
+
+    digest = hashlib.blake2b(gray.tobytes(), digest_size=16)
+    digest.update(repr(gray.shape).encode())
+
+    small = cv2.resize(gray, (PHASH_SIZE, PHASH_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:PHASH_LOW_FREQUENCIES, :PHASH_LOW_FREQUENCIES].flatten()
+    # El coeficiente DC solo refleja el brillo medio; no entra en la mediana
+    bits = low > np.median(low[1:])
+    return np.packbits(bits).tobytes().hex(), digest.hexdigest()
+
+
+class VerificationCache:
+    """Caché LRU con vencimiento de encodings y resultados de verificación por foto
+
+    El encoding de la foto no depende de la galería y se conserva hasta que vence; el resultado
+    de la comparación solo vale para la generación de galería con la que se calculó.
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._counters = {
+            'hits': 0,
+            'probe_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+        }
+
+    def configure(self, max_entries, ttl):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._evict()
+
+    def get(self, key, generation):
+        """(probe, resultado) guardados; el resultado es None si la galería cambió desde entonces"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['stored_at'] > self.ttl:
+                del self._entries[key]
+                self._counters['expired'] += 1
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return None, None
+
+            self._entries.move_to_end(key)
+            if entry['generation'] != generation:
+                self._counters['probe_hits'] += 1
+                return entry['probe'], None
+            self._counters['hits'] += 1
+            return entry['probe'], entry['result']
+
+    def put(self, key, generation, probe, result):
+        with self._lock:
+            self._entries[key] = {
+                'probe': probe,
+                'result': result,
+                'generation': generation,
+                'stored_at': time.time(),
+            }
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['probe_hits'] + self._counters['misses']
+            return dict(
+                self._counters,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                hit_rate=round(self._counters['hits'] / lookups, 4) if lookups else None,
+            )
+
+
+verification_cache = VerificationCache()
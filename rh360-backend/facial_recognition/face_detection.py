@@ -0,0 +1,36 @@
+from PIL import Image
+
+
+def detection_proxy(image, max_side):
+    """Copia reducida para detectar rostros; retorna (proxy, escala_y, escala_x) respecto al original"""
+    if not max_side or max(image.size) <= max_side:
+        return image, 1.0, 1.0
+    ratio = max_side / max(image.size)
+    size = (max(int(round(image.width * ratio)), 1), max(int(round(image.height * ratio)), 1))
+    proxy = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return proxy, image.height / proxy.height, image.width / proxy.width
+
+
+def scale_face_location(face_location, scale_y, scale_x, shape):
+    """Lleva una ubicación (top, right, bottom, left) del proxy a coordenadas del original"""
+    top, right, bottom, left = face_location
+    height, width = shape[:2]
+    return (
+        max(int(round(top * scale_y)), 0),
+        min(int(round(right * scale_x)), width),
+        min(int(round(bottom * scale_y)), height),
+        max(int(round(left * scale_x)), 0),
+    )
+
+
+def box_iou(first, second):
+    """IoU entre dos ubicaciones (top, right, bottom, left)"""
+    top, right = max(first[0], second[0]), min(first[1], second[1])
+    bottom, left = min(first[2], second[2]), max(first[3], second[3])
+    intersection = max(bottom - top, 0) * max(right - left, 0)
+
+    def area(box):
+        return (box[1] - box[3]) * (box[2] - box[0])
+
+    union = area(first) + area(second) - intersection
+    return intersection / union if union else 0.0
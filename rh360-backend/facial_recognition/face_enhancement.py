@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import ImageEnhance
+
+logger = logging.getLogger(__name__)
+
+# Tablas gamma precalculadas (antes se recalculaban por cada imagen)
+GAMMA_TABLES = {
+    gamma: np.array([((i / 255.0) ** (1.0 / gamma)) * 255 for i in np.arange(0, 256)]).astype("uint8")
+    for gamma in (0.8, 1.3)
+}
+
+
+def _original(image, image_array):
+    return image_array
+
+
+def _clahe(image, image_array):
+    # CLAHE para contraste adaptativo
+    lab = cv2.cvtColor(image_array, cv2.COLOR_RGB2LAB)
+    clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
+    lab[:, :, 0] = clahe.apply(lab[:, :, 0])
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)
+
+
+def _gamma(gamma):
+    def apply(image, image_array):
+        return cv2.LUT(image_array, GAMMA_TABLES[gamma])
+    return apply
+
+
+def _brightness(image, image_array):
+    return np.array(ImageEnhance.Brightness(image).enhance(1.1))
+
+
+def _contrast(image, image_array):
+    return np.array(ImageEnhance.Contrast(image).enhance(1.15))
+
+
+# Variantes de mejora en su orden por defecto (el mismo de la lista original)
+ENHANCEMENT_VARIANTS = {
+    'original': _original,
+    'clahe': _clahe,
+    'gamma_0.8': _gamma(0.8),
+    'gamma_1.3': _gamma(1.3),
+    'brightness_1.1': _brightness,
+    'contrast_1.15': _contrast,
+}
+
+
+def enhanced_variants(image, order=None, deadline=None):
+    """Genera las variantes de la imagen una a una; solo se calcula la que se va a usar"""
+    image_array = np.array(image)
+    for name in order or ENHANCEMENT_VARIANTS:
+        if deadline is not None and time.time() >= deadline:
+            return
+        try:
+            variant = ENHANCEMENT_VARIANTS[name](image, image_array)
+        except Exception as e:
+            logger.error(f"Error generando variante {name}: {e}")
+            continue
+        yield name, variant
+
+
+def apply_variant(name, image):
+    """Calcula una sola variante sobre la imagen completa"""
+    return ENHANCEMENT_VARIANTS[name](image, np.array(image))
+
+
+class VariantHitRates:
+    """Tasa de detección por variante, usada para ordenar los intentos de detección"""
+
+    def __init__(self, names=None):
+        self._lock = threading.Lock()
+        self._names = list(names or ENHANCEMENT_VARIANTS)
+        self._attempts = dict.fromkeys(self._names, 0)
+        self._hits = dict.fromkeys(self._names, 0)
+
+    def _rate(self, name):
+        # Suavizado de Laplace: las variantes sin historial parten en 0.5
+        return (self._hits[name] + 1) / (self._attempts[name] + 2)
+
+    def order(self):
+        """Variantes de mayor a menor tasa de éxito; los empates conservan el orden por defecto"""
+        with self._lock:
+            return sorted(self._names, key=self._rate, reverse=True)
+
+    def record(self, attempts):
+        """Registra una lista de (variante, rostro_encontrado)"""
+        with self._lock:
+            for name, hit in attempts:
+                if name in self._attempts:
+                    self._attempts[name] += 1
+                    self._hits[name] += int(bool(hit))
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'attempts': self._attempts[name],
+                    'hits': self._hits[name],
+                    'hit_rate': round(self._hits[name] / self._attempts[name], 4) if self._attempts[name] else None,
+                }
+                for name in self._names
+            }
+
+
+variant_hit_rates = VariantHitRates()
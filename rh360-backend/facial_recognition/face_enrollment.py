@@ -0,0 +1,121 @@
+import io
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .face_images import photo_bytes
+from .face_metrics import timed_stage
+from .face_templates import encode_face_template
+from .models import Employee, FaceEnrollmentJob, FaceEnrollmentPhoto
+
+logger = logging.getLogger(__name__)
+
+# Trabajos 'running' más antiguos que esto se consideran de un worker caído y se reencolan
+STALE_JOB_TIMEOUT = timedelta(minutes=15)
+
+
+def create_enrollment_job(employee, photos):
+    """Guarda las fotos y deja el trabajo pendiente para el worker"""
+    images = [photo_bytes(photo) for photo in photos]
+    # Solo se lee la cabecera: así una foto corrupta se rechaza en la solicitud y no en el worker
+    for image in images:
+        try:
+            Image.open(io.BytesIO(image))
+        except Exception:
+            raise ValueError("Foto inválida")
+    with transaction.atomic():
+        job = FaceEnrollmentJob.objects.create(employee=employee)
+        FaceEnrollmentPhoto.objects.bulk_create([
+            FaceEnrollmentPhoto(job=job, index=index, image=image)
+            for index, image in enumerate(images)
+        ])
+    return job
+
+
+def claim_next_job():
+    """Toma el trabajo pendiente más antiguo; el UPDATE condicional evita que dos workers tomen el mismo"""
+    for job_id in FaceEnrollmentJob.objects.filter(status='pending').values_list('id', flat=True)[:10]:
+        claimed = FaceEnrollmentJob.objects.filter(id=job_id, status='pending').update(
+            status='running', started_at=timezone.now()
+        )
+        if claimed:
+            return FaceEnrollmentJob.objects.select_related('employee').get(id=job_id)
+    return None
+
+
+def requeue_stale_jobs(timeout=STALE_JOB_TIMEOUT):
+    """Vuelve a dejar pendientes los trabajos abandonados por un worker que se detuvo"""
+    return FaceEnrollmentJob.objects.filter(
+        status='running', started_at__lt=timezone.now() - timeout
+    ).update(status='pending', started_at=None)
+
+
+def _record_photo(job, idx, photo_result):
+    FaceEnrollmentPhoto.objects.filter(job=job, index=idx).update(
+        status='valid' if photo_result['encoding'] is not None else 'failed',
+        message='; '.join(photo_result['failed_reasons'])[:255],
+        quality=photo_result['quality'],
+    )
+
+
+def _finish(job, status, message, result=None):
+    values = {'status': status, 'message': message, 'finished_at': timezone.now()}
+    if result is not None:
+        values['valid_photos'] = result['valid_photos']
+        values['average_quality'] = float(result['average_quality'])
+    for field, value in values.items():
+        setattr(job, field, value)
+    # UPDATE y no save(): si el trabajo se eliminó junto con el empleado, save() lo volvería a crear
+    if not FaceEnrollmentJob.objects.filter(id=job.id).update(**values):
+        logger.warning(f"Registro facial {job.id} eliminado antes de terminar")
+        return
+    # Las fotos ya no se necesitan: no se guardan imágenes faciales más allá del registro
+    FaceEnrollmentPhoto.objects.filter(job=job).update(image=b'')
+
+
+def save_face_registration(employee, result):
+    """Persiste el resultado del registro en el empleado (plantilla binaria y métricas)"""
+    employee.face_template = encode_face_template({
+        'encodings': result['encodings'],
+        'landmarks': result['landmarks'],
+        'environmental_adaptations': result['environmental_adaptations'],
+    })
+    employee.face_encoding = None  # La plantilla binaria reemplaza al JSON antiguo
+    employee.face_quality_score = float(result['average_quality'])
+    employee.face_variations_count = (
+        len(result['encodings']) + sum(len(group) for group in result['environmental_adaptations'])
+    )
+    employee.face_registration_date = timezone.now()
+    employee.has_face_registered = True
+    with timed_stage('registration', 'db_write'):
+        employee.save()
+
+
+def run_enrollment_job(job, service):
+    """Procesa un trabajo ya tomado y guarda el avance por foto"""
+    photos = list(FaceEnrollmentPhoto.objects.filter(job=job).order_by('index').values_list('image', flat=True))
+    try:
+        result = service.process_advanced_registration(
+            [bytes(image) for image in photos],
+            on_photo=lambda idx, photo_result: _record_photo(job, idx, photo_result)
+        )
+
+        if not result['success']:
+            _finish(job, 'failed', result['error'], result)
+            return job
+
+        employee = Employee.objects.get(id=job.employee_id)
+        save_face_registration(employee, result)
+        _finish(job, 'completed', f'Rostro de {employee.name} registrado exitosamente', result)
+        logger.info(f"Registro facial completado para {employee.name} ({result['valid_photos']} fotos)")
+
+    except Employee.DoesNotExist:
+        logger.error(f"Empleado eliminado durante el registro facial {job.id}")
+        _finish(job, 'failed', 'Empleado eliminado durante el registro facial', result)
+    except Exception as e:
+        logger.error(f"Error procesando registro facial {job.id}: {e}")
+        _finish(job, 'failed', f'Error: {str(e)}')
+    return job
@@ -0,0 +1,690 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from .face_index import build_gallery_index
+from .face_templates import ENCODING_SIZE, encoding_centroid, read_face_data
+from .models import Employee, FaceGalleryChange
+
+logger = logging.getLogger(__name__)
+
+GALLERY_DTYPE = np.float32
+# Filas por bloque al pasar de float32 a float64, para acotar la memoria temporal
+GALLERY_CHUNK_ROWS = 8192
+
+# Resultado de la comparación por empleado
+STATUS_OK = 0
+STATUS_NO_DATA = 1
+STATUS_NO_SCORES = 2
+STATUS_INSUFFICIENT = 3
+
+# Sincronización entre procesos: sobre este número de cambios pendientes conviene recargar todo
+GALLERY_MAX_INCREMENTAL_CHANGES = 200
+# Pasado este tiempo desde la última recarga completa se recarga todo, aunque se sincronice seguido:
+# repara cualquier cambio perdido y ningún proceso lee cambios ya eliminados del registro
+# (ver FACE_GALLERY_CHANGE_RETENTION)
+GALLERY_RESYNC_SECONDS = 6 * 3600
+# Los ids de cambios de procesos distintos pueden confirmarse fuera de orden (N+1 visible antes
+# que N): cada sincronización vuelve a leer los cambios de esta ventana y omite los ya aplicados
+GALLERY_CHANGE_WINDOW = timedelta(minutes=5)
+# Antigüedad de los cambios que se eliminan del registro al recargar la galería completa
+FACE_GALLERY_CHANGE_RETENTION = timedelta(days=1)
+
+
+def _chunked_matvec(matrix, vector):
+    """Producto matriz-vector (o matriz-matriz) en float64 sobre una matriz float32, por bloques"""
+    result = np.empty((matrix.shape[0],) + np.shape(vector)[1:], dtype=np.float64)
+    for start in range(0, matrix.shape[0], GALLERY_CHUNK_ROWS):
+        block = np.asarray(matrix[start:start + GALLERY_CHUNK_ROWS], dtype=np.float64)
+        result[start:start + GALLERY_CHUNK_ROWS] = block @ vector
+    return result
+
+
+def _chunked_row_stats(matrix):
+    """Suma y suma de cuadrados por fila en float64"""
+    sums = np.empty(matrix.shape[0], dtype=np.float64)
+    sq_norms = np.empty(matrix.shape[0], dtype=np.float64)
+    for start in range(0, matrix.shape[0], GALLERY_CHUNK_ROWS):
+        block = np.asarray(matrix[start:start + GALLERY_CHUNK_ROWS], dtype=np.float64)
+        sums[start:start + GALLERY_CHUNK_ROWS] = block.sum(axis=1)
+        sq_norms[start:start + GALLERY_CHUNK_ROWS] = np.einsum('ij,ij->i', block, block)
+    return sums, sq_norms
+
+
+def _stack(vectors, width, dtype):
+    if not len(vectors):
+        return np.zeros((0, width), dtype=dtype)
+    return np.vstack(vectors).astype(dtype, copy=False)
+
+
+def _stack_padded(vectors, dtype):
+    width = max((len(v) for v in vectors), default=0)
+    matrix = np.zeros((len(vectors), width), dtype=dtype)
+    for row, vector in enumerate(vectors):
+        matrix[row, :len(vector)] = vector
+    return matrix
+
+
+def _pad_columns(matrix, width):
+    if matrix.shape[1] == width:
+        return matrix
+    padded = np.zeros((matrix.shape[0], width), dtype=matrix.dtype)
+    padded[:, :matrix.shape[1]] = matrix
+    return padded
+
+
+def _owner_array(counts):
+    return np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+
+
+def _owner_offsets(owner, size):
+    return np.concatenate(([0], np.cumsum(np.bincount(owner, minlength=size))))
+
+
+def _owner_rows(offsets, owner_indices):
+    """Filas de las matrices que pertenecen a los empleados indicados (dueños contiguos)"""
+    owner_indices = np.asarray(owner_indices, dtype=np.int64)
+    starts = offsets[owner_indices]
+    lengths = offsets[owner_indices + 1] - starts
+    # Cada fila de salida es su posición más el desplazamiento del segmento de su dueño
+    shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(int(lengths.sum()), dtype=np.int64) + shifts
+
+
+class GallerySnapshot:
+    """Matrices contiguas de toda la galería; inmutable una vez construida"""
+
+    def __init__(self, employees, parsed_faces, dtype=GALLERY_DTYPE):
+        self.employees = employees
+        self.size = len(employees)
+        self.has_encodings = np.array([face['has_encodings'] for face in parsed_faces], dtype=bool)
+
+        # Encodings principales (una fila por foto) y su empleado dueño
+        self.encodings = _stack([e for face in parsed_faces for e in face['encodings']], ENCODING_SIZE, dtype)
+        self.encoding_owner = _owner_array([len(face['encodings']) for face in parsed_faces])
+        self.encoding_sums, self.encoding_sq_norms = _chunked_row_stats(self.encodings)
+
+        # Adaptaciones ambientales
+        self.adaptations = _stack([a for face in parsed_faces for a in face['adaptations']], ENCODING_SIZE, dtype)
+        self.adaptation_owner = _owner_array([len(face['adaptations']) for face in parsed_faces])
+        _, self.adaptation_sq_norms = _chunked_row_stats(self.adaptations)
+
+        # Landmarks con relleno de ceros y largo real por fila
+        landmark_vectors = [lm for face in parsed_faces for lm in face['landmarks']]
+        self.landmarks = _stack_padded(landmark_vectors, dtype)
+        self.landmark_lengths = np.array([len(lm) for lm in landmark_vectors], dtype=np.int32)
+        self.landmark_owner = _owner_array([len(face['landmarks']) for face in parsed_faces])
+        _, self.landmark_sq_norms = _chunked_row_stats(self.landmarks)
+
+        # Centroide y radio por empleado para la pasada gruesa (radio -inf = sin encodings)
+        centroids = [face.get('centroid') for face in parsed_faces]
+        radii = [face.get('radius') for face in parsed_faces]
+        for index, face in enumerate(parsed_faces):
+            if centroids[index] is None and len(face['encodings']):
+                centroids[index], radii[index] = encoding_centroid(face['encodings'])
+        self.employee_centroids = _stack(
+            [c if c is not None else np.zeros(ENCODING_SIZE) for c in centroids], ENCODING_SIZE, dtype
+        )
+        self.employee_radii = np.array([r if r is not None else -np.inf for r in radii], dtype=np.float64)
+
+        self._finish()
+
+    def subset(self, owner_indices):
+        """Galería reducida a los empleados indicados, sin volver a parsear datos"""
+        owner_indices = np.asarray(owner_indices, dtype=np.int64)
+        remap = np.full(self.size, -1, dtype=np.int32)
+        remap[owner_indices] = np.arange(len(owner_indices), dtype=np.int32)
+
+        subset = object.__new__(GallerySnapshot)
+        subset.employees = [self.employees[i] for i in owner_indices]
+        subset.size = len(owner_indices)
+        subset.has_encodings = self.has_encodings[owner_indices]
+
+        rows = _owner_rows(self.offsets['encoding'], owner_indices)
+        subset.encodings = self.encodings[rows]
+        subset.encoding_owner = remap[self.encoding_owner[rows]]
+        subset.encoding_sums = self.encoding_sums[rows]
+        subset.encoding_sq_norms = self.encoding_sq_norms[rows]
+
+        rows = _owner_rows(self.offsets['adaptation'], owner_indices)
+        subset.adaptations = self.adaptations[rows]
+        subset.adaptation_owner = remap[self.adaptation_owner[rows]]
+        subset.adaptation_sq_norms = self.adaptation_sq_norms[rows]
+
+        rows = _owner_rows(self.offsets['landmark'], owner_indices)
+        subset.landmarks = self.landmarks[rows]
+        subset.landmark_lengths = self.landmark_lengths[rows]
+        subset.landmark_owner = remap[self.landmark_owner[rows]]
+        subset.landmark_sq_norms = self.landmark_sq_norms[rows]
+
+        subset.employee_centroids = self.employee_centroids[owner_indices]
+        subset.employee_radii = self.employee_radii[owner_indices]
+
+        subset._finish()
+        return subset
+
+    @classmethod
+    def concat(cls, first, second):
+        """Une dos galerías; los empleados de la segunda quedan a continuación de la primera"""
+        dtype = first.encodings.dtype
+        width = max(first.landmarks.shape[1], second.landmarks.shape[1])
+
+        combined = object.__new__(cls)
+        combined.employees = first.employees + second.employees
+        combined.size = first.size + second.size
+        combined.has_encodings = np.concatenate((first.has_encodings, second.has_encodings))
+
+        combined.encodings = np.concatenate((first.encodings, second.encodings.astype(dtype)))
+        combined.encoding_owner = np.concatenate((first.encoding_owner, second.encoding_owner + first.size))
+        combined.encoding_sums = np.concatenate((first.encoding_sums, second.encoding_sums))
+        combined.encoding_sq_norms = np.concatenate((first.encoding_sq_norms, second.encoding_sq_norms))
+
+        combined.adaptations = np.concatenate((first.adaptations, second.adaptations.astype(dtype)))
+        combined.adaptation_owner = np.concatenate((first.adaptation_owner, second.adaptation_owner + first.size))
+        combined.adaptation_sq_norms = np.concatenate((first.adaptation_sq_norms, second.adaptation_sq_norms))
+
+        combined.landmarks = np.concatenate((
+            _pad_columns(first.landmarks, width),
+            _pad_columns(second.landmarks, width).astype(dtype),
+        ))
+        combined.landmark_lengths = np.concatenate((first.landmark_lengths, second.landmark_lengths))
+        combined.landmark_owner = np.concatenate((first.landmark_owner, second.landmark_owner + first.size))
+        combined.landmark_sq_norms = np.concatenate((first.landmark_sq_norms, second.landmark_sq_norms))
+
+        combined.employee_centroids = np.concatenate((first.employee_centroids, second.employee_centroids.astype(dtype)))
+        combined.employee_radii = np.concatenate((first.employee_radii, second.employee_radii))
+
+        combined._finish()
+        return combined
+
+    def replace(self, employee_ids, replacement):
+        """Nueva galería sin los empleados indicados y con los de `replacement` agregados al final"""
+        employee_ids = set(employee_ids)
+        keep = [index for index, employee in enumerate(self.employees) if employee['id'] not in employee_ids]
+        updated = GallerySnapshot.concat(self.subset(keep), replacement)
+        # Se reutilizan los centroides IVF ya entrenados
+        updated._centroids = self._index.centroids if self._index is not None else self._centroids
+        if self._index is not None:
+            # El índice se actualiza aquí y no en el próximo match(): solo se asignan los encodings
+            # del reemplazo, en vez de reasignar toda la galería dentro de una verificación
+            remap = np.full(self.size, -1, dtype=np.int64)
+            remap[keep] = np.arange(len(keep))
+            updated._index = self._index.replace_owners(
+                remap, replacement.encodings, replacement.encoding_owner + len(keep)
+            )
+        return updated
+
+    def _finish(self):
+        self.offsets = {
+            prefix: _owner_offsets(getattr(self, f'{prefix}_owner'), self.size)
+            for prefix in ('encoding', 'adaptation', 'landmark')
+        }
+        _, self.centroid_sq_norms = _chunked_row_stats(self.employee_centroids)
+        self._index = None
+        self._index_lock = threading.Lock()
+        self._centroids = None
+
+    def get_index(self, config):
+        """Índice IVF de la galería, construido bajo demanda una sola vez"""
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = build_gallery_index(self, config, centroids=self._centroids)
+        return self._index
+
+    @classmethod
+    def from_employees(cls, employees):
+        """Construye la galería a partir de las plantillas faciales de los empleados"""
+        metas = []
+        parsed_faces = []
+        for employee in employees:
+            try:
+                parsed = read_face_data(employee)
+                if parsed is None:
+                    continue
+            except Exception as e:
+                logger.error(f"Error cargando rostro de {employee.name} en la galería: {e}")
+                continue
+            metas.append({
+                'id': employee.id,
+                'name': employee.name,
+                'employee_id': employee.employee_id,
+                'rut': employee.rut,
+                'department': employee.department,
+            })
+            parsed_faces.append(parsed)
+        return cls(metas, parsed_faces)
+
+    def coarse_candidates(self, current_encoding, config):
+        """Empleados cuyo centroide permite algún encoding dentro de max_tolerance, más los N más cercanos
+
+        Por desigualdad triangular, si |probe - centroide| - radio > max_tolerance ningún encoding
+        principal del empleado es aceptable y la comparación completa lo rechazaría igual.
+        """
+        return self.coarse_candidates_batch(np.asarray(current_encoding)[np.newaxis], config)[0]
+
+    def coarse_candidates_batch(self, current_encodings, config):
+        """coarse_candidates para varios rostros con una sola multiplicación de matrices"""
+        probes = np.asarray(current_encodings, dtype=np.float64)
+        dots = _chunked_matvec(self.employee_centroids, probes.T).T
+        probe_sq = np.einsum('ij,ij->i', probes, probes)
+        distances = np.sqrt(np.maximum(self.centroid_sq_norms - 2 * dots + probe_sq[:, np.newaxis], 0.0))
+        distances = np.where(np.isfinite(self.employee_radii), distances, np.inf)
+
+        bound = config['max_tolerance'] + config['coarse_margin']
+        within = distances - self.employee_radii <= bound
+        top_n = min(config['coarse_top_n'], self.size)
+
+        candidates = []
+        for row in range(len(probes)):
+            selected = np.nonzero(within[row])[0]
+            if top_n > 0:
+                nearest = np.argpartition(distances[row], top_n - 1)[:top_n]
+                selected = np.union1d(selected, nearest[np.isfinite(distances[row, nearest])])
+            candidates.append(selected.astype(np.int64))
+        return candidates
+
+    def probe_products(self, current_encodings, current_landmarks):
+        """Productos punto de varios rostros contra la galería, una multiplicación por cada matriz
+
+        Devuelve, por rostro, los argumentos `products` de score().
+        """
+        probes = np.asarray(current_encodings, dtype=np.float64).T
+        width = self.landmarks.shape[1]
+        landmark_probes = np.zeros((width, probes.shape[1]), dtype=np.float64)
+        for column, landmarks in enumerate(current_landmarks):
+            if landmarks is not None:
+                current = np.asarray(landmarks, dtype=np.float64).flatten()[:width]
+                landmark_probes[:len(current), column] = current
+
+        dots = _chunked_matvec(self.encodings, probes)
+        adapt_dots = _chunked_matvec(self.adaptations, probes)
+        landmark_dots = _chunked_matvec(self.landmarks, landmark_probes)
+        return [
+            {'dots': dots[:, column], 'adapt_dots': adapt_dots[:, column], 'landmark_dots': landmark_dots[:, column]}
+            for column in range(probes.shape[1])
+        ]
+
+    def _landmark_similarities(self, current_landmarks, dots=None):
+        """Similitud coseno de landmarks truncada al largo común, por fila"""
+        current = np.asarray(current_landmarks, dtype=np.float64).flatten()
+        width = self.landmarks.shape[1]
+        if dots is None:
+            current_padded = np.zeros(width, dtype=np.float64)
+            current_padded[:min(len(current), width)] = current[:width]
+            dots = _chunked_matvec(self.landmarks, current_padded)
+
+        min_len = np.minimum(self.landmark_lengths, len(current))
+
+        stored_sq = self.landmark_sq_norms.copy()
+        longer = np.nonzero(self.landmark_lengths > len(current))[0]
+        if longer.size:
+            truncated = np.asarray(self.landmarks[longer, :len(current)], dtype=np.float64)
+            stored_sq[longer] = np.einsum('ij,ij->i', truncated, truncated)
+
+        current_prefix = np.concatenate(([0.0], np.cumsum(current * current)))
+        current_sq = current_prefix[min_len]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = 1 - np.clip(1.0 - dots / np.sqrt(stored_sq * current_sq), 0.0, 2.0)
+
+        valid = (min_len > 60) & ~np.isnan(similarity) & (similarity >= 0.5)
+        return similarity, valid
+
+    def score(self, current_encoding, current_landmarks, config, products=None):
+        """Puntúa toda la galería en una pasada; mismas reglas que advanced_face_comparison
+
+        products: productos punto ya calculados por probe_products() (varios rostros a la vez).
+        """
+        n = self.size
+        probe = np.asarray(current_encoding, dtype=np.float64)
+        probe_sq = float(probe @ probe)
+        probe_sum = float(probe.sum())
+
+        max_euclidean = config['max_euclidean_distance']
+        base_tolerance = config['base_tolerance']
+        max_tolerance = config['max_tolerance']
+
+        # --- Métricas por encoding ---
+        dots = products['dots'] if products is not None else _chunked_matvec(self.encodings, probe)
+        distances = np.sqrt(np.maximum(self.encoding_sq_norms - 2 * dots + probe_sq, 0.0))
+
+        euclidean_scores = np.maximum(0, 1 - (distances / max_euclidean))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cosine_sim = 1 - np.clip(1.0 - dots / np.sqrt(self.encoding_sq_norms * probe_sq), 0.0, 2.0)
+            covariance = dots - self.encoding_sums * probe_sum / ENCODING_SIZE
+            stored_var = self.encoding_sq_norms - self.encoding_sums ** 2 / ENCODING_SIZE
+            probe_var = probe_sq - probe_sum ** 2 / ENCODING_SIZE
+            correlation = np.clip(covariance / (np.sqrt(stored_var) * np.sqrt(probe_var)), -1, 1)
+        cosine_sim = np.maximum(0, np.where(np.isnan(cosine_sim), 0.5, cosine_sim))
+        correlation = np.maximum(0, np.where(np.isnan(correlation), 0.5, correlation))
+
+        combined = euclidean_scores * 0.5 + cosine_sim * 0.3 + correlation * 0.2
+        bonus = (
+            np.where(distances <= 0.35, 0.02, 0) +
+            np.where((distances <= base_tolerance) & (cosine_sim >= 0.75), 0.015, 0) +
+            np.where(distances <= 0.30, 0.03, 0)
+        )
+        template_scores = np.minimum(combined + bonus, 1.0)
+
+        owner = self.encoding_owner
+        excellent = np.bincount(owner, weights=distances <= 0.35, minlength=n)
+        high_quality = np.bincount(owner, weights=distances <= base_tolerance, minlength=n)
+        acceptable = np.bincount(owner, weights=distances <= max_tolerance, minlength=n)
+        template_count = np.bincount(owner, minlength=n)
+
+        # --- Adaptaciones ambientales ---
+        adapt_dots = products['adapt_dots'] if products is not None else _chunked_matvec(self.adaptations, probe)
+        adapt_distances = np.sqrt(np.maximum(self.adaptation_sq_norms - 2 * adapt_dots + probe_sq, 0.0))
+        adapt_scores = np.maximum(0, 1 - (adapt_distances / max_tolerance))
+        adapt_valid = (adapt_distances <= max_tolerance) & (adapt_scores >= 0.6)
+
+        # --- Promedio de los 3 mejores puntajes por empleado ---
+        all_scores = np.concatenate((template_scores, adapt_scores[adapt_valid]))
+        all_owner = np.concatenate((owner, self.adaptation_owner[adapt_valid]))
+        order = np.lexsort((-all_scores, all_owner))
+        sorted_owner = all_owner[order]
+        sorted_scores = all_scores[order]
+        group_start = np.searchsorted(sorted_owner, np.arange(n))
+        rank = np.arange(len(sorted_owner)) - group_start[sorted_owner]
+        top = rank < 3
+        top_sum = np.bincount(sorted_owner[top], weights=sorted_scores[top], minlength=n)
+        top_count = np.bincount(sorted_owner[top], minlength=n)
+        score_count = np.bincount(all_owner, minlength=n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base_confidence = np.where(top_count > 0, top_sum / top_count, 0.0)
+
+        # --- Penalización por inconsistencia entre fotos ---
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_distance = np.bincount(owner, weights=distances, minlength=n) / template_count
+            deviation = (distances - mean_distance[owner]) ** 2
+            distance_std = np.sqrt(np.bincount(owner, weights=deviation, minlength=n) / template_count)
+        distance_penalty = np.where(
+            (template_count > 1) & (distance_std > config['consistency_threshold']),
+            np.minimum(distance_std * 0.1, 0.05),
+            0
+        )
+
+        # --- Bonificación por landmarks ---
+        landmark_bonus = np.zeros(n)
+        if current_landmarks is not None and config['use_landmarks'] and len(self.landmark_owner):
+            similarity, valid = self._landmark_similarities(
+                current_landmarks, products['landmark_dots'] if products is not None else None
+            )
+            lm_owner = self.landmark_owner[valid]
+            lm_count = np.bincount(lm_owner, minlength=n)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                landmark_score = np.bincount(lm_owner, weights=similarity[valid], minlength=n) / lm_count
+            landmark_bonus = np.where(
+                (lm_count > 0) & (landmark_score >= config['min_landmark_similarity']),
+                np.minimum(landmark_score * 0.03, 0.03),
+                0
+            )
+
+        quality_bonus = 0.02 * excellent + 0.01 * high_quality
+
+        final_confidence = np.minimum(
+            base_confidence + landmark_bonus + quality_bonus - distance_penalty,
+            1.0
+        )
+        final_confidence = np.maximum(0.0, final_confidence)
+
+        # Motivo de rechazo, en el mismo orden de evaluación que la comparación original
+        status = np.select(
+            [~self.has_encodings, score_count == 0, acceptable < config['min_matches']],
+            [STATUS_NO_DATA, STATUS_NO_SCORES, STATUS_INSUFFICIENT],
+            default=STATUS_OK
+        )
+        rejected = status != STATUS_OK
+        final_confidence = np.where(rejected, 0.0, final_confidence)
+        is_match = ~rejected & (final_confidence >= config['min_confidence'])
+
+        return {
+            # Métricas por encoding almacenado, en el orden de las matrices
+            'templates': {
+                'owner': owner,
+                'distances': distances,
+                'euclidean_scores': euclidean_scores,
+                'cosine': cosine_sim,
+                'correlation': correlation,
+                'bonus': bonus,
+                'scores': template_scores,
+                'categories': np.select(
+                    [distances <= 0.35, distances <= base_tolerance],
+                    ['excellent', 'high'],
+                    default='acceptable'
+                ),
+                'adaptation_owner': self.adaptation_owner,
+                'adaptation_distances': adapt_distances,
+                'adaptation_scores': np.where(adapt_valid, adapt_scores, np.nan),
+            },
+            # Agregados por empleado
+            'base_confidence': base_confidence,
+            'landmark_bonus': landmark_bonus,
+            'quality_bonus': quality_bonus,
+            'distance_penalty': distance_penalty,
+            'is_match': is_match,
+            'confidence': final_confidence,
+            'excellent_matches': excellent.astype(int),
+            'high_quality_matches': high_quality.astype(int),
+            'acceptable_matches': acceptable.astype(int),
+            'total_scores': score_count,
+            'status': status,
+        }
+
+    def describe(self, scores, index):
+        """Texto de detalle equivalente al de advanced_face_comparison"""
+        status = scores['status'][index]
+        acceptable_matches = scores['acceptable_matches'][index]
+        if status == STATUS_NO_DATA:
+            return "Sin datos de rostro registrados"
+        if status == STATUS_NO_SCORES:
+            return "No se encontraron coincidencias válidas"
+        if status == STATUS_INSUFFICIENT:
+            return f"Insuficientes matches aceptables: {acceptable_matches}"
+        return (f"Confianza: {scores['confidence'][index]:.1%}, "
+                f"Matches aceptables: {acceptable_matches}, "
+                f"Alta calidad: {scores['high_quality_matches'][index]}, "
+                f"Excelentes: {scores['excellent_matches'][index]}, "
+                f"Total: {scores['total_scores'][index]}")
+
+
+def gallery_queryset():
+    """Empleados que forman parte de la galería, solo con los campos necesarios"""
+    return Employee.objects.filter(
+        is_active=True,
+        has_face_registered=True
+    ).only('id', 'name', 'employee_id', 'rut', 'department', 'face_template')
+
+
+def prune_gallery_changes():
+    """Elimina los cambios más antiguos que FACE_GALLERY_CHANGE_RETENTION
+
+    Se hace en cada recarga completa y no en cada guardado: ningún proceso lee cambios más
+    antiguos que GALLERY_RESYNC_SECONDS, porque pasado ese tiempo recarga todo.
+    """
+    FaceGalleryChange.objects.filter(created_at__lt=timezone.now() - FACE_GALLERY_CHANGE_RETENTION).delete()
+
+
+class FaceGallery:
+    """Galería de rostros compartida por el proceso, sincronizada por número de generación"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._generation = 0
+        self._loaded_at = 0.0
+        # Cambios de la ventana reciente ya aplicados: id -> created_at
+        self._applied_changes = {}
+
+    def load(self):
+        """Reconstruye la galería completa desde la base de datos"""
+        # La generación se lee antes que los empleados: un cambio concurrente se vuelve a aplicar.
+        # Los cambios recientes ya visibles quedan aplicados; uno anterior aún sin confirmar no
+        generation = FaceGalleryChange.current_generation()
+        applied_changes = dict(
+            FaceGalleryChange.objects.filter(
+                id__lte=generation, created_at__gte=timezone.now() - GALLERY_CHANGE_WINDOW
+            ).values_list('id', 'created_at')
+        )
+        snapshot = GallerySnapshot.from_employees(gallery_queryset().iterator())
+        with self._lock:
+            self._snapshot = snapshot
+            self._generation = generation
+            self._applied_changes = applied_changes
+            self._loaded_at = time.time()
+        logger.info(f"Galería facial cargada: {snapshot.size} empleados, "
+                    f"{len(snapshot.encodings)} encodings (generación {generation})")
+        prune_gallery_changes()
+        return snapshot
+
+    def invalidate(self):
+        """Descarta la galería actual; se recarga en la próxima verificación"""
+        with self._lock:
+            self._snapshot = None
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def apply_local_change(self, employee_uuid, employee=None):
+        """Actualiza solo este empleado en la galería del proceso actual (upsert, o remove si es None)"""
+        replacement = self._replacement_for([employee] if employee is not None else [])
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot = self._snapshot.replace([employee_uuid], replacement)
+
+    def sync(self):
+        """Aplica los cambios registrados por otros procesos desde la última generación
+
+        Además de los ids posteriores a la generación se releen los cambios de GALLERY_CHANGE_WINDOW,
+        para aplicar los que se confirmaron después de uno con id mayor.
+        """
+        if self._snapshot is None or time.time() - self._loaded_at > GALLERY_RESYNC_SECONDS:
+            return self.load()
+
+        cutoff = timezone.now() - GALLERY_CHANGE_WINDOW
+        applied_changes = {
+            change_id: created_at for change_id, created_at in self._applied_changes.items()
+            if created_at >= cutoff
+        }
+        changes = [
+            change for change in
+            FaceGalleryChange.objects.filter(Q(id__gt=self._generation) | Q(created_at__gte=cutoff))
+            .order_by('id')
+            .values_list('id', 'employee_uuid', 'created_at')[
+                :GALLERY_MAX_INCREMENTAL_CHANGES + len(applied_changes) + 1
+            ]
+            if change[0] not in applied_changes
+        ]
+        if len(changes) > GALLERY_MAX_INCREMENTAL_CHANGES:
+            return self.load()
+
+        if changes:
+            changed_ids = {employee_uuid for _, employee_uuid, _ in changes}
+            employees = list(gallery_queryset().filter(id__in=changed_ids))
+            replacement = self._replacement_for(employees)
+            with self._lock:
+                if self._snapshot is not None:
+                    # Aplicar de nuevo un cambio es inocuo: se usa el estado actual del empleado
+                    self._snapshot = self._snapshot.replace(changed_ids, replacement)
+                    self._generation = max(self._generation, changes[-1][0])
+                    applied_changes.update((change_id, created_at) for change_id, _, created_at in changes)
+        with self._lock:
+            self._applied_changes = applied_changes
+        return self._snapshot
+
+    def _replacement_for(self, employees):
+        active = [
+            employee for employee in employees
+            if employee.is_active and employee.has_face_registered
+        ]
+        return GallerySnapshot.from_employees(active)
+
+    def get_snapshot(self):
+        snapshot = self.sync()
+        if snapshot is None:
+            snapshot = self.load()
+        return snapshot
+
+    def match(self, current_encoding, current_landmarks, config):
+        """Compara el rostro actual contra la galería en una sola pasada
+
+        Solo devuelve a los empleados que recibieron la comparación completa: con el índice IVF o
+        la pasada gruesa activos son los candidatos, no toda la galería. Los que descarta la pasada
+        gruesa no podían ser match; los del índice IVF se descartan en forma aproximada.
+        """
+        snapshot = self.get_snapshot()
+        if snapshot.size == 0:
+            return []
+
+        # Con galerías grandes, solo los candidatos del índice IVF reciben la comparación completa
+        if config['ann_enabled'] and snapshot.size >= config['ann_min_gallery_size']:
+            candidates = snapshot.get_index(config).search(
+                current_encoding, config['ann_nprobe'], config['ann_top_k']
+            )
+            snapshot = snapshot.subset(np.sort(candidates))
+
+        # Pasada gruesa contra un centroide por empleado; la exacta solo sobre los candidatos.
+        # Solo es equivalente a la búsqueda completa si un match exige al menos un encoding aceptable
+        if (config['coarse_enabled'] and config['min_matches'] >= 1
+                and snapshot.size > config['coarse_top_n']):
+            snapshot = snapshot.subset(snapshot.coarse_candidates(current_encoding, config))
+            if snapshot.size == 0:
+                return []
+
+        scores = snapshot.score(current_encoding, current_landmarks, config)
+
+        return [
+            {
+                'employee': employee,
+                'confidence': float(scores['confidence'][index]),
+                'match': bool(scores['is_match'][index]),
+                'details': snapshot.describe(scores, index),
+            }
+            for index, employee in enumerate(snapshot.employees)
+        ]
+
+    def match_batch(self, current_encodings, current_landmarks, config):
+        """Mejor match de cada rostro (o None); la pasada gruesa de todos los rostros es una sola operación
+
+        Sin pasada gruesa cada rostro se compara con toda la galería y los productos punto de todos
+        salen de una sola multiplicación de matrices. Con ella cada rostro tiene sus propios
+        candidatos, pocos: unirlos para una sola multiplicación costaba más de lo que ahorraba.
+        """
+        snapshot = self.get_snapshot()
+        if snapshot.size == 0 or not len(current_encodings):
+            return [None] * len(current_encodings)
+
+        if config['coarse_enabled'] and config['min_matches'] >= 1:
+            candidate_sets = snapshot.coarse_candidates_batch(current_encodings, config)
+            products = [None] * len(current_encodings)
+        else:
+            candidate_sets = [None] * len(current_encodings)
+            products = snapshot.probe_products(current_encodings, current_landmarks)
+
+        results = []
+        for encoding, landmarks, candidates, face_products in zip(
+                current_encodings, current_landmarks, candidate_sets, products):
+            face_snapshot = snapshot if candidates is None else snapshot.subset(candidates)
+            scores = face_snapshot.score(encoding, landmarks, config, face_products)
+            confidence = np.where(scores['is_match'], scores['confidence'], 0.0)
+            if not confidence.size or confidence.max() <= 0:
+                results.append(None)
+                continue
+            index = int(np.argmax(confidence))
+            results.append({
+                'employee': face_snapshot.employees[index],
+                'confidence': float(confidence[index]),
+                'details': face_snapshot.describe(scores, index),
+            })
+        return results
+
+
+face_gallery = FaceGallery()
@@ -0,0 +1,79 @@
+import base64
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Límite de píxeles antes de decodificar (fotos de 48-50 MP aún pasan)
+MAX_IMAGE_PIXELS = 50_000_000
+
+# Escalas de decodificación reducida de OpenCV (DCT en JPEG, remuestreo en otros formatos)
+REDUCED_READ_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR,
+}
+
+
+def photo_bytes(photo):
+    """Bytes de la foto a partir de base64 (con o sin prefijo data URL), bytes o un archivo subido"""
+    if hasattr(photo, 'read'):
+        return photo.read()
+    if isinstance(photo, (bytes, bytearray, memoryview)):
+        return bytes(photo)
+    if ',' in photo:
+        photo = photo.split(',')[1]
+    return base64.b64decode(photo)
+
+
+def target_size(size, max_side):
+    """Tamaño final conservando la proporción, con el lado mayor acotado a max_side"""
+    width, height = size
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    ratio = max_side / max(width, height)
+    return max(int(round(width * ratio)), 1), max(int(round(height * ratio)), 1)
+
+
+def reduction_factor(size, final_size):
+    """Mayor factor 1/2, 1/4 o 1/8 que no baja del tamaño final"""
+    for factor in (8, 4, 2):
+        if size[0] // factor >= final_size[0] and size[1] // factor >= final_size[1]:
+            return factor
+    return 1
+
+
+def _decode_with_pil(data, size):
+    # Formatos que OpenCV no lee: draft() solo aplica a JPEG, el resto se decodifica completo
+    image = Image.open(io.BytesIO(data))
+    image.draft('RGB', size)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    return image
+
+
+def decode_photo(photo, max_side, max_pixels=MAX_IMAGE_PIXELS):
+    """Decodifica una foto directamente al tamaño de trabajo en RGB"""
+    data = photo_bytes(photo)
+
+    # Image.open solo lee la cabecera: se rechaza antes de decodificar los píxeles
+    header = Image.open(io.BytesIO(data))
+    if header.width * header.height > max_pixels:
+        raise ValueError(
+            f"Imagen demasiado grande: {header.width}x{header.height} supera {max_pixels:,} píxeles"
+        )
+    size = target_size(header.size, max_side)
+
+    # Se ignora la orientación EXIF, igual que al decodificar con PIL
+    flags = REDUCED_READ_FLAGS[reduction_factor(header.size, size)] | cv2.IMREAD_IGNORE_ORIENTATION
+    array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if array is None:
+        return _decode_with_pil(data, size)
+
+    if (array.shape[1], array.shape[0]) != size:
+        array = cv2.resize(array, size, interpolation=cv2.INTER_AREA)
+    return Image.fromarray(cv2.cvtColor(array, cv2.COLOR_BGR2RGB, dst=array))
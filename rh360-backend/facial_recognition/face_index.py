@@ -0,0 +1,159 @@
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_DTYPE = np.float32
+# Filas por bloque al asignar vectores a centroides
+ASSIGN_CHUNK_ROWS = 16384
+
+
+def default_nlist(num_vectors):
+    """Número de listas IVF recomendado (~4·√N, acotado)"""
+    return int(min(max(4 * np.sqrt(max(num_vectors, 1)), 16), 4096))
+
+
+def _squared_distances(vectors, centroids, centroid_sq_norms):
+    vector_sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+    return vector_sq_norms[:, None] - 2 * (vectors @ centroids.T) + centroid_sq_norms[None, :]
+
+
+class IVFIndex:
+    """Índice IVF (k-means + listas invertidas) sobre los encodings de la galería"""
+
+    def __init__(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=INDEX_DTYPE)
+        self.centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.list_offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        self.vectors = np.zeros((0, self.centroids.shape[1]), dtype=INDEX_DTYPE)
+        self.owner = np.zeros(0, dtype=np.int32)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, vectors, nlist=None, iterations=10, sample_size=100000, seed=0):
+        """Entrena los centroides con k-means sobre una muestra de los vectores"""
+        vectors = np.asarray(vectors, dtype=INDEX_DTYPE)
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = cls(centroids).assign(vectors)
+            counts = np.bincount(assignments, minlength=nlist)
+            order = np.argsort(assignments, kind='stable')
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros(centroids.shape, dtype=np.float64)
+            non_empty = counts > 0
+            sums[non_empty] = np.add.reduceat(vectors[order].astype(np.float64), starts[non_empty])
+
+            # Las listas vacías se reinician con vectores al azar
+            empty = counts == 0
+            centroids = np.where(
+                empty[:, None],
+                vectors[rng.choice(len(vectors), nlist)],
+                sums / np.maximum(counts, 1)[:, None]
+            ).astype(INDEX_DTYPE)
+
+        return cls(centroids)
+
+    def assign(self, vectors):
+        """Lista IVF más cercana para cada vector"""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+            block = np.asarray(vectors[start:start + ASSIGN_CHUNK_ROWS], dtype=INDEX_DTYPE)
+            distances = _squared_distances(block, self.centroids, self.centroid_sq_norms)
+            assignments[start:start + ASSIGN_CHUNK_ROWS] = np.argmin(distances, axis=1)
+        return assignments
+
+    def add(self, vectors, owner):
+        """Llena las listas invertidas con los vectores de la galería y su empleado dueño"""
+        vectors = np.asarray(vectors, dtype=INDEX_DTYPE)
+        return self._fill(vectors, owner, self.assign(vectors))
+
+    def replace_owners(self, remap, vectors, owner):
+        """Nuevo índice con los mismos centroides: sin los dueños con remap -1, el resto renumerado
+        según remap y los vectores nuevos asignados a sus listas; no reasigna los vectores que siguen
+        """
+        vectors = np.asarray(vectors, dtype=INDEX_DTYPE)
+        lists = np.repeat(np.arange(self.nlist), np.diff(self.list_offsets))
+        kept_owner = np.asarray(remap)[self.owner]
+        keep = kept_owner >= 0
+        return type(self)(self.centroids)._fill(
+            np.concatenate((self.vectors[keep], vectors)),
+            np.concatenate((kept_owner[keep], np.asarray(owner))).astype(self.owner.dtype),
+            np.concatenate((lists[keep], self.assign(vectors)))
+        )
+
+    def _fill(self, vectors, owner, assignments):
+        order = np.argsort(assignments, kind='stable')
+        self.list_offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(assignments, minlength=self.nlist)))
+        )
+        # Copia ordenada por lista para que cada lista sea contigua en memoria
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.owner = np.asarray(owner)[order]
+        return self
+
+    def search(self, probe, nprobe, top_k):
+        """Empleados candidatos (índices de dueño) ordenados por distancia mínima"""
+        probe = np.asarray(probe, dtype=INDEX_DTYPE).reshape(1, -1)
+        centroid_distances = _squared_distances(probe, self.centroids, self.centroid_sq_norms)[0]
+        nprobe = min(nprobe, self.nlist)
+        lists = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+
+        segments = [np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists]
+        positions = np.concatenate(segments) if segments else np.zeros(0, dtype=np.int64)
+        if positions.size == 0:
+            return np.zeros(0, dtype=np.int32)
+
+        candidates = self.vectors[positions]
+        diff_sq = _squared_distances(candidates, probe, np.einsum('ij,ij->i', probe, probe))[:, 0]
+        owners = self.owner[positions]
+
+        # Distancia mínima por empleado y luego los top_k más cercanos
+        order = np.lexsort((diff_sq, owners))
+        owners_sorted = owners[order]
+        first = np.concatenate(([True], owners_sorted[1:] != owners_sorted[:-1]))
+        unique_owners = owners_sorted[first]
+        best_distances = diff_sq[order][first]
+
+        if len(unique_owners) > top_k:
+            keep = np.argpartition(best_distances, top_k - 1)[:top_k]
+            unique_owners = unique_owners[keep]
+            best_distances = best_distances[keep]
+        return unique_owners[np.argsort(best_distances)]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, centroids=self.centroids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'])
+
+
+def build_gallery_index(snapshot, config, centroids=None):
+    """Construye el índice IVF para una galería, reutilizando centroides ya entrenados si existen"""
+    index_path = config['ann_index_path']
+    index = IVFIndex(centroids) if centroids is not None else None
+    if index is None and os.path.exists(index_path):
+        try:
+            index = IVFIndex.load(index_path)
+        except Exception as e:
+            logger.error(f"Error cargando centroides IVF desde {index_path}: {e}")
+
+    if index is None or index.centroids.shape[1] != snapshot.encodings.shape[1]:
+        index = IVFIndex.train(snapshot.encodings, nlist=config['ann_nlist'] or None)
+
+    index.add(snapshot.encodings, snapshot.encoding_owner)
+    logger.info(f"Índice IVF listo: {index.nlist} listas, {len(index.vectors)} encodings")
+    return index
@@ -0,0 +1,165 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Límites superiores (segundos) de los buckets de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos y etiquetas"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][index] += 1
+            series['sum'] += value
+
+    def count(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return sum(series['counts']) if series else 0
+
+    def samples(self):
+        with self._lock:
+            snapshot = sorted((key, list(s['counts']), s['sum']) for key, s in self._series.items())
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', le)]), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), cumulative
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso, exportable en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'face_stage_seconds',
+    'Duración de cada etapa del reconocimiento facial',
+    ('pipeline', 'stage')
+)
+VERIFICATIONS = registry.counter(
+    'face_verifications_total',
+    'Verificaciones faciales por resultado',
+    ('result',)
+)
+FRAME_GATE = registry.counter(
+    'face_frame_gate_total',
+    'Cuadros evaluados por el filtro de cambios, por resultado (el detalle por dispositivo está en /api/health/)',
+    ('result',)
+)
+REGISTRATION_PHOTOS = registry.counter(
+    'face_registration_photos_total',
+    'Fotos de registro procesadas por resultado',
+    ('result',)
+)
+
+
+@contextmanager
+def timed_stage(pipeline, stage):
+    """Mide el bloque y lo registra en face_stage_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, pipeline=pipeline, stage=stage)
+
+
+def observe_stage_timings(pipeline, report):
+    """Registra los tiempos de un FaceAnalysis.report() calculado en un proceso del pool"""
+    for stage, milliseconds in (report or {}).get('timings_ms', {}).items():
+        STAGE_SECONDS.observe(milliseconds / 1000, pipeline=pipeline, stage=stage)
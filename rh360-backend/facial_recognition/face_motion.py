@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Largo máximo de la clave de dispositivo (device_info es texto libre)
+MAX_DEVICE_KEY_LENGTH = 64
+
+
+def device_key(device_info):
+    """Identificador del kiosco a partir de device_info: texto, o JSON/dict con device_id o id"""
+    if not device_info:
+        return None
+    if isinstance(device_info, str):
+        try:
+            device_info = json.loads(device_info)
+        except ValueError:
+            return device_info.strip()[:MAX_DEVICE_KEY_LENGTH] or None
+    if isinstance(device_info, dict):
+        device_info = device_info.get('device_id') or device_info.get('id')
+    if not device_info:
+        return None
+    return str(device_info).strip()[:MAX_DEVICE_KEY_LENGTH] or None
+
+
+def frame_thumbnail(data, size=32):
+    """Miniatura en escala de grises (size x size, valores 0-1) de la foto decodificada a 1/8"""
+    gray = cv2.imdecode(
+        np.frombuffer(data, dtype=np.uint8),
+        cv2.IMREAD_REDUCED_GRAYSCALE_8 | cv2.IMREAD_IGNORE_ORIENTATION
+    )
+    if gray is None:
+        raise ValueError("No se pudo decodificar la foto")
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+
+
+class FrameChangeGate:
+    """Descarta cuadros casi idénticos al último cuadro procesado de cada dispositivo
+
+    La referencia solo se actualiza con los cuadros que pasan el filtro, así un cambio lento
+    se acumula hasta superar el umbral, y solo cuando accept() confirma que el cuadro se procesó:
+    un cuadro rechazado por cola llena, plazo vencido o error no impide el reintento idéntico.
+    Pasado max_age la referencia se renueva aunque no haya cambios, para no quedar con un
+    resultado viejo.
+    """
+
+    def __init__(self, threshold=0.02, thumbnail_size=32, max_devices=256, max_age=30):
+        self._lock = threading.Lock()
+        self._devices = OrderedDict()
+        self.threshold = threshold
+        self.thumbnail_size = thumbnail_size
+        self.max_devices = max_devices
+        self.max_age = max_age
+
+    def configure(self, threshold, thumbnail_size, max_devices, max_age):
+        with self._lock:
+            if thumbnail_size != self.thumbnail_size:
+                # Las miniaturas guardadas ya no son comparables
+                for device in self._devices.values():
+                    device['thumbnail'] = None
+                    device['pending'] = None
+            self.threshold = threshold
+            self.thumbnail_size = thumbnail_size
+            self.max_devices = max_devices
+            self.max_age = max_age
+            self._evict()
+
+    def check(self, key, data):
+        """(hubo cambio, diferencia media con la referencia o None si no había referencia)"""
+        thumbnail = frame_thumbnail(data, self.thumbnail_size)
+        now = time.time()
+        with self._lock:
+            device = self._devices.get(key)
+            if device is None:
+                device = self._devices[key] = {
+                    'thumbnail': None, 'stored_at': 0.0, 'pending': None,
+                    'frames': 0, 'skipped': 0, 'last_difference': None
+                }
+            self._devices.move_to_end(key)
+            self._evict()
+
+            device['frames'] += 1
+            difference = None
+            if device['thumbnail'] is not None:
+                difference = float(np.mean(np.abs(thumbnail - device['thumbnail'])))
+                device['last_difference'] = round(difference, 4)
+                if difference < self.threshold and now - device['stored_at'] <= self.max_age:
+                    device['skipped'] += 1
+                    return False, difference
+
+            device['pending'] = (thumbnail, now)
+            return True, difference
+
+    def accept(self, key):
+        """El último cuadro que pasó el filtro se procesó: pasa a ser la referencia del dispositivo"""
+        with self._lock:
+            device = self._devices.get(key)
+            if device is not None and device['pending'] is not None:
+                device['thumbnail'], device['stored_at'] = device['pending']
+                device['pending'] = None
+
+    def _evict(self):
+        while len(self._devices) > self.max_devices:
+            self._devices.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'devices': {
+                    key: {
+                        'frames': device['frames'],
+                        'skipped': device['skipped'],
+                        'skip_rate': round(device['skipped'] / device['frames'], 4) if device['frames'] else None,
+                        'last_difference': device['last_difference'],
+                    }
+                    for key, device in self._devices.items()
+                },
+            }
+
+
+frame_change_gate = FrameChangeGate()
@@ -1,14 +1,20 @@
 import face_recognition
 import cv2
 import numpy as np
-import json
-import base64
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps, ImageDraw, ImageStat
-import io
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps, ImageDraw
 import time
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-from scipy.spatial import distance
-from .models import Employee
+from .face_analysis import FaceAnalysis, encode_faces
+from .face_cache import photo_fingerprint, verification_cache
+from .face_detection import box_iou, detection_proxy, scale_face_location
+from .face_enhancement import apply_variant, enhanced_variants, variant_hit_rates
+from .face_gallery import GallerySnapshot, face_gallery
+from .face_images import MAX_IMAGE_PIXELS, decode_photo, photo_bytes
+from .face_metrics import FRAME_GATE, REGISTRATION_PHOTOS, VERIFICATIONS, observe_stage_timings, timed_stage
+from .face_motion import frame_change_gate
+from .face_templates import ENCODING_SIZE, parse_face_data
+from .face_workers import (
+    DeadlineExceeded, WorkerPoolBusy, check_deadline, registration_pool, verification_pool
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -63,21 +69,79 @@ class AdvancedFaceRecognitionService:
             'minimum_face_coverage': 0.08,           # Cobertura facial mínima reducida
             'allow_partial_occlusion': True,         # Permitir oclusión parcial (lentes, etc.)
             'lighting_variation_tolerance': True,    # Tolerancia a variaciones de luz
+            
+            # --- ÍNDICE APROXIMADO PARA GALERÍAS GRANDES ---
+            'ann_enabled': False,                    # Índice IVF opcional (desactivado por defecto)
+            'ann_min_gallery_size': 5000,            # Solo se usa desde este número de empleados
+            'ann_nlist': 0,                          # Listas IVF (0 = automático, ~4·√encodings)
+            'ann_nprobe': 16,                        # Listas revisadas por consulta
+            'ann_top_k': 50,                         # Empleados candidatos para comparación completa
+            'ann_index_path': 'media/face_index/ivf_centroids.npz',  # Centroides de build_face_index
+            
+            # --- PASADA GRUESA POR CENTROIDES ---
+            'coarse_enabled': True,                  # Filtrar por centroide antes de la comparación completa
+            'coarse_top_n': 20,                      # Empleados más cercanos que siempre se comparan
+            'coarse_margin': 0.01,                   # Holgura sobre max_tolerance + radio (redondeo)
+            
+            # --- POOL DE VERIFICACIÓN ---
+            'verification_workers': 2,               # Procesos persistentes para dlib (0 = en el mismo hilo)
+            'verification_queue_size': 8,            # Solicitudes en espera antes de rechazar con 503
+            'async_verification_threads': 16,        # Hilos que esperan al pool desde las vistas async
+            
+            # --- DETECCIÓN MULTIESCALA ---
+            'detection_max_side': 400,               # Lado máximo del proxy de detección (0 = resolución completa)
+            'detection_full_resolution_fallback': True,  # Reintentar HOG a resolución completa si el proxy falla
+            
+            # --- DECODIFICACIÓN DE FOTOS ---
+            'verification_max_side': 1200,           # Lado máximo de la foto de verificación
+            'registration_max_side': 1000,           # Lado máximo de las fotos de registro
+            'max_image_pixels': MAX_IMAGE_PIXELS,    # Fotos más grandes se rechazan antes de decodificar
+            
+            # --- REGISTRO EN PARALELO ---
+            'registration_workers': 2,               # Procesos máximos para fotos de registro (0 = secuencial)
+            
+            # --- VERIFICACIÓN POR RÁFAGA ---
+            'burst_max_frames': 8,                   # Cuadros aceptados por solicitud
+            'burst_proxy_side': 320,                 # Lado de la copia usada para puntuar cada cuadro
+            'burst_candidates': 2,                   # Mejores cuadros que pasan por encoding y comparación
+            'burst_early_exit_confidence': 0.85,     # Con esta confianza no se prueban más cuadros
+            
+            # --- MARCAJE GRUPAL ---
+            'group_detection_max_side': 800,         # Proxy más grande: en grupo los rostros son pequeños
+            'group_max_faces': 10,                   # Rostros procesados por cuadro (los más grandes)
+            
+            # --- KIOSCO EN STREAMING ---
+            'kiosk_frame_max_side': 480,             # Lado máximo de los cuadros recibidos por WebSocket
+            'kiosk_max_faces': 4,                    # Rostros seguidos por cuadro (los más grandes)
+            'kiosk_iou_threshold': 0.3,              # IoU mínimo para continuar un track en el cuadro siguiente
+            'kiosk_max_missed_frames': 5,            # Cuadros sin el rostro antes de cerrar su track
+            'kiosk_recognition_attempts': 3,         # Cuadros en que se intenta reconocer un track nuevo
+            'kiosk_frame_timeout': 2,                # Plazo en segundos para procesar un cuadro
+            
+            # --- FILTRO DE CUADROS SIN CAMBIOS ---
+            'frame_gate_enabled': True,              # Omitir cuadros iguales al anterior del mismo dispositivo
+            'frame_gate_threshold': 0.02,            # Diferencia media mínima (0-1) para procesar el cuadro
+            'frame_gate_thumbnail_size': 32,         # Lado de la miniatura en gris que se compara
+            'frame_gate_max_devices': 256,           # Dispositivos recordados por proceso (LRU)
+            'frame_gate_max_age': 30,                # Segundos tras los que se procesa aunque no haya cambios
+            
+            # --- CACHÉ DE RESULTADOS ---
+            'result_cache_enabled': True,            # Reutilizar encoding y resultado de fotos repetidas
+            'result_cache_size': 256,                # Fotos recordadas por proceso (LRU)
+            'result_cache_ttl': 300,                 # Segundos que se conserva cada entrada
         }
 
-    def detect_image_quality(self, image_array):
+    def detect_image_quality(self, image_array, gray=None):
         """Detección de calidad más permisiva para uso real"""
         try:
-            pil_image = Image.fromarray(image_array)
-            
             # Detección de desenfoque más tolerante
-            gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+            if gray is None:
+                gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
             laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
             blur_score = min(laplacian_var / 30.0, 1.0)  # Umbral más bajo
             
             # Análisis de brillo más amplio
-            stat = ImageStat.Stat(pil_image)
-            brightness = sum(stat.mean) / len(stat.mean) / 255.0
+            brightness = float(image_array.mean()) / 255.0
             
             # Rangos de brillo muy amplios
             if brightness < 0.15 or brightness > 0.95:
@@ -88,7 +152,7 @@ class AdvancedFaceRecognitionService:
                 brightness_score = 1.0
             
             # Análisis de contraste permisivo
-            contrast_std = np.std(np.array(pil_image))
+            contrast_std = np.std(image_array)
             contrast_score = min(contrast_std / 50.0, 1.0)  # Umbral muy bajo
             
             # Detección de ruido tolerante
@@ -113,6 +177,7 @@ class AdvancedFaceRecognitionService:
             
             return {
                 'overall_quality': quality_score,
+                'sharpness': laplacian_var,
                 'blur_score': blur_score,
                 'brightness': brightness,
                 'brightness_score': brightness_score,
@@ -123,6 +188,7 @@ class AdvancedFaceRecognitionService:
         except Exception:
             return {
                 'overall_quality': 0.3,  # Valor por defecto más alto
+                'sharpness': 0.0,
                 'blur_score': 0.3,
                 'brightness': 0.5,
                 'brightness_score': 0.5,
@@ -155,255 +221,142 @@ class AdvancedFaceRecognitionService:
             logger.error(f"Error verificando rostro frontal: {e}")
             return True  # En caso de error, asumir válido
 
+    def batched_face_comparison(self, stored_matrix, current_encoding, current_landmarks=None,
+                                adaptation_matrix=None, landmark_vectors=None):
+        """Comparación en bloque: K encodings (K×128) contra el encoding actual en una pasada"""
+        stored_matrix = np.asarray(stored_matrix, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        if adaptation_matrix is None:
+            adaptation_matrix = np.zeros((0, ENCODING_SIZE))
+        adaptation_matrix = np.asarray(adaptation_matrix, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        
+        parsed_face = {
+            'has_encodings': True,
+            'encodings': stored_matrix,
+            'adaptations': adaptation_matrix,
+            'landmarks': [np.asarray(lm, dtype=np.float64).flatten() for lm in landmark_vectors or []],
+        }
+        snapshot = GallerySnapshot([None], [parsed_face], dtype=np.float64)
+        scores = snapshot.score(current_encoding, current_landmarks, self.ADVANCED_CONFIG)
+        
+        result = {key: value[0] for key, value in scores.items() if key != 'templates'}
+        result['templates'] = scores['templates']
+        result['is_match'] = bool(result['is_match'])
+        result['confidence'] = float(result['confidence'])
+        result['details'] = snapshot.describe(scores, 0)
+        return result
+
     def advanced_face_comparison(self, stored_data, current_encoding, current_landmarks):
         """Comparación facial balanceada para uso real"""
         try:
-            stored_encodings = stored_data.get('encodings', [])
-            stored_landmarks = stored_data.get('landmarks', [])
-            environmental_adaptations = stored_data.get('environmental_adaptations', [])
-            
-            if not stored_encodings:
+            parsed_face = parse_face_data(stored_data)
+            if not parsed_face['has_encodings']:
                 return False, 0.0, "Sin datos de rostro registrados"
             
-            # Contadores balanceados
-            excellent_matches = 0       # Distancia < 0.35
-            high_quality_matches = 0    # Distancia <= base_tolerance
-            acceptable_matches = 0      # Dentro de tolerancia máxima
-            
-            all_scores = []
-            all_distances = []
-            detailed_matches = []
-            
-            max_euclidean = self.ADVANCED_CONFIG['max_euclidean_distance']
-            min_cosine = self.ADVANCED_CONFIG['min_cosine_similarity']
-            base_tolerance = self.ADVANCED_CONFIG['base_tolerance']
-            
-            for i, stored_enc in enumerate(stored_encodings):
-                if stored_enc is None:
-                    continue
-                
-                stored_enc_array = np.array(stored_enc)
-                distances = face_recognition.face_distance([stored_enc_array], current_encoding)
-                euclidean_dist = distances[0]
-                all_distances.append(euclidean_dist)
-                
-                # Categorización más permisiva
-                if euclidean_dist <= 0.35:
-                    excellent_matches += 1
-                if euclidean_dist <= base_tolerance:
-                    high_quality_matches += 1
-                if euclidean_dist <= self.ADVANCED_CONFIG['max_tolerance']:
-                    acceptable_matches += 1
-                
-                # Sin rechazo inmediato por distancia alta
-                euclidean_score = max(0, 1 - (euclidean_dist / max_euclidean))
-                
-                # Similitud coseno más permisiva
-                try:
-                    cosine_sim = 1 - distance.cosine(stored_enc_array, current_encoding)
-                    if np.isnan(cosine_sim):
-                        cosine_sim = 0.5  # Valor neutro si hay NaN
-                    cosine_sim = max(0, cosine_sim)
-                except Exception:
-                    cosine_sim = 0.5  # Valor neutro por defecto
-                
-                # Correlación con manejo de errores
-                try:
-                    correlation = np.corrcoef(stored_enc_array, current_encoding)[0, 1]
-                    if np.isnan(correlation):
-                        correlation = 0.5
-                    correlation = max(0, correlation)
-                except Exception:
-                    correlation = 0.5
-                
-                # Cálculo de puntaje balanceado
-                combined_score = (
-                    euclidean_score * 0.5 +    # Peso principal a distancia euclidiana
-                    cosine_sim * 0.3 +         # Peso a similitud coseno
-                    correlation * 0.2          # Peso a correlación
-                )
-                
-                # Bonificaciones más generosas
-                bonus_applied = 0
-                if euclidean_dist <= 0.35:
-                    bonus_applied += 0.02
-                if euclidean_dist <= base_tolerance and cosine_sim >= 0.75:
-                    bonus_applied += 0.015
-                if euclidean_dist <= 0.30:  # Bonus por excelente match
-                    bonus_applied += 0.03
-                
-                final_score = min(combined_score + bonus_applied, 1.0)
-                all_scores.append(final_score)
-                
-                detailed_matches.append({
-                    'photo_index': i,
-                    'euclidean_distance': euclidean_dist,
-                    'euclidean_score': euclidean_score,
-                    'cosine': cosine_sim,
-                    'correlation': correlation,
-                    'combined': final_score,
-                    'category': 'excellent' if euclidean_dist <= 0.35 else 
-                               'high' if euclidean_dist <= base_tolerance else 'acceptable'
-                })
-            
-            # Análisis de adaptaciones ambientales más permisivo
-            adaptation_scores = []
-            for adaptations in environmental_adaptations:
-                for adaptation in adaptations:
-                    if 'encoding' in adaptation:
-                        try:
-                            adapt_enc = np.array(adaptation['encoding'])
-                            adapt_distances = face_recognition.face_distance([adapt_enc], current_encoding)
-                            adapt_dist = adapt_distances[0]
-                            
-                            if adapt_dist <= self.ADVANCED_CONFIG['max_tolerance']:
-                                adapt_score = max(0, 1 - (adapt_dist / self.ADVANCED_CONFIG['max_tolerance']))
-                                if adapt_score >= 0.6:  # Umbral más bajo
-                                    adaptation_scores.append(adapt_score)
-                                    all_scores.append(adapt_score)
-                        except Exception:
-                            continue
-            
-            # Criterios de rechazo más permisivos
-            if not all_scores:
-                return False, 0.0, "No se encontraron coincidencias válidas"
-            
-            # Solo verificar requisitos mínimos realmente necesarios
-            if acceptable_matches < self.ADVANCED_CONFIG['min_matches']:
-                return False, 0.0, f"Insuficientes matches aceptables: {acceptable_matches}"
-            
-            # Verificación de consistencia más tolerante
-            distance_penalty = 0
-            if len(all_distances) > 1:
-                distance_std = np.std(all_distances)
-                if distance_std > self.ADVANCED_CONFIG['consistency_threshold']:
-                    distance_penalty = min(distance_std * 0.1, 0.05)  # Penalización mínima
-            
-            # Verificación de landmarks más flexible
-            landmark_bonus = 0
-            if current_landmarks is not None and stored_landmarks and self.ADVANCED_CONFIG['use_landmarks']:
-                landmark_similarities = []
-                current_lm_flat = np.array(current_landmarks).flatten()
-                
-                for stored_lm_list in stored_landmarks:
-                    if stored_lm_list is not None:
-                        try:
-                            stored_lm_array = np.array(stored_lm_list).flatten()
-                            min_len = min(len(current_lm_flat), len(stored_lm_array))
-                            
-                            if min_len > 60:  # Requisito mínimo de puntos
-                                lm_similarity = 1 - distance.cosine(
-                                    current_lm_flat[:min_len], 
-                                    stored_lm_array[:min_len]
-                                )
-                                
-                                if not np.isnan(lm_similarity) and lm_similarity >= 0.5:
-                                    landmark_similarities.append(lm_similarity)
-                        except Exception:
-                            continue
-                
-                if landmark_similarities:
-                    landmark_score = np.mean(landmark_similarities)
-                    if landmark_score >= self.ADVANCED_CONFIG['min_landmark_similarity']:
-                        landmark_bonus = min(landmark_score * 0.03, 0.03)
-            
-            # Cálculo final balanceado
-            sorted_scores = sorted(all_scores, reverse=True)
-            top_scores = sorted_scores[:min(3, len(sorted_scores))]
-            base_confidence = np.mean(top_scores) if top_scores else 0.0
-            
-            # Bonificaciones por calidad de matches
-            quality_bonus = 0
-            if excellent_matches > 0:
-                quality_bonus += 0.02 * excellent_matches
-            if high_quality_matches > 0:
-                quality_bonus += 0.01 * high_quality_matches
-            
-            # Confianza final
-            final_confidence = min(
-                base_confidence + landmark_bonus + quality_bonus - distance_penalty,
-                1.0
+            result = self.batched_face_comparison(
+                parsed_face['encodings'],
+                current_encoding,
+                current_landmarks,
+                adaptation_matrix=parsed_face['adaptations'],
+                landmark_vectors=parsed_face['landmarks']
             )
-            final_confidence = max(0.0, final_confidence)
-            
-            # Verificación final balanceada
-            min_confidence = self.ADVANCED_CONFIG['min_confidence']
-            
-            is_match = (
-                final_confidence >= min_confidence and 
-                acceptable_matches >= self.ADVANCED_CONFIG['min_matches']
-            )
-            
-            # NO aplicar modo ultra estricto por defecto
-            
-            details = (f"Confianza: {final_confidence:.1%}, "
-                       f"Matches aceptables: {acceptable_matches}, "
-                       f"Alta calidad: {high_quality_matches}, "
-                       f"Excelentes: {excellent_matches}, "
-                       f"Total: {len(all_scores)}")
-            
-            return is_match, final_confidence, details
+            return result['is_match'], result['confidence'], result['details']
             
         except Exception as e:
             logger.error(f"Error en comparación facial: {e}")
             return False, 0.0, f"Error de comparación: {str(e)}"
 
-    def enhance_image_quality(self, image):
-        """Mejoras de imagen optimizadas y eficientes"""
-        enhanced_versions = []
+    def locate_face(self, image_array, area_scale=1.0, use_cnn=False, analysis=None):
+        """Primer rostro con área suficiente (HOG y opcionalmente CNN); el área se mide en la imagen original"""
+        # Intentar HOG primero (más rápido)
+        if analysis is not None:
+            analysis.passes['detector'] += 1
+        face_locations = face_recognition.face_locations(
+            image_array,
+            number_of_times_to_upsample=0,
+            model="hog"
+        )
         
-        try:
-            enhanced_versions.append(image)  # Original siempre incluida
-            img_array = np.array(image)
+        for face_loc in face_locations:
+            top, right, bottom, left = face_loc
+            face_area = (right - left) * (bottom - top) * area_scale
             
-            # Solo las mejoras más efectivas
-            # CLAHE para contraste adaptativo
+            if face_area >= self.ADVANCED_CONFIG['face_area_threshold']:
+                return face_loc
+        
+        # Si HOG falla, intentar CNN
+        if use_cnn:
             try:
-                lab = cv2.cvtColor(img_array, cv2.COLOR_RGB2LAB)
-                clahe_configs = [(2.5, (8,8))]  # Una sola configuración optimizada
-                
-                for clip_limit, tile_grid in clahe_configs:
-                    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid)
-                    lab_copy = lab.copy()
-                    lab_copy[:,:,0] = clahe.apply(lab_copy[:,:,0])
-                    clahe_enhanced = cv2.cvtColor(lab_copy, cv2.COLOR_LAB2RGB)
-                    enhanced_versions.append(Image.fromarray(clahe_enhanced))
+                if analysis is not None:
+                    analysis.passes['detector'] += 1
+                face_locations = face_recognition.face_locations(
+                    image_array, model="cnn"
+                )
+                if face_locations:
+                    return face_locations[0]
             except Exception:
                 pass
-            
-            # Ajuste gamma simple
+        
+        return None
+
+    def locate_faces(self, image_array, area_scale=1.0):
+        """Todos los rostros HOG con área suficiente, de mayor a menor"""
+        face_locations = face_recognition.face_locations(
+            image_array,
+            number_of_times_to_upsample=0,
+            model="hog"
+        )
+        sized = [
+            ((right - left) * (bottom - top) * area_scale, (top, right, bottom, left))
+            for top, right, bottom, left in face_locations
+        ]
+        sized.sort(key=lambda item: item[0], reverse=True)
+        return [face_loc for area, face_loc in sized if area >= self.ADVANCED_CONFIG['face_area_threshold']]
+
+    def detect_face_in_variants(self, image, order=None, deadline=None, use_cnn=False, analysis=None):
+        """Busca un rostro en variantes reducidas, en orden de éxito histórico, y lo ubica en la imagen original"""
+        proxy, scale_y, scale_x = detection_proxy(image, self.ADVANCED_CONFIG['detection_max_side'])
+        attempts = []
+        
+        # El tiempo de cada variante incluye generarla y buscar el rostro en ella
+        variant_start = time.perf_counter()
+        for variant_name, proxy_array in enhanced_variants(proxy, order, deadline):
             try:
-                gamma_values = [0.8, 1.3]  # Solo dos valores efectivos
-                for gamma in gamma_values:
-                    inv_gamma = 1.0 / gamma
-                    table = np.array([((i / 255.0) ** inv_gamma) * 255 
-                                      for i in np.arange(0, 256)]).astype("uint8")
-                    gamma_corrected = cv2.LUT(img_array, table)
-                    enhanced_versions.append(Image.fromarray(gamma_corrected))
+                face_location = self.locate_face(proxy_array, scale_y * scale_x, use_cnn, analysis)
             except Exception:
-                pass
+                face_location = None
+            if analysis is not None:
+                analysis.add_timing(f'variant.{variant_name}', time.perf_counter() - variant_start)
+            
+            attempts.append((variant_name, face_location is not None))
+            if face_location is None:
+                variant_start = time.perf_counter()
+                continue
+            if proxy is image:
+                return face_location, proxy_array, attempts
             
-            # Mejora de brillo/contraste
+            # Encoding y landmarks se calculan sobre la variante a resolución completa
+            full_array = apply_variant(variant_name, image)
+            return scale_face_location(face_location, scale_y, scale_x, full_array.shape), full_array, attempts
+        
+        # Rostros muy pequeños para el proxy: un último intento HOG a resolución completa
+        if (proxy is not image and self.ADVANCED_CONFIG['detection_full_resolution_fallback'] and
+                (deadline is None or time.time() < deadline)):
+            image_array = np.array(image)
             try:
-                enhancer = ImageEnhance.Brightness(image)
-                enhanced_versions.append(enhancer.enhance(1.1))
-                enhancer = ImageEnhance.Contrast(image)
-                enhanced_versions.append(enhancer.enhance(1.15))
+                face_location = self.locate_face(image_array, analysis=analysis)
             except Exception:
-                pass
-            
-            return enhanced_versions[:6]  # Máximo 6 versiones para eficiencia
-            
-        except Exception as e:
-            logger.error(f"Error mejorando imagen: {e}")
-            return [image]
+                face_location = None
+            if face_location is not None:
+                return face_location, image_array, attempts
+        
+        return None, None, attempts
 
-    def create_environmental_adaptations(self, image_array, face_location):
-        """Adaptaciones ambientales esenciales"""
+    def create_environmental_adaptations(self, analysis):
+        """Adaptaciones ambientales esenciales; reutilizan la forma de 68 puntos de la imagen base"""
         adaptations = []
         
         try:
-            image = Image.fromarray(image_array)
+            image = Image.fromarray(analysis.face_array)
             
             # Solo condiciones esenciales para el mundo real
             lighting_conditions = [
@@ -417,14 +370,11 @@ class AdvancedFaceRecognitionService:
                     adapted = ImageEnhance.Brightness(image).enhance(condition['brightness'])
                     adapted = ImageEnhance.Contrast(adapted).enhance(condition['contrast'])
                     
-                    adapted_array = np.array(adapted)
-                    encoding = face_recognition.face_encodings(
-                        adapted_array, [face_location], num_jitters=1, model="large"
-                    )
+                    encoding = analysis.encode(num_jitters=1, image_array=np.array(adapted))
                     
-                    if encoding:
+                    if encoding is not None:
                         adaptations.append({
-                            'encoding': encoding[0],
+                            'encoding': encoding,
                             'condition': condition['name'],
                             'brightness': condition['brightness'],
                             'contrast': condition['contrast']
@@ -438,15 +388,18 @@ class AdvancedFaceRecognitionService:
             logger.error(f"Error creando adaptaciones: {e}")
             return []
 
-    def extract_detailed_landmarks(self, image_array):
-        """Extracción de landmarks con validación básica"""
+    def extract_detailed_landmarks(self, image_array, face_location=None, landmarks=None):
+        """Extracción de landmarks con validación básica (landmarks ya calculados si se entregan)"""
         try:
-            face_landmarks_list = face_recognition.face_landmarks(image_array)
-            
-            if not face_landmarks_list:
-                return None
-            
-            landmarks = face_landmarks_list[0]
+            if landmarks is None:
+                face_landmarks_list = face_recognition.face_landmarks(
+                    image_array, [face_location] if face_location else None
+                )
+                
+                if not face_landmarks_list:
+                    return None
+                
+                landmarks = face_landmarks_list[0]
             
             # Validación básica de landmarks críticos
             required_features = ['left_eye', 'right_eye', 'nose_bridge']
@@ -477,157 +430,141 @@ class AdvancedFaceRecognitionService:
             logger.error(f"Error extrayendo landmarks: {e}")
             return None
 
-    def process_advanced_registration(self, photos_base64):
-        """Proceso de registro optimizado para 5 fotos"""
+    def process_registration_photo(self, idx, photo, variant_order):
+        """Procesa una foto de registro: calidad, detección, encoding, landmarks y adaptaciones"""
+        result = {
+            'encoding': None,
+            'landmarks': None,
+            'adaptations': [],
+            'quality': None,
+            'failed_reasons': [],
+            'variant_attempts': [],
+            'stage_timings': None,
+            'reason': None,
+        }
+        analysis = None
+        
+        try:
+            print(f"Procesando foto {idx+1}...")
+            
+            decode_start = time.perf_counter()
+            image = decode_photo(
+                photo,
+                self.ADVANCED_CONFIG['registration_max_side'],
+                self.ADVANCED_CONFIG['max_image_pixels']
+            )
+            # Escala de grises, rostro y forma de 68 puntos se calculan una vez para todas las etapas
+            analysis = FaceAnalysis(np.array(image))
+            analysis.add_timing('decode', time.perf_counter() - decode_start)
+            
+            # Verificación de calidad permisiva
+            with analysis.stage('quality'):
+                quality_info = self.detect_image_quality(analysis.image_array, analysis.gray)
+            result['quality'] = quality_info['overall_quality']
+            
+            # NO rechazar por calidad baja automáticamente
+            if not quality_info['is_acceptable'] and quality_info['overall_quality'] < 0.15:
+                result['failed_reasons'].append(
+                    f"Foto {idx+1}: Calidad extremadamente baja ({quality_info['overall_quality']:.1%})"
+                )
+                result['reason'] = 'low_quality'
+                return result
+            
+            # Detección de rostro con variantes perezosas (HOG y luego CNN)
+            with analysis.stage('detection'):
+                face_location, best_image_array, result['variant_attempts'] = self.detect_face_in_variants(
+                    image, variant_order, use_cnn=True, analysis=analysis
+                )
+            
+            if not face_location:
+                result['failed_reasons'].append(f"Foto {idx+1}: No se detectó rostro válido")
+                result['reason'] = 'no_face'
+                return result
+            analysis.set_face(face_location, best_image_array)
+            
+            # Extracción de características con múltiples intentos
+            encoding = None
+            with analysis.stage('encoding'):
+                for num_jitters in [8, 5, 3]:  # Reducido para eficiencia
+                    try:
+                        encoding = analysis.encode(num_jitters)
+                        break
+                    except Exception:
+                        continue
+            
+            if encoding is not None:
+                result['encoding'] = encoding.tolist()
+                print(f"   Características extraídas (calidad: {quality_info['overall_quality']:.2f})")
+            else:
+                result['failed_reasons'].append(f"Foto {idx+1}: Fallo en extracción de características")
+                result['reason'] = 'no_encoding'
+            
+            # Landmarks opcionales
+            if self.ADVANCED_CONFIG['use_landmarks']:
+                with analysis.stage('landmarks'):
+                    landmarks_data = self.extract_detailed_landmarks(
+                        best_image_array, face_location, analysis.landmarks()
+                    )
+                if landmarks_data:
+                    result['landmarks'] = landmarks_data.get('points_vector').tolist()
+            
+            # Adaptaciones ambientales si están activadas
+            if encoding is not None and self.ADVANCED_CONFIG['use_environmental_adaptation']:
+                with analysis.stage('adaptations'):
+                    adaptations = self.create_environmental_adaptations(analysis)
+                result['adaptations'] = [
+                    {
+                        'encoding': adapt['encoding'].tolist(),
+                        'condition': adapt['condition'],
+                        'brightness': adapt['brightness'],
+                        'contrast': adapt['contrast']
+                    } for adapt in adaptations
+                ]
+            
+        except Exception as e:
+            print(f"   Error en foto {idx+1}: {str(e)}")
+            result['failed_reasons'].append(f"Foto {idx+1}: Error - {str(e)}")
+            result['reason'] = 'error'
+            result['encoding'] = None
+            result['landmarks'] = None
+            result['adaptations'] = []
+        finally:
+            if analysis is not None:
+                result['stage_timings'] = analysis.report()
+        
+        return result
+
+    def process_advanced_registration(self, photos_base64, on_photo=None):
+        """Proceso de registro optimizado para 5 fotos; on_photo(idx, resultado) informa el avance"""
         all_encodings = []
         all_landmarks = []
         all_environmental_adaptations = []
-        valid_photos = 0
         failed_reasons = []
         quality_scores = []
         
         print(f"\nIniciando registro balanceado con {len(photos_base64)} fotos...")
         
-        for idx, photo_base64 in enumerate(photos_base64):
-            try:
-                print(f"Procesando foto {idx+1}/{len(photos_base64)}...")
-                
-                if ',' in photo_base64:
-                    photo_base64 = photo_base64.split(',')[1]
-                
-                image_data = base64.b64decode(photo_base64)
-                image = Image.open(io.BytesIO(image_data))
-                
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                if image.width > 1000 or image.height > 1000:
-                    image.thumbnail((1000, 1000), Image.Resampling.LANCZOS)
-                
-                image_array = np.array(image)
-                
-                # Verificación de calidad permisiva
-                quality_info = self.detect_image_quality(image_array)
-                quality_scores.append(quality_info['overall_quality'])
-                
-                # NO rechazar por calidad baja automáticamente
-                if not quality_info['is_acceptable'] and quality_info['overall_quality'] < 0.15:
-                    reason = f"Foto {idx+1}: Calidad extremadamente baja ({quality_info['overall_quality']:.1%})"
-                    failed_reasons.append(reason)
-                    all_encodings.append(None)
-                    all_landmarks.append(None)
-                    all_environmental_adaptations.append([])
-                    continue
-                
-                # Detección de rostro con múltiples intentos
-                enhanced_versions = self.enhance_image_quality(image)
-                face_location = None
-                best_image_array = None
-                
-                for enhanced_img in enhanced_versions:
-                    enhanced_array = np.array(enhanced_img)
-                    
-                    try:
-                        # Intentar HOG primero (más rápido)
-                        face_locations = face_recognition.face_locations(
-                            enhanced_array,
-                            number_of_times_to_upsample=0,
-                            model="hog"
-                        )
-                        
-                        if face_locations:
-                            for face_loc in face_locations:
-                                top, right, bottom, left = face_loc
-                                face_area = (right - left) * (bottom - top)
-                                
-                                if face_area >= self.ADVANCED_CONFIG['face_area_threshold']:
-                                    face_location = face_loc
-                                    best_image_array = enhanced_array
-                                    break
-                        
-                        if face_location:
-                            break
-                            
-                    except Exception:
-                        continue
-                    
-                    # Si HOG falla, intentar CNN
-                    try:
-                        face_locations = face_recognition.face_locations(
-                            enhanced_array, model="cnn"
-                        )
-                        if face_locations:
-                            face_location = face_locations[0]
-                            best_image_array = enhanced_array
-                            break
-                    except Exception:
-                        continue
-                
-                if not face_location:
-                    reason = f"Foto {idx+1}: No se detectó rostro válido"
-                    failed_reasons.append(reason)
-                    all_encodings.append(None)
-                    all_landmarks.append(None)
-                    all_environmental_adaptations.append([])
-                    continue
-                
-                # Extracción de características con múltiples intentos
-                encodings = None
-                for num_jitters in [8, 5, 3]:  # Reducido para eficiencia
-                    try:
-                        encodings = face_recognition.face_encodings(
-                            best_image_array,
-                            [face_location],
-                            num_jitters=num_jitters,
-                            model="large"
-                        )
-                        if encodings:
-                            break
-                    except Exception:
-                        continue
-                
-                if encodings:
-                    all_encodings.append(encodings[0].tolist())
-                    valid_photos += 1
-                    print(f"   Características extraídas (calidad: {quality_info['overall_quality']:.2f})")
-                else:
-                    reason = f"Foto {idx+1}: Fallo en extracción de características"
-                    failed_reasons.append(reason)
-                    all_encodings.append(None)
-                
-                # Landmarks opcionales
-                if self.ADVANCED_CONFIG['use_landmarks']:
-                    landmarks_data = self.extract_detailed_landmarks(best_image_array)
-                    if landmarks_data:
-                        all_landmarks.append(landmarks_data.get('points_vector').tolist())
-                    else:
-                        all_landmarks.append(None)
-                else:
-                    all_landmarks.append(None)
-                
-                # Adaptaciones ambientales si están activadas
-                if encodings and self.ADVANCED_CONFIG['use_environmental_adaptation']:
-                    adaptations = self.create_environmental_adaptations(best_image_array, face_location)
-                    if adaptations:
-                        all_environmental_adaptations.append([
-                            {
-                                'encoding': adapt['encoding'].tolist(),
-                                'condition': adapt['condition'],
-                                'brightness': adapt['brightness'],
-                                'contrast': adapt['contrast']
-                            } for adapt in adaptations
-                        ])
-                    else:
-                        all_environmental_adaptations.append([])
-                else:
-                    all_environmental_adaptations.append([])
-                    
-            except Exception as e:
-                print(f"   Error en foto {idx+1}: {str(e)}")
-                failed_reasons.append(f"Foto {idx+1}: Error - {str(e)}")
-                all_encodings.append(None)
-                all_landmarks.append(None)
-                all_environmental_adaptations.append([])
+        # Las fotos se procesan en paralelo en el pool de registro y se reensamblan en orden
+        registration_pool.configure(self.ADVANCED_CONFIG['registration_workers'], 0)
+        variant_order = variant_hit_rates.order()
+        photo_results = registration_pool.imap(registration_photo_features, [
+            (idx, photo.read() if hasattr(photo, 'read') else photo, variant_order)
+            for idx, photo in enumerate(photos_base64)
+        ])
+        
+        for idx, photo_result in enumerate(photo_results):
+            if on_photo is not None:
+                on_photo(idx, photo_result)
+            variant_hit_rates.record(photo_result['variant_attempts'])
+            logger.debug(f"Etapas de la foto {idx+1}: {photo_result.get('stage_timings')}")
+            observe_stage_timings('registration', photo_result.get('stage_timings'))
+            REGISTRATION_PHOTOS.inc(result=photo_result.get('reason') or 'valid')
+            if photo_result['quality'] is not None:
+                quality_scores.append(photo_result['quality'])
+            failed_reasons.extend(photo_result['failed_reasons'])
+            all_encodings.append(photo_result['encoding'])
+            all_landmarks.append(photo_result['landmarks'])
+            all_environmental_adaptations.append(photo_result['adaptations'])
         
         # Validación final más permisiva
         valid_encodings = [enc for enc in all_encodings if enc is not None]
@@ -662,189 +599,487 @@ class AdvancedFaceRecognitionService:
             'quality_scores': quality_scores
         }
 
-    def advanced_verify(self, photo_base64):
-        """Verificación balanceada y eficiente"""
-        def verify_process():
-            try:
-                start_time = time.time()
-                
-                if ',' in photo_base64:
-                    photo_data = photo_base64.split(',')[1]
-                else:
-                    photo_data = photo_base64
-                
-                image_data = base64.b64decode(photo_data)
-                image = Image.open(io.BytesIO(image_data))
-                
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
-                
-                if image.width > 1200 or image.height > 1200:
-                    image.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
-                
-                image_array = np.array(image)
-                
-                # Verificación de calidad más permisiva
-                quality_info = self.detect_image_quality(image_array)
-                
-                # Solo rechazar si la calidad es extremadamente baja
-                if quality_info['overall_quality'] < self.ADVANCED_CONFIG['min_quality_for_verification']:
-                    return {
-                        'success': False,
-                        'error': f'Calidad de imagen demasiado baja: {quality_info["overall_quality"]:.1%}'
-                    }
-                
-                # Detección de rostro con múltiples métodos
-                enhanced_versions = self.enhance_image_quality(image)
-                face_location = None
-                best_image_array = None
-                
-                for enhanced_img in enhanced_versions:
-                    if time.time() - start_time > self.ADVANCED_CONFIG['verification_timeout'] * 0.6:
-                        break
-                    
-                    enhanced_array = np.array(enhanced_img)
-                    
-                    # Intentar HOG primero (más rápido)
-                    try:
-                        face_locations = face_recognition.face_locations(
-                            enhanced_array,
-                            number_of_times_to_upsample=0,
-                            model="hog"
+    def extract_probe(self, photo, variant_order, deadline):
+        """Etapas dlib de la verificación: decodificación, detección, encoding y landmarks"""
+        try:
+            start_time = deadline - self.ADVANCED_CONFIG['verification_timeout']
+            check_deadline(deadline, 'decodificación')
+            
+            decode_start = time.perf_counter()
+            image = decode_photo(
+                photo,
+                self.ADVANCED_CONFIG['verification_max_side'],
+                self.ADVANCED_CONFIG['max_image_pixels']
+            )
+            analysis = FaceAnalysis(np.array(image))
+            analysis.add_timing('decode', time.perf_counter() - decode_start)
+            
+            # Verificación de calidad más permisiva
+            check_deadline(deadline, 'calidad')
+            with analysis.stage('quality'):
+                quality_info = self.detect_image_quality(analysis.image_array, analysis.gray)
+            
+            # Solo rechazar si la calidad es extremadamente baja
+            if quality_info['overall_quality'] < self.ADVANCED_CONFIG['min_quality_for_verification']:
+                return {
+                    'success': False,
+                    'error': f'Calidad de imagen demasiado baja: {quality_info["overall_quality"]:.1%}',
+                    'reason': 'low_quality',
+                    'stage_timings': analysis.report()
+                }
+            
+            # Detección de rostro: las variantes se generan solo si la anterior falla
+            with analysis.stage('detection'):
+                face_location, best_image_array, variant_attempts = self.detect_face_in_variants(
+                    image, variant_order,
+                    deadline=start_time + self.ADVANCED_CONFIG['verification_timeout'] * 0.6,
+                    analysis=analysis
+                )
+            
+            if not face_location:
+                return {
+                    'success': False,
+                    'error': 'No se detectó rostro válido - Asegúrate de que esté bien iluminado y sea visible',
+                    'reason': 'no_face',
+                    'variant_attempts': variant_attempts,
+                    'stage_timings': analysis.report()
+                }
+            analysis.set_face(face_location, best_image_array)
+            
+            # Extracción de características
+            check_deadline(deadline, 'encoding')
+            with analysis.stage('encoding'):
+                current_encoding = analysis.encode(num_jitters=3)  # Reducido para velocidad
+            
+            # Frontalidad y landmarks salen de la misma forma de 68 puntos usada por el encoding
+            quality_info['is_frontal'] = self.is_frontal_face(analysis.landmarks())
+            
+            # Extraer landmarks si hay tiempo
+            current_landmarks_vector = None
+            if (self.ADVANCED_CONFIG['use_landmarks'] and 
+                time.time() - start_time < self.ADVANCED_CONFIG['verification_timeout'] * 0.7):
+                try:
+                    with analysis.stage('landmarks'):
+                        landmark_data = self.extract_detailed_landmarks(
+                            best_image_array, face_location, analysis.landmarks()
                         )
-                        
-                        if face_locations:
-                            for face_loc in face_locations:
-                                top, right, bottom, left = face_loc
-                                face_area = (right - left) * (bottom - top)
-                                
-                                if face_area >= self.ADVANCED_CONFIG['face_area_threshold']:
-                                    face_location = face_loc
-                                    best_image_array = enhanced_array
-                                    break
-                        
-                        if face_location:
-                            break
-                            
-                    except Exception:
-                        continue
-                    
-                   
-                
-                if not face_location:
-                    return {
-                        'success': False,
-                        'error': 'No se detectó rostro válido - Asegúrate de que esté bien iluminado y sea visible'
-                    }
-                
-                # Extracción de características con timeouts
-                current_encoding = face_recognition.face_encodings(
-                    best_image_array,
-                    [face_location],
-                    num_jitters=3,  # Reducido para velocidad
-                    model="large"
+                    if landmark_data:
+                        current_landmarks_vector = landmark_data['points_vector']
+                except Exception:
+                    pass
+            
+            return {
+                'success': True,
+                'encoding': current_encoding,
+                'landmarks': current_landmarks_vector,
+                'quality_info': quality_info,
+                'variant_attempts': variant_attempts,
+                'stage_timings': analysis.report()
+            }
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error en verificación: {e}")
+            return {'success': False, 'error': str(e), 'reason': 'error'}
+
+    def advanced_verify(self, photo, deadline=None, device_id=None):
+        """Verificación balanceada y eficiente (foto en base64, bytes o archivo subido)
+
+        Con device_id, un cuadro sin cambios respecto del anterior de ese dispositivo no se
+        procesa: el resultado trae no_change=True y best_match None.
+        """
+        start_time = time.time()
+        if deadline is None:
+            deadline = start_time + self.ADVANCED_CONFIG['verification_timeout']
+        verification_pool.configure(
+            self.ADVANCED_CONFIG['verification_workers'],
+            self.ADVANCED_CONFIG['verification_queue_size']
+        )
+        
+        # Dispositivo cuyo cuadro pasó el filtro: se vuelve referencia solo si se procesa
+        gated_device = None
+        try:
+            data = photo_bytes(photo)
+            
+            # Kioscos que envían cuadros periódicos: un pasillo vacío o la misma persona quieta
+            # no vuelven a pasar por detección
+            if device_id and self.ADVANCED_CONFIG['frame_gate_enabled']:
+                frame_change_gate.configure(
+                    self.ADVANCED_CONFIG['frame_gate_threshold'],
+                    self.ADVANCED_CONFIG['frame_gate_thumbnail_size'],
+                    self.ADVANCED_CONFIG['frame_gate_max_devices'],
+                    self.ADVANCED_CONFIG['frame_gate_max_age']
                 )
-                
-                if not current_encoding:
+                with timed_stage('verification', 'frame_gate'):
+                    changed, difference = frame_change_gate.check(device_id, data)
+                # Sin etiqueta de dispositivo: device_info lo envía el cliente y no tiene límite
+                FRAME_GATE.inc(result='processed' if changed else 'skipped')
+                if changed:
+                    gated_device = device_id
+                else:
+                    VERIFICATIONS.inc(result='no_change')
                     return {
-                        'success': False,
-                        'error': 'No se pudieron extraer características faciales confiables'
-                    }
-                
-                current_encoding = current_encoding[0]
-                
-                # Extraer landmarks si hay tiempo
-                current_landmarks_vector = None
-                if (self.ADVANCED_CONFIG['use_landmarks'] and 
-                    time.time() - start_time < self.ADVANCED_CONFIG['verification_timeout'] * 0.7):
-                    try:
-                        landmark_data = self.extract_detailed_landmarks(best_image_array)
-                        if landmark_data:
-                            current_landmarks_vector = landmark_data['points_vector']
-                    except Exception:
-                        pass
-                
-                # Comparación con empleados registrados
-                best_match_data = None
-                best_confidence = 0
-                all_results = []
-                
-                employees_with_faces = Employee.objects.filter(
-                    is_active=True,
-                    has_face_registered=True
-                ).select_related()
-                
-                for employee in employees_with_faces:
-                    if time.time() - start_time > self.ADVANCED_CONFIG['verification_timeout'] * 0.9:
-                        break
-                    
-                    try:
-                        stored_encodings_json = employee.face_encoding
-                        if not stored_encodings_json:
-                            continue
-                        
-                        stored_data = json.loads(stored_encodings_json)
-                        
-                        is_match, confidence, details = self.advanced_face_comparison(
-                            stored_data,
-                            current_encoding,
-                            current_landmarks_vector
-                        )
-                        
-                        all_results.append({
-                            'employee_id': employee.id,
-                            'employee_name': employee.name,
-                            'confidence': confidence,
-                            'match': is_match,
-                            'details': details
-                        })
-                        
-                        if is_match and confidence > best_confidence:
-                            best_confidence = confidence
-                            best_match_data = {
-                                'id': employee.id,
-                                'name': employee.name,
-                                'employee_id': employee.employee_id,
-                                'rut': employee.rut,
-                                'department': employee.department,
-                            }
-                            
-                    except Exception as e:
-                        logger.error(f"Error comparando con {employee.name}: {e}")
-                        continue
-                
-                # Resultado final
-                elapsed_time = time.time() - start_time
+                        'best_match': None,
+                        'best_confidence': 0,
+                        'no_change': True,
+                        'frame_difference': difference,
+                        'elapsed_time': time.time() - start_time,
+                        'cache_hit': False
+                    }, None
+            
+            # Reintentos y sincronizaciones offline reenvían la misma foto: se busca en la caché
+            # (la galería se sincroniza antes, para comparar contra su generación actual)
+            cache_key = None
+            probe = None
+            if self.ADVANCED_CONFIG['result_cache_enabled']:
+                verification_cache.configure(
+                    self.ADVANCED_CONFIG['result_cache_size'],
+                    self.ADVANCED_CONFIG['result_cache_ttl']
+                )
+                try:
+                    with timed_stage('verification', 'fingerprint'):
+                        cache_key = photo_fingerprint(data)
+                except Exception:
+                    cache_key = None
+            if cache_key is not None:
+                face_gallery.get_snapshot()
+                generation = face_gallery.generation
+                probe, cached_result = verification_cache.get(cache_key, generation)
+                if cached_result is not None:
+                    if gated_device:
+                        frame_change_gate.accept(gated_device)
+                    VERIFICATIONS.inc(result='match' if cached_result['best_match'] else 'no_match')
+                    return dict(cached_result, elapsed_time=time.time() - start_time, cache_hit=True), None
+            
+            if probe is None:
+                # Las etapas dlib corren en el pool persistente; si la cola está llena
+                # se propaga WorkerPoolBusy para que la vista responda 503
+                # Al pool viajan los bytes de la foto, no el base64 ni el archivo subido
+                with timed_stage('verification', 'worker'):
+                    probe = verification_pool.run(
+                        extract_probe_features, data, variant_hit_rates.order(), deadline=deadline
+                    )
+                # Las tasas por variante y las métricas viven en este proceso; el pool solo informa
+                variant_hit_rates.record(probe.get('variant_attempts', []))
+                observe_stage_timings('verification', probe.get('stage_timings'))
+                if not probe['success']:
+                    # Sin rostro o de mala calidad es un resultado; un error del pipeline no
+                    if gated_device and probe.get('reason', 'error') != 'error':
+                        frame_change_gate.accept(gated_device)
+                    VERIFICATIONS.inc(result=probe.get('reason', 'error'))
+                    return None, probe['error']
+            
+            check_deadline(deadline, 'comparación')
+            
+            # Comparación vectorizada contra la galería de empleados registrados.
+            # all_results solo trae a los candidatos comparados en forma completa (ver FaceGallery.match)
+            best_match_data = None
+            best_confidence = 0
+            all_results = []
+            
+            with timed_stage('verification', 'gallery_match'):
+                matches = face_gallery.match(probe['encoding'], probe['landmarks'], self.ADVANCED_CONFIG)
+            
+            for result in matches:
+                employee = result['employee']
+                all_results.append({
+                    'employee_id': employee['id'],
+                    'employee_name': employee['name'],
+                    'confidence': result['confidence'],
+                    'match': result['match'],
+                    'details': result['details']
+                })
                 
+                if result['match'] and result['confidence'] > best_confidence:
+                    best_confidence = result['confidence']
+                    best_match_data = dict(employee)
+            
+            # Resultado final
+            elapsed_time = time.time() - start_time
+            
+            logger.debug(f"Etapas de verificación: {probe['stage_timings']}")
+            
+            verification_result = {
+                'best_match': best_match_data,
+                'best_confidence': best_confidence,
+                'all_results': all_results,
+                'compared_employees': len(all_results),
+                'quality_info': probe['quality_info'],
+                'stage_timings': probe['stage_timings'],
+                'threshold_used': self.ADVANCED_CONFIG['min_confidence'],
+                'elapsed_time': elapsed_time,
+                'cache_hit': False
+            }
+            if cache_key is not None:
+                verification_cache.put(cache_key, generation, probe, dict(verification_result))
+            if gated_device:
+                frame_change_gate.accept(gated_device)
+            VERIFICATIONS.inc(result='match' if best_match_data else 'no_match')
+            return verification_result, None
+            
+        except DeadlineExceeded:
+            VERIFICATIONS.inc(result='timeout')
+            return None, "TIMEOUT: Verificación cancelada por tiempo excedido"
+        except WorkerPoolBusy:
+            VERIFICATIONS.inc(result='busy')
+            raise
+        except Exception as e:
+            VERIFICATIONS.inc(result='error')
+            logger.error(f"Error en executor: {e}")
+            return None, f"Error durante la verificación: {str(e)}"
+
+    def extract_group_probes(self, photo, variant_order, deadline):
+        """Etapas dlib del marcaje grupal: todos los rostros del cuadro, codificados en un solo lote"""
+        try:
+            check_deadline(deadline, 'decodificación')
+            image = decode_photo(
+                photo,
+                self.ADVANCED_CONFIG['verification_max_side'],
+                self.ADVANCED_CONFIG['max_image_pixels']
+            )
+            proxy, scale_y, scale_x = detection_proxy(image, self.ADVANCED_CONFIG['group_detection_max_side'])
+            
+            # La primera variante que encuentra rostros se usa para todos ellos
+            face_locations, variant_attempts = [], []
+            for variant_name, proxy_array in enhanced_variants(proxy, variant_order, deadline):
+                face_locations = self.locate_faces(proxy_array, scale_y * scale_x)
+                variant_attempts.append((variant_name, bool(face_locations)))
+                if face_locations:
+                    break
+            
+            if not face_locations:
                 return {
-                    'success': True,
-                    'data': {
-                        'best_match': best_match_data,
-                        'best_confidence': best_confidence,
-                        'all_results': all_results,
-                        'quality_info': quality_info,
-                        'threshold_used': self.ADVANCED_CONFIG['min_confidence'],
-                        'elapsed_time': elapsed_time
-                    }
+                    'success': False,
+                    'error': 'No se detectaron rostros en el cuadro',
+                    'variant_attempts': variant_attempts
                 }
-                
-            except Exception as e:
-                logger.error(f"Error en verificación: {e}")
-                return {'success': False, 'error': str(e)}
+            
+            check_deadline(deadline, 'encoding')
+            face_array = proxy_array if proxy is image else apply_variant(variant_name, image)
+            face_locations = [
+                scale_face_location(face_loc, scale_y, scale_x, face_array.shape)
+                for face_loc in face_locations[:self.ADVANCED_CONFIG['group_max_faces']]
+            ]
+            encodings, face_landmarks = encode_faces(face_array, face_locations, num_jitters=1)
+            
+            landmark_vectors = []
+            for face_location, landmarks in zip(face_locations, face_landmarks):
+                landmark_data = None
+                if self.ADVANCED_CONFIG['use_landmarks']:
+                    landmark_data = self.extract_detailed_landmarks(face_array, face_location, landmarks)
+                landmark_vectors.append(landmark_data['points_vector'] if landmark_data else None)
+            
+            return {
+                'success': True,
+                'face_locations': face_locations,
+                'encodings': encodings,
+                'landmarks': landmark_vectors,
+                'variant_attempts': variant_attempts
+            }
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error en marcaje grupal: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def extract_kiosk_probes(self, frame, settled_locations, deadline):
+        """Etapas dlib de un cuadro del kiosco: detecta todos los rostros y codifica los de tracks sin resolver"""
+        try:
+            check_deadline(deadline, 'decodificación')
+            image = decode_photo(
+                frame,
+                self.ADVANCED_CONFIG['kiosk_frame_max_side'],
+                self.ADVANCED_CONFIG['max_image_pixels']
+            )
+            image_array = np.array(image)
+            
+            # Solo la variante original: con streaming el siguiente cuadro es el reintento
+            check_deadline(deadline, 'detección')
+            face_locations = self.locate_faces(image_array)[:self.ADVANCED_CONFIG['kiosk_max_faces']]
+            encoded_indices = [
+                index for index, face_location in enumerate(face_locations)
+                if all(box_iou(face_location, settled) < self.ADVANCED_CONFIG['kiosk_iou_threshold']
+                       for settled in settled_locations)
+            ]
+            
+            encodings, landmark_vectors = [], []
+            if encoded_indices:
+                check_deadline(deadline, 'encoding')
+                new_locations = [face_locations[index] for index in encoded_indices]
+                encodings, face_landmarks = encode_faces(image_array, new_locations, num_jitters=1)
+                for face_location, landmarks in zip(new_locations, face_landmarks):
+                    landmark_data = None
+                    if self.ADVANCED_CONFIG['use_landmarks']:
+                        landmark_data = self.extract_detailed_landmarks(image_array, face_location, landmarks)
+                    landmark_vectors.append(landmark_data['points_vector'] if landmark_data else None)
+            
+            return {
+                'success': True,
+                'face_locations': face_locations,
+                'encoded_indices': encoded_indices,
+                'encodings': encodings,
+                'landmarks': landmark_vectors,
+                'frame_size': [image.width, image.height]
+            }
+            
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error en cuadro del kiosco: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def advanced_verify_group(self, photo):
+        """Reconoce a todos los empleados de un cuadro; cada empleado aparece una sola vez"""
+        start_time = time.time()
+        deadline = start_time + self.ADVANCED_CONFIG['verification_timeout']
+        verification_pool.configure(
+            self.ADVANCED_CONFIG['verification_workers'],
+            self.ADVANCED_CONFIG['verification_queue_size']
+        )
         
-        # Ejecutar con timeout
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(verify_process)
+        try:
+            with timed_stage('group', 'worker'):
+                probes = verification_pool.run(
+                    extract_group_features, photo_bytes(photo), variant_hit_rates.order(), deadline=deadline
+                )
+            variant_hit_rates.record(probes.get('variant_attempts', []))
+            if not probes['success']:
+                return None, probes['error']
+            
+            check_deadline(deadline, 'comparación')
+            with timed_stage('group', 'gallery_match'):
+                matches = face_gallery.match_batch(probes['encodings'], probes['landmarks'], self.ADVANCED_CONFIG)
+            
+            faces = [
+                {'face_location': face_location, 'employee': None, 'confidence': 0.0, 'details': None}
+                for face_location in probes['face_locations']
+            ]
+            # Si dos rostros apuntan al mismo empleado, se queda con el de mayor confianza
+            claimed = set()
+            ranked = sorted(
+                (index for index, match in enumerate(matches) if match is not None),
+                key=lambda index: matches[index]['confidence'], reverse=True
+            )
+            for index in ranked:
+                employee = matches[index]['employee']
+                if employee['id'] in claimed:
+                    faces[index]['details'] = 'Empleado ya reconocido en otro rostro del cuadro'
+                    continue
+                claimed.add(employee['id'])
+                faces[index].update(
+                    employee=dict(employee),
+                    confidence=matches[index]['confidence'],
+                    details=matches[index]['details']
+                )
+            
+            return {
+                'faces': faces,
+                'recognized': len(claimed),
+                'threshold_used': self.ADVANCED_CONFIG['min_confidence'],
+                'elapsed_time': time.time() - start_time
+            }, None
             
+        except DeadlineExceeded:
+            return None, "TIMEOUT: Verificación cancelada por tiempo excedido"
+        except WorkerPoolBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Error en marcaje grupal: {e}")
+            return None, f"Error durante la verificación: {str(e)}"
+
+    def score_burst_frame(self, photo):
+        """Calidad de un cuadro medida sobre una copia pequeña, sin detección ni encoding"""
+        proxy = decode_photo(
+            photo,
+            self.ADVANCED_CONFIG['burst_proxy_side'],
+            self.ADVANCED_CONFIG['max_image_pixels']
+        )
+        return self.detect_image_quality(np.array(proxy))
+
+    def advanced_verify_burst(self, photos):
+        """Verificación de una ráfaga: solo los cuadros más nítidos pasan por el pipeline completo"""
+        start_time = time.time()
+        deadline = start_time + self.ADVANCED_CONFIG['verification_timeout']
+        
+        frames = []
+        for index, photo in enumerate(photos[:self.ADVANCED_CONFIG['burst_max_frames']]):
             try:
-                result = future.result(timeout=self.ADVANCED_CONFIG['verification_timeout'])
-                if result.get('success'):
-                    return result.get('data'), None
-                else:
-                    return None, result.get('error')
-            except FutureTimeoutError:
-                future.cancel()
-                return None, "TIMEOUT: Verificación cancelada por tiempo excedido"
+                data = photo_bytes(photo)
+                quality_info = self.score_burst_frame(data)
             except Exception as e:
-                logger.error(f"Error en executor: {e}")
-                return None, f"Error durante la verificación: {str(e)}"
\ No newline at end of file
+                logger.warning(f"Cuadro {index} de la ráfaga descartado: {e}")
+                continue
+            frames.append({'index': index, 'photo': data, 'quality_info': quality_info})
+        
+        # Primero los cuadros aceptables; entre ellos, el más nítido
+        frames.sort(key=lambda frame: (frame['quality_info']['is_acceptable'],
+                                       frame['quality_info']['sharpness']), reverse=True)
+        
+        burst_info = {
+            'frames': len(photos),
+            'scored': len(frames),
+            'evaluated': [],
+            'selected_frame': None,
+            'frame_quality': {
+                frame['index']: round(frame['quality_info']['overall_quality'], 3) for frame in frames
+            },
+        }
+        best_result = None
+        error = 'No se recibieron cuadros válidos'
+        
+        for frame in frames[:self.ADVANCED_CONFIG['burst_candidates']]:
+            if burst_info['evaluated'] and time.time() >= deadline:
+                break
+            result, frame_error = self.advanced_verify(frame['photo'], deadline=deadline)
+            burst_info['evaluated'].append(frame['index'])
+            if frame_error or not result:
+                error = frame_error or error
+                continue
+            
+            if best_result is None or result['best_confidence'] > best_result['best_confidence']:
+                best_result = result
+                burst_info['selected_frame'] = frame['index']
+            
+            # Salida temprana: un match confiable hace innecesario el siguiente cuadro
+            if result['best_match'] and result['best_confidence'] >= self.ADVANCED_CONFIG['burst_early_exit_confidence']:
+                break
+        
+        if best_result is None:
+            return None, error
+        
+        best_result['elapsed_time'] = time.time() - start_time
+        best_result['burst'] = burst_info
+        return best_result, None
+
+
+_worker_service = None
+
+
+def _get_worker_service():
+    # Un servicio por proceso del pool
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = AdvancedFaceRecognitionService()
+    return _worker_service
+
+
+def extract_probe_features(photo, variant_order, deadline):
+    """Punto de entrada del pool de verificación"""
+    return _get_worker_service().extract_probe(photo, variant_order, deadline)
+
+
+def extract_group_features(photo, variant_order, deadline):
+    """Punto de entrada del pool para el marcaje grupal"""
+    return _get_worker_service().extract_group_probes(photo, variant_order, deadline)
+
+
+def kiosk_frame_features(frame, settled_locations, deadline):
+    """Punto de entrada del pool para los cuadros del kiosco en streaming"""
+    return _get_worker_service().extract_kiosk_probes(frame, settled_locations, deadline)
+
+
+def registration_photo_features(idx, photo, variant_order):
+    """Punto de entrada del pool de registro"""
+    return _get_worker_service().process_registration_photo(idx, photo, variant_order)
@@ -0,0 +1,200 @@
+import json
+import struct
+
+import numpy as np
+
+ENCODING_SIZE = 128
+
+# Formato binario de plantillas faciales (versión 2):
+#   cabecera  <4sBBHI> = magic, versión, tipo de dato, reservado, largo de metadatos
+#   metadatos JSON (utf-8) con conteos, largos de landmarks, condiciones de adaptación y radio
+#   arreglos  encodings (N×128), adaptaciones (M×128), landmarks concatenados, centroide (128)
+# La versión 1 no trae centroide ni radio; se calculan al leerla
+TEMPLATE_MAGIC = b'RHFT'
+TEMPLATE_VERSION = 2
+TEMPLATE_SUPPORTED_VERSIONS = (1, 2)
+TEMPLATE_HEADER = struct.Struct('<4sBBHI')
+TEMPLATE_DTYPES = {
+    0: np.dtype('<f4'),
+    1: np.dtype('<f2'),
+}
+TEMPLATE_DTYPE_CODES = {dtype: code for code, dtype in TEMPLATE_DTYPES.items()}
+
+
+def _as_rows(vectors, width=None):
+    rows = [np.asarray(v, dtype=np.float64).ravel() for v in vectors if v is not None]
+    if width is not None:
+        rows = [row for row in rows if row.shape == (width,)]
+    return rows
+
+
+def encoding_centroid(encodings):
+    """Centroide de los encodings principales y radio (distancia máxima de uno de ellos al centroide)"""
+    if not len(encodings):
+        return None, None
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+    centroid = encodings.mean(axis=0)
+    return centroid, _max_distance(encodings, centroid)
+
+
+def _max_distance(encodings, centroid):
+    return float(np.sqrt(((encodings - centroid) ** 2).sum(axis=1)).max())
+
+
+def encode_face_template(face_data, dtype='float32'):
+    """Serializa encodings, adaptaciones y landmarks a un blob binario versionado"""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype not in TEMPLATE_DTYPE_CODES:
+        raise ValueError(f"Tipo de dato no soportado para plantillas: {dtype}")
+
+    encodings = _as_rows(face_data.get('encodings', []) or [], ENCODING_SIZE)
+
+    adaptations = []
+    adaptation_groups = []
+    for adaptation_group in face_data.get('environmental_adaptations', []) or []:
+        conditions = []
+        for adaptation in adaptation_group:
+            try:
+                if 'encoding' not in adaptation:
+                    continue
+                encoding = np.asarray(adaptation['encoding'], dtype=np.float64).ravel()
+            except Exception:
+                continue
+            if encoding.shape != (ENCODING_SIZE,):
+                continue
+            adaptations.append(encoding)
+            conditions.append({
+                'condition': adaptation.get('condition'),
+                'brightness': adaptation.get('brightness'),
+                'contrast': adaptation.get('contrast'),
+            })
+        adaptation_groups.append(conditions)
+
+    landmarks = _as_rows(face_data.get('landmarks', []) or [])
+
+    # El radio se mide sobre los valores ya convertidos al tipo de dato de la plantilla,
+    # que son los que compara la galería
+    radius = None
+    centroids = []
+    if encodings:
+        stored = np.asarray(encodings).astype(dtype).astype(np.float64)
+        centroid = stored.mean(axis=0).astype(dtype).astype(np.float64)
+        radius = _max_distance(stored, centroid)
+        centroids = [centroid]
+
+    metadata = json.dumps({
+        'encoding_size': ENCODING_SIZE,
+        'encodings': len(encodings),
+        'adaptation_groups': adaptation_groups,
+        'landmark_lengths': [len(lm) for lm in landmarks],
+        'radius': radius,
+    }, separators=(',', ':')).encode('utf-8')
+
+    parts = [
+        TEMPLATE_HEADER.pack(TEMPLATE_MAGIC, TEMPLATE_VERSION, TEMPLATE_DTYPE_CODES[dtype], 0, len(metadata)),
+        metadata,
+    ]
+    for rows in (encodings, adaptations, landmarks, centroids):
+        if rows:
+            parts.append(np.concatenate(rows).astype(dtype).tobytes())
+    return b''.join(parts)
+
+
+def decode_face_template(blob):
+    """Lee un blob binario y retorna los datos en el formato de parse_face_data"""
+    blob = bytes(blob)
+    magic, version, dtype_code, _, metadata_len = TEMPLATE_HEADER.unpack_from(blob, 0)
+    if magic != TEMPLATE_MAGIC:
+        raise ValueError("El blob no es una plantilla facial válida")
+    if version not in TEMPLATE_SUPPORTED_VERSIONS:
+        raise ValueError(f"Versión de plantilla no soportada: {version}")
+
+    dtype = TEMPLATE_DTYPES[dtype_code]
+    offset = TEMPLATE_HEADER.size
+    metadata = json.loads(blob[offset:offset + metadata_len])
+    offset += metadata_len
+
+    encoding_size = metadata['encoding_size']
+    num_encodings = metadata['encodings']
+    num_adaptations = sum(len(group) for group in metadata['adaptation_groups'])
+    landmark_lengths = metadata['landmark_lengths']
+
+    values = np.frombuffer(blob, dtype=dtype, offset=offset)
+    encodings_end = num_encodings * encoding_size
+    adaptations_end = encodings_end + num_adaptations * encoding_size
+
+    encodings = values[:encodings_end].reshape(num_encodings, encoding_size)
+    adaptations = values[encodings_end:adaptations_end].reshape(num_adaptations, encoding_size)
+    landmark_bounds = np.cumsum([adaptations_end] + landmark_lengths)
+    landmarks = [values[start:end] for start, end in zip(landmark_bounds[:-1], landmark_bounds[1:])]
+
+    if version >= 2 and num_encodings:
+        centroid_start = landmark_bounds[-1]
+        centroid = values[centroid_start:centroid_start + encoding_size].astype(np.float64)
+        radius = metadata['radius']
+    else:
+        centroid, radius = encoding_centroid(encodings)
+
+    return {
+        'has_encodings': num_encodings > 0,
+        'encodings': encodings,
+        'adaptations': adaptations,
+        'landmarks': landmarks,
+        'centroid': centroid,
+        'radius': radius,
+        'adaptation_groups': metadata['adaptation_groups'],
+    }
+
+
+def parse_face_data(stored_data):
+    """Convierte el JSON de face_encoding en arreglos listos para la galería"""
+    encodings = []
+    for stored_enc in stored_data.get('encodings', []) or []:
+        if stored_enc is None:
+            continue
+        enc = np.asarray(stored_enc, dtype=np.float64).ravel()
+        if enc.shape != (ENCODING_SIZE,):
+            raise ValueError(f"Encoding con dimensión inválida: {enc.shape}")
+        encodings.append(enc)
+
+    # Las adaptaciones inválidas se descartan una a una, igual que en la comparación original
+    adaptations = []
+    for adaptation_group in stored_data.get('environmental_adaptations', []) or []:
+        for adaptation in adaptation_group:
+            try:
+                if 'encoding' not in adaptation:
+                    continue
+                adapt_enc = np.asarray(adaptation['encoding'], dtype=np.float64).ravel()
+                if adapt_enc.shape == (ENCODING_SIZE,):
+                    adaptations.append(adapt_enc)
+            except Exception:
+                continue
+
+    landmarks = []
+    for stored_lm in stored_data.get('landmarks', []) or []:
+        if stored_lm is None:
+            continue
+        try:
+            landmarks.append(np.asarray(stored_lm, dtype=np.float64).flatten())
+        except Exception:
+            continue
+
+    centroid, radius = encoding_centroid(encodings)
+
+    return {
+        'has_encodings': bool(stored_data.get('encodings')),
+        'encodings': encodings,
+        'adaptations': adaptations,
+        'landmarks': landmarks,
+        'centroid': centroid,
+        'radius': radius,
+    }
+
+
+def read_face_data(employee):
+    """Datos faciales del empleado: plantilla binaria o, durante la migración, el JSON antiguo"""
+    if employee.face_template:
+        return decode_face_template(employee.face_template)
+    if employee.face_encoding:
+        return parse_face_data(json.loads(employee.face_encoding))
+    return None
@@ -0,0 +1,91 @@
+import itertools
+
+from .face_detection import box_iou
+
+
+class Track:
+    """Un rostro seguido entre cuadros; el reconocimiento se hace una vez por track"""
+
+    PENDING = 'pending'
+    RECOGNIZED = 'recognized'
+    UNKNOWN = 'unknown'
+
+    def __init__(self, track_id, location):
+        self.id = track_id
+        self.location = location
+        self.hits = 1
+        self.missed = 0
+        self.state = Track.PENDING
+        self.attempts = 0
+        self.employee = None
+        self.confidence = 0.0
+
+    @property
+    def settled(self):
+        """Ya reconocido o descartado: sus próximas detecciones no se vuelven a codificar"""
+        return self.state != Track.PENDING
+
+    def describe(self):
+        return {
+            'track_id': self.id,
+            'box': list(self.location),
+            'state': self.state,
+            'name': self.employee['name'] if self.employee else None,
+            'confidence': round(self.confidence, 4),
+        }
+
+
+class FaceTracker:
+    """Asocia los rostros de cuadros consecutivos por IoU de sus cajas (asignación voraz)"""
+
+    def __init__(self, iou_threshold=0.3, max_missed=5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def settled_locations(self):
+        return [track.location for track in self.tracks if track.settled]
+
+    def update(self, locations):
+        """(track de cada detección, tracks terminados); las detecciones sin pareja abren tracks nuevos"""
+        pairs = sorted(
+            (
+                (box_iou(track.location, location), track_index, location_index)
+                for track_index, track in enumerate(self.tracks)
+                for location_index, location in enumerate(locations)
+            ),
+            reverse=True
+        )
+
+        assigned = [None] * len(locations)
+        matched_tracks = set()
+        for iou, track_index, location_index in pairs:
+            if iou < self.iou_threshold:
+                break
+            if track_index in matched_tracks or assigned[location_index] is not None:
+                continue
+            track = self.tracks[track_index]
+            track.location = locations[location_index]
+            track.hits += 1
+            track.missed = 0
+            assigned[location_index] = track
+            matched_tracks.add(track_index)
+
+        ended = []
+        remaining = []
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    ended.append(track)
+                    continue
+            remaining.append(track)
+
+        for location_index, location in enumerate(locations):
+            if assigned[location_index] is None:
+                assigned[location_index] = Track(next(self._ids), location)
+                remaining.append(assigned[location_index])
+
+        self.tracks = remaining
+        return assigned, ended
@@ -0,0 +1,276 @@
+import atexit
+import logging
+import multiprocessing
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se espera a que un trabajo vencido se detenga solo antes de reciclar sus procesos
+DEFAULT_ABANDON_GRACE = 2.0
+
+_pools = weakref.WeakSet()
+
+
+class DeadlineExceeded(Exception):
+    """La solicitud superó su plazo antes de terminar una etapa"""
+
+
+class WorkerPoolBusy(Exception):
+    """La cola del pool está llena y la solicitud se rechazó"""
+
+
+def check_deadline(deadline, stage):
+    """Aborta la etapa si el plazo absoluto (time.time()) ya venció"""
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceeded(f"Plazo vencido antes de la etapa: {stage}")
+
+
+def _initialize_worker():
+    # Los procesos se crean con 'spawn': Django debe inicializarse en cada uno
+    import django
+    django.setup()
+
+
+class WorkerPool:
+    """Pool persistente y acotado de procesos para las etapas dlib
+
+    La cancelación por plazo es cooperativa (check_deadline entre etapas). Si un trabajo vencido
+    sigue corriendo abandon_grace segundos después, por ejemplo dentro de una llamada a dlib,
+    el pool se recicla: las solicitudes nuevas van a procesos nuevos, los trabajos en curso del
+    pool anterior terminan y luego sus procesos se detienen, incluido el que quedó bloqueado.
+    """
+
+    def __init__(self, name, abandon_grace=DEFAULT_ABANDON_GRACE):
+        self.name = name
+        self.abandon_grace = abandon_grace
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_futures = set()
+        self._workers = None
+        self._queue_size = None
+        self._slots = None
+        self._in_flight = 0
+        self._counters = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'cancelled': 0,
+            'abandoned': 0,
+            'recycled': 0,
+        }
+        _pools.add(self)
+
+    def configure(self, workers, queue_size):
+        """Ajusta el tamaño del pool; con 0 procesos las etapas corren en el hilo que llama"""
+        with self._lock:
+            if (workers, queue_size) == (self._workers, self._queue_size):
+                return
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                self._executor_futures = set()
+            self._workers = workers
+            self._queue_size = queue_size
+            # Capacidad = trabajos en ejecución + trabajos esperando turno
+            self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_size)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_initialize_worker
+                )
+                logger.info(f"Pool de {self.name} iniciado con {self._workers} procesos")
+            return self._executor
+
+    def _count(self, counter, in_flight_delta=0):
+        with self._lock:
+            self._counters[counter] += 1
+            self._in_flight += in_flight_delta
+
+    def _finished(self, future, slots):
+        if future.cancelled():
+            counter = 'cancelled'
+        elif isinstance(future.exception(), DeadlineExceeded):
+            counter = 'abandoned'
+        elif future.exception() is not None:
+            counter = 'failed'
+        else:
+            counter = 'completed'
+        self._count(counter, -1)
+        slots.release()
+
+    def _run_inline(self, function, args, deadline, slots):
+        counter = 'failed'
+        try:
+            result = function(*args, deadline)
+            counter = 'completed'
+            return result
+        except DeadlineExceeded:
+            counter = 'abandoned'
+            self._count('timed_out')
+            raise
+        finally:
+            self._count(counter, -1)
+            slots.release()
+
+    def run(self, function, *args, deadline):
+        """Ejecuta function(*args, deadline) en el pool y espera como máximo hasta el plazo"""
+        slots = self._slots
+        if slots is None:
+            raise RuntimeError("WorkerPool.configure() debe llamarse antes de run()")
+
+        if not slots.acquire(blocking=False):
+            self._count('rejected')
+            raise WorkerPoolBusy(f"Cola de {self.name} llena")
+        self._count('submitted', 1)
+
+        if not self._workers:
+            return self._run_inline(function, args, deadline, slots)
+
+        future = self._submit(function, args + (deadline,), slots)
+
+        try:
+            return future.result(timeout=max(deadline - time.time(), 0))
+        except (FutureTimeoutError, DeadlineExceeded):
+            # Si aún no empezó se descarta de la cola; si está corriendo, se detiene
+            # por sí mismo en la próxima verificación de plazo o se recicla el pool
+            if not future.cancel() and not future.done():
+                self._watch_abandoned(future)
+            self._count('timed_out')
+            raise DeadlineExceeded("Verificación cancelada por tiempo excedido")
+        except BrokenProcessPool:
+            self._discard_broken_executor(future.executor)
+            raise
+
+    def map(self, function, argument_lists):
+        """function(*args) para cada elemento, esperando turno en vez de rechazar; resultados en orden"""
+        return list(self.imap(function, argument_lists))
+
+    def imap(self, function, argument_lists):
+        """Como map(), pero entrega cada resultado apenas está listo (en orden)"""
+        slots = self._slots
+        if slots is None:
+            raise RuntimeError("WorkerPool.configure() debe llamarse antes de imap()")
+
+        if not self._workers:
+            for args in argument_lists:
+                self._count('submitted')
+                result = function(*args)
+                self._count('completed')
+                yield result
+            return
+
+        futures = []
+        for args in argument_lists:
+            slots.acquire()
+            self._count('submitted', 1)
+            futures.append(self._submit(function, tuple(args), slots))
+        try:
+            for future in futures:
+                yield future.result()
+        except BrokenProcessPool:
+            self._discard_broken_executor(futures[0].executor)
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _submit(self, function, args, slots):
+        try:
+            executor = self._get_executor()
+            future = executor.submit(function, *args)
+        except Exception:
+            self._count('failed', -1)
+            slots.release()
+            raise
+        future.executor = executor
+        with self._lock:
+            if executor is self._executor:
+                self._executor_futures.add(future)
+        # El cupo se libera cuando el trabajo termina de verdad, no cuando el cliente deja de esperar
+        future.add_done_callback(lambda done: self._finished(done, slots))
+        return future
+
+    def _watch_abandoned(self, future):
+        timer = threading.Timer(self.abandon_grace, self._recycle_if_stuck, args=(future,))
+        timer.daemon = True
+        timer.start()
+
+    def _recycle_if_stuck(self, future):
+        if future.done():
+            return
+        with self._lock:
+            if future.executor is not self._executor:
+                return  # El pool ya se recicló por otro trabajo
+            executor, futures = self._executor, self._executor_futures
+            self._executor = None
+            self._executor_futures = set()
+            self._counters['recycled'] += 1
+        logger.warning(f"Pool de {self.name}: trabajo vencido sigue corriendo, se reciclan sus procesos")
+
+        # Los demás trabajos del pool anterior terminan (o vencen) antes de detener sus procesos
+        others = [other for other in futures if other is not future]
+        wait_futures(others, timeout=max(self.abandon_grace * 10, 1))
+        _terminate_executor(executor)
+
+    def _discard_broken_executor(self, executor):
+        with self._lock:
+            if executor is not self._executor:
+                return  # Ya se descartó o se recicló
+            self._executor = None
+            self._executor_futures = set()
+        logger.error(f"Pool de {self.name} roto, se recreará en la próxima solicitud")
+
+    def stats(self):
+        """Profundidad de cola y contadores para monitoreo"""
+        with self._lock:
+            workers = self._workers or 0
+            return dict(
+                self._counters,
+                workers=workers,
+                capacity=max(workers, 1) + (self._queue_size or 0),
+                in_flight=self._in_flight,
+                queue_depth=max(self._in_flight - max(workers, 1), 0),
+            )
+
+    def shutdown(self, wait=True):
+        """Detiene los procesos; con wait espera a que terminen para no dejarlos a medio cerrar"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._executor_futures = set()
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _terminate_executor(executor):
+    """Detiene los procesos de un pool aunque estén ocupados; sus trabajos fallan con BrokenProcessPool"""
+    # ProcessPoolExecutor no ofrece una forma pública de detener un proceso ocupado
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    executor.shutdown(wait=True, cancel_futures=True)
+
+
+@atexit.register
+def shutdown_pools():
+    """Cierre ordenado de todos los pools al terminar el intérprete"""
+    for pool in list(_pools):
+        try:
+            pool.shutdown()
+        except Exception as e:
+            logger.warning(f"No se pudo cerrar el pool de {pool.name}: {e}")
+
+
+verification_pool = WorkerPool('verificación')
+# Pool separado y más pequeño: el registro no puede quitarle procesos a la verificación
+registration_pool = WorkerPool('registro')
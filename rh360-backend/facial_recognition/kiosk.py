@@ -0,0 +1,220 @@
+"""Kiosco manos libres por WebSocket (ws://.../ws/kiosk/?type=entrada&device_id=...)
+
+El kiosco envía cuadros de baja resolución (JPEG binario, o JSON {"type": "frame", "frame": base64}).
+Cada cuadro solo pasa por detección HOG; los rostros se siguen entre cuadros por IoU y el
+encoding más la comparación con la galería se hacen una vez por track nuevo. Los reconocimientos
+se envían como eventos y la asistencia se registra una vez por track.
+"""
+import asyncio
+import functools
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .async_views import acheck_duplicate_attendance, run_in_executor
+from .face_gallery import face_gallery
+from .face_images import photo_bytes
+from .face_metrics import timed_stage
+from .face_recognition_utils import kiosk_frame_features
+from .face_tracking import FaceTracker, Track
+from .face_workers import DeadlineExceeded, WorkerPoolBusy, verification_pool
+from .models import AttendanceRecord, Employee
+from .views import ADVANCED_CONFIG, _employee_payload, _face_record_values
+
+logger = logging.getLogger(__name__)
+
+KIOSK_PATH = '/ws/kiosk/'
+
+
+class KioskSession:
+    """Estado de una conexión de kiosco: tracker de rostros, tipo de marcaje y estadísticas"""
+
+    def __init__(self, attendance_type='entrada', device_id='', config=ADVANCED_CONFIG):
+        self.attendance_type = attendance_type
+        self.device_id = device_id
+        self.config = config
+        self.tracker = FaceTracker(config['kiosk_iou_threshold'], config['kiosk_max_missed_frames'])
+        self.stats = {
+            'frames': 0,
+            'dropped': 0,
+            'busy': 0,
+            'timeouts': 0,
+            'tracks': 0,
+            'encoded_faces': 0,
+            'recognized': 0,
+            'attendance_recorded': 0,
+        }
+
+    def handle_message(self, message):
+        """Cuadro recibido en el mensaje, o None si era de configuración"""
+        if message.get('bytes'):
+            return message['bytes']
+        try:
+            data = json.loads(message.get('text') or '{}')
+        except ValueError:
+            return None
+        if data.get('type') == 'config' and data.get('attendance_type'):
+            self.attendance_type = data['attendance_type'].lower()
+        elif data.get('type') == 'frame' and data.get('frame'):
+            return photo_bytes(data['frame'])
+        return None
+
+    async def process_frame(self, frame):
+        """Eventos a enviar al kiosco por este cuadro"""
+        self.stats['frames'] += 1
+        verification_pool.configure(self.config['verification_workers'], self.config['verification_queue_size'])
+        deadline = time.time() + self.config['kiosk_frame_timeout']
+
+        try:
+            with timed_stage('kiosk', 'worker'):
+                probes = await run_in_executor(functools.partial(
+                    verification_pool.run, kiosk_frame_features, frame,
+                    self.tracker.settled_locations(), deadline=deadline
+                ))
+        except WorkerPoolBusy:
+            self.stats['busy'] += 1
+            return [{'event': 'busy'}]
+        except DeadlineExceeded:
+            self.stats['timeouts'] += 1
+            return []
+        if not probes['success']:
+            return [{'event': 'error', 'message': probes['error']}]
+
+        tracks, ended = self.tracker.update(probes['face_locations'])
+        self.stats['tracks'] += sum(1 for track in tracks if track.hits == 1)
+        self.stats['encoded_faces'] += len(probes['encoded_indices'])
+        events = [{'event': 'track_lost', 'track_id': track.id} for track in ended]
+
+        # Solo los rostros de tracks sin resolver, codificados en este cuadro, pasan por la galería
+        pending = [
+            (tracks[index], encoding, landmarks)
+            for index, encoding, landmarks in zip(probes['encoded_indices'], probes['encodings'], probes['landmarks'])
+            if not tracks[index].settled
+        ]
+        if pending:
+            with timed_stage('kiosk', 'gallery_match'):
+                matches = await run_in_executor(
+                    face_gallery.match_batch,
+                    [encoding for _, encoding, _ in pending],
+                    [landmarks for _, _, landmarks in pending],
+                    self.config
+                )
+            for (track, _, _), match in zip(pending, matches):
+                events.extend(await self._resolve(track, match))
+
+        events.append({
+            'event': 'tracks',
+            'frame_size': probes['frame_size'],
+            'tracks': [track.describe() for track in self.tracker.tracks if track.missed == 0],
+        })
+        return events
+
+    async def _resolve(self, track, match):
+        if match is None:
+            track.attempts += 1
+            if track.attempts < self.config['kiosk_recognition_attempts']:
+                return []
+            track.state = Track.UNKNOWN
+            return [{'event': 'unknown', 'track_id': track.id}]
+
+        track.state = Track.RECOGNIZED
+        track.employee = match['employee']
+        track.confidence = match['confidence']
+        self.stats['recognized'] += 1
+
+        employee = await Employee.objects.aget(id=match['employee']['id'])
+        attendance = await self._record_attendance(employee, match['confidence'])
+        return [{
+            'event': 'recognized',
+            'track_id': track.id,
+            'employee': _employee_payload(employee),
+            'confidence': f"{match['confidence']:.1%}",
+            'attendance_type': self.attendance_type,
+            'attendance': attendance,
+        }]
+
+    async def _record_attendance(self, employee, confidence):
+        """Un registro por track, con la misma verificación de duplicados que verify-face"""
+        try:
+            with timed_stage('kiosk', 'db_write'):
+                existing_record = await acheck_duplicate_attendance(employee, self.attendance_type, timezone.now())
+                if existing_record:
+                    return {'recorded': False, 'duplicate_found': True}
+
+                values = _face_record_values(employee, self.attendance_type, confidence, None, None, '')
+                values['notes'] = f'Kiosco manos libres - Confianza: {confidence:.1%}'
+                values['device_info'] = self.device_id
+                attendance_record = await AttendanceRecord.objects.acreate(**values)
+            self.stats['attendance_recorded'] += 1
+            return {
+                'recorded': True,
+                'record_id': str(attendance_record.id),
+                'timestamp': attendance_record.timestamp.strftime('%d/%m/%Y %H:%M:%S'),
+            }
+        finally:
+            # Fuera del ciclo de una solicitud nadie cierra la conexión del hilo del ORM
+            await sync_to_async(close_old_connections)()
+
+
+async def kiosk_websocket(scope, receive, send):
+    """Aplicación ASGI del kiosco: recibe cuadros y envía eventos de seguimiento y reconocimiento"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    params = parse_qs(scope.get('query_string', b'').decode())
+    session = KioskSession(
+        attendance_type=params.get('type', ['entrada'])[0].lower(),
+        device_id=params.get('device_id', [''])[0]
+    )
+    await send({'type': 'websocket.accept'})
+    await send_event(send, {
+        'event': 'ready',
+        'attendance_type': session.attendance_type,
+        'frame_max_side': session.config['kiosk_frame_max_side'],
+    })
+
+    # Solo se procesa el cuadro más reciente: los que llegan mientras se procesa otro se descartan
+    latest = {'frame': None}
+    frame_ready = asyncio.Event()
+
+    async def process_frames():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame, latest['frame'] = latest['frame'], None
+            try:
+                events = await session.process_frame(frame)
+            except Exception as e:
+                logger.error(f"Error procesando cuadro del kiosco: {e}")
+                events = [{'event': 'error', 'message': str(e)}]
+            for event in events:
+                await send_event(send, event)
+
+    processor = asyncio.create_task(process_frames())
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message['type'] != 'websocket.receive':
+                continue
+            frame = session.handle_message(message)
+            if frame is None:
+                continue
+            if latest['frame'] is not None:
+                session.stats['dropped'] += 1
+            latest['frame'] = frame
+            frame_ready.set()
+    finally:
+        processor.cancel()
+        logger.info(f"Kiosco {session.device_id or 'sin id'} desconectado: {session.stats}")
+
+
+async def send_event(send, event):
+    await send({'type': 'websocket.send', 'text': json.dumps(event, ensure_ascii=False)})
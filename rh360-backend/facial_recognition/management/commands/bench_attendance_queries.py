@@ -0,0 +1,259 @@
+import json
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from facial_recognition.benchmarks import latency_summary
+from facial_recognition.models import AttendanceRecord, Employee
+from facial_recognition.views import _duplicate_queryset
+
+# Empleados sintéticos: inactivos, para que no aparezcan en búsquedas ni en la galería
+BENCH_PREFIX = 'BENCH-'
+RECORDS_DAYS = 7
+RECORDS_LIMIT = 100
+
+
+@contextmanager
+def explicit_timestamps():
+    """bulk_create con timestamps propios: auto_now_add los reemplazaría por la hora actual"""
+    field = AttendanceRecord._meta.get_field('timestamp')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def seed_employees(count):
+    Employee.objects.bulk_create([
+        Employee(
+            employee_id=f'{BENCH_PREFIX}{index:06d}', rut=f'{BENCH_PREFIX}{index:06d}',
+            name=f'Benchmark {index}', email='', department='Benchmark', position='Benchmark',
+            is_active=False
+        )
+        for index in range(count)
+    ])
+    return list(Employee.objects.filter(employee_id__startswith=BENCH_PREFIX).order_by('employee_id'))
+
+
+def seed_records(employees, rows, days, batch_size, rng, now):
+    """Registros repartidos al azar entre los empleados y los últimos days días"""
+    seconds = days * 86400
+    with explicit_timestamps():
+        for start in range(0, rows, batch_size):
+            size = min(batch_size, rows - start)
+            owners = rng.integers(0, len(employees), size)
+            offsets = rng.integers(0, seconds, size)
+            entries = rng.random(size) < 0.5
+            AttendanceRecord.objects.bulk_create([
+                AttendanceRecord(
+                    employee=employees[owner],
+                    attendance_type='entrada' if entry else 'salida',
+                    timestamp=now - timedelta(seconds=int(offset)),
+                    verification_method='manual',
+                    notes='bench_attendance_queries'
+                )
+                for owner, offset, entry in zip(owners, offsets, entries)
+            ], batch_size=batch_size)
+            yield start + size
+
+
+def using_test_database():
+    """La conexión ya apunta a una base de pruebas (la del test runner o una test_*)"""
+    name = str(connection.settings_dict['NAME'])
+    if connection.vendor == 'sqlite' and connection.creation.is_in_memory_db(name):
+        return True
+    return name.startswith('test_') or name == connection.settings_dict['TEST'].get('NAME')
+
+
+def delete_seeded():
+    AttendanceRecord.objects.filter(employee__employee_id__startswith=BENCH_PREFIX).delete()
+    Employee.objects.filter(employee_id__startswith=BENCH_PREFIX).delete()
+
+
+def existing_indexes():
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, AttendanceRecord._meta.db_table)
+    return {name for name, constraint in constraints.items() if constraint['index']}
+
+
+def set_indexes(enabled):
+    """Crea o elimina los índices de AttendanceRecord.Meta.indexes"""
+    present = existing_indexes()
+    with connection.schema_editor() as editor:
+        for index in AttendanceRecord._meta.indexes:
+            if enabled and index.name not in present:
+                editor.add_index(AttendanceRecord, index)
+            elif not enabled and index.name in present:
+                editor.remove_index(AttendanceRecord, index)
+    analyze_table()
+
+
+def analyze_table():
+    """Actualiza las estadísticas del planificador después de cargar datos o cambiar índices"""
+    table = connection.ops.quote_name(AttendanceRecord._meta.db_table)
+    statement = f'ANALYZE TABLE {table}' if connection.vendor == 'mysql' else f'ANALYZE {table}'
+    with connection.cursor() as cursor:
+        cursor.execute(statement)
+        if connection.vendor == 'mysql':
+            cursor.fetchall()
+
+
+def duplicate_query(employee, attendance_type, timestamp):
+    """La consulta de check_duplicate_attendance (first() ordena por -timestamp)"""
+    return _duplicate_queryset(employee, attendance_type, timestamp, 5).order_by('-timestamp')[:1]
+
+
+def records_query(now):
+    """La consulta de get_attendance_records con sus valores por defecto"""
+    return AttendanceRecord.objects.select_related('employee').filter(
+        timestamp__gte=now - timedelta(days=RECORDS_DAYS)
+    ).order_by('-timestamp')
+
+
+def measure_phase(samples, now, analyze):
+    """Latencias y planes de las consultas de duplicados y de listado"""
+    duplicate_latencies = []
+    for employee, attendance_type, timestamp in samples:
+        start = time.perf_counter()
+        list(duplicate_query(employee, attendance_type, timestamp))
+        duplicate_latencies.append(time.perf_counter() - start)
+
+    records_latencies = []
+    for _ in range(max(1, len(samples) // 10)):
+        start = time.perf_counter()
+        queryset = records_query(now)
+        queryset.count()
+        list(queryset[:RECORDS_LIMIT])
+        records_latencies.append(time.perf_counter() - start)
+
+    employee, attendance_type, timestamp = samples[0]
+    explain_options = {'analyze': True} if analyze else {}
+    return {
+        'duplicate_check': dict(
+            latency_summary(duplicate_latencies),
+            explain=duplicate_query(employee, attendance_type, timestamp).explain(**explain_options)
+        ),
+        'attendance_records': dict(
+            latency_summary(records_latencies),
+            explain=records_query(now)[:RECORDS_LIMIT].explain(**explain_options)
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Carga millones de registros de asistencia sintéticos y mide la consulta de duplicados y el '
+            'listado de registros sin y con los índices de AttendanceRecord, con su EXPLAIN. '
+            'Como elimina temporalmente los índices de la tabla, corre en una base de pruebas desechable '
+            '(test_*, con las migraciones aplicadas) salvo que se indique --i-know')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000,
+                            help='Registros sintéticos a cargar')
+        parser.add_argument('--employees', type=int, default=1000,
+                            help='Empleados sintéticos entre los que se reparten los registros')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Días hacia atrás en que se reparten los registros')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Consultas de duplicados por fase')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--reuse', action='store_true',
+                            help='Reutilizar los datos sintéticos de una ejecución con --keep')
+        parser.add_argument('--keep', action='store_true',
+                            help='No borrar los datos sintéticos al terminar')
+        parser.add_argument('--analyze', action='store_true',
+                            help='EXPLAIN ANALYZE en motores que lo soportan (MySQL 8, PostgreSQL)')
+        parser.add_argument('--json', default=None,
+                            help='Archivo donde guardar los resultados en JSON')
+        parser.add_argument('--i-know', action='store_true',
+                            help='Correr sobre la base configurada (solo una base dedicada a pruebas): '
+                                 'sus índices se eliminan durante la medición')
+
+    def handle(self, *args, **options):
+        if options['i_know'] or using_test_database():
+            self.benchmark(options)
+            return
+        if options['reuse'] or options['keep']:
+            raise CommandError('--reuse y --keep usan la base configurada: agrega --i-know si es una base de pruebas')
+
+        old_name = connection.settings_dict['NAME']
+        self.stdout.write('Creando una base de pruebas desechable...')
+        connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark(self, options):
+        rng = np.random.default_rng(options['seed'])
+        now = timezone.now()
+        employees = list(Employee.objects.filter(employee_id__startswith=BENCH_PREFIX).order_by('employee_id'))
+
+        if options['reuse']:
+            if not employees:
+                raise CommandError('No hay datos sintéticos que reutilizar; ejecuta primero con --keep')
+        else:
+            if employees:
+                raise CommandError(f'Ya hay empleados {BENCH_PREFIX}*: usa --reuse o bórralos antes')
+            if options['rows'] < 1 or options['employees'] < 1:
+                raise CommandError('--rows y --employees deben ser positivos')
+            self.stdout.write(f"Cargando {options['rows']} registros para {options['employees']} empleados...")
+            start = time.perf_counter()
+            employees = seed_employees(options['employees'])
+            report_every = max(options['rows'] // 10, 1)
+            reported = 0
+            for loaded in seed_records(employees, options['rows'], options['days'], options['batch_size'], rng, now):
+                if loaded - reported >= report_every or loaded == options['rows']:
+                    reported = loaded
+                    self.stdout.write(f'  {loaded} registros ({time.perf_counter() - start:.0f}s)')
+
+        # Mismas consultas en ambas fases; timestamps al azar, como los de una inserción normal
+        seconds = options['days'] * 86400
+        samples = [
+            (employees[int(rng.integers(len(employees)))], str(rng.choice(['entrada', 'salida'])),
+             now - timedelta(seconds=int(rng.integers(seconds))))
+            for _ in range(options['queries'])
+        ]
+
+        results = {
+            'vendor': connection.vendor,
+            'rows': AttendanceRecord.objects.filter(employee__employee_id__startswith=BENCH_PREFIX).count(),
+            'employees': len(employees),
+            'queries': options['queries'],
+            'indexes': [index.name for index in AttendanceRecord._meta.indexes],
+            'phases': {},
+        }
+        try:
+            for phase, enabled in (('without_indexes', False), ('with_indexes', True)):
+                set_indexes(enabled)
+                results['phases'][phase] = measure_phase(samples, now, options['analyze'])
+                self._report(phase, results['phases'][phase])
+        finally:
+            set_indexes(True)
+            if not options['keep']:
+                delete_seeded()
+
+        for query in ('duplicate_check', 'attendance_records'):
+            before = results['phases']['without_indexes'][query]['p50_ms']
+            after = results['phases']['with_indexes'][query]['p50_ms']
+            self.stdout.write(f"{query}: p50 {before:.2f} ms -> {after:.2f} ms (x{before / after:.1f})")
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
+
+    def _report(self, phase, summary):
+        self.stdout.write(f'--- {phase} ---')
+        for query, entry in summary.items():
+            self.stdout.write(
+                f"{query:>18}: p50 {entry['p50_ms']:.2f} ms, p95 {entry['p95_ms']:.2f} ms, "
+                f"p99 {entry['p99_ms']:.2f} ms"
+            )
+            self.stdout.write(entry['explain'])
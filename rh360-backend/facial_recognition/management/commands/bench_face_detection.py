@@ -0,0 +1,108 @@
+import json
+import os
+
+import face_recognition
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from facial_recognition.benchmarks import latency_summary, timed
+from facial_recognition.face_detection import box_iou
+from facial_recognition.face_recognition_utils import AdvancedFaceRecognitionService
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+class Command(BaseCommand):
+    help = 'Compara detección a resolución completa contra detección sobre un proxy reducido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photos-dir', required=True,
+                            help='Directorio con fotos de rostros (jpg, png, webp)')
+        parser.add_argument('--max-side', type=int, default=400,
+                            help='Lado máximo del proxy de detección')
+        parser.add_argument('--source-side', type=int, default=1200,
+                            help='Lado máximo de la imagen fuente (1200 en verificación, 1000 en registro)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Repeticiones por foto para medir latencia')
+        parser.add_argument('--json', default=None,
+                            help='Archivo donde guardar los resultados en JSON')
+
+    def handle(self, *args, **options):
+        photos_dir = options['photos_dir']
+        if not os.path.isdir(photos_dir):
+            raise CommandError(f'No existe el directorio {photos_dir}')
+
+        paths = sorted(
+            os.path.join(photos_dir, name) for name in os.listdir(photos_dir)
+            if name.lower().endswith(PHOTO_EXTENSIONS)
+        )
+        if not paths:
+            raise CommandError(f'No hay fotos en {photos_dir}')
+
+        full_service = AdvancedFaceRecognitionService()
+        full_service.ADVANCED_CONFIG['detection_max_side'] = 0
+        proxy_service = AdvancedFaceRecognitionService()
+        proxy_service.ADVANCED_CONFIG['detection_max_side'] = options['max_side']
+        proxy_service.ADVANCED_CONFIG['detection_full_resolution_fallback'] = False
+
+        latencies = {'full': [], 'proxy': []}
+        found = {'full': 0, 'proxy': 0}
+        agreements = 0
+        ious = []
+        encoding_distances = []
+
+        for path in paths:
+            image = Image.open(path).convert('RGB')
+            image.thumbnail((options['source_side'], options['source_side']), Image.Resampling.LANCZOS)
+
+            locations = {}
+            for mode, service in (('full', full_service), ('proxy', proxy_service)):
+                for _ in range(options['repeat']):
+                    (location, image_array, _), elapsed = timed(service.detect_face_in_variants, image)
+                    latencies[mode].append(elapsed)
+                locations[mode] = (location, image_array)
+                found[mode] += location is not None
+
+            full_location, full_array = locations['full']
+            proxy_location, proxy_array = locations['proxy']
+            agreements += (full_location is None) == (proxy_location is None)
+            if full_location is None or proxy_location is None:
+                continue
+
+            # Paridad aguas abajo: ambos encodings se calculan a resolución completa
+            ious.append(box_iou(full_location, proxy_location))
+            full_encoding = face_recognition.face_encodings(full_array, [full_location], num_jitters=1)
+            proxy_encoding = face_recognition.face_encodings(proxy_array, [proxy_location], num_jitters=1)
+            if full_encoding and proxy_encoding:
+                encoding_distances.append(float(np.linalg.norm(full_encoding[0] - proxy_encoding[0])))
+
+        results = {
+            'photos': len(paths),
+            'max_side': options['max_side'],
+            'source_side': options['source_side'],
+            'full': dict(latency_summary(latencies['full']), detection_rate=found['full'] / len(paths)),
+            'proxy': dict(latency_summary(latencies['proxy']), detection_rate=found['proxy'] / len(paths)),
+            'agreement': agreements / len(paths),
+            'mean_iou': float(np.mean(ious)) if ious else None,
+            'mean_encoding_distance': float(np.mean(encoding_distances)) if encoding_distances else None,
+            'max_encoding_distance': float(np.max(encoding_distances)) if encoding_distances else None,
+        }
+
+        for mode, label in (('full', 'completa'), ('proxy', f"proxy {options['max_side']}px")):
+            summary = results[mode]
+            self.stdout.write(
+                f"{label:>14}: p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+                f"detección {summary['detection_rate']:.1%}"
+            )
+        self.stdout.write(f"Coincidencia de detección: {results['agreement']:.1%}")
+        if ious:
+            self.stdout.write(
+                f"IoU medio {results['mean_iou']:.3f}, distancia media entre encodings "
+                f"{results['mean_encoding_distance']:.4f} (máx {results['max_encoding_distance']:.4f})"
+            )
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
@@ -0,0 +1,93 @@
+import json
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from facial_recognition.benchmarks import (
+    best_match_index, latency_summary, synthetic_gallery, synthetic_probes, timed
+)
+from facial_recognition.face_index import IVFIndex
+from facial_recognition.face_recognition_utils import AdvancedFaceRecognitionService
+
+
+class Command(BaseCommand):
+    help = 'Compara recall y latencia del índice IVF contra el escaneo exacto de la galería'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=20000,
+                            help='Empleados en la galería sintética')
+        parser.add_argument('--queries', type=int, default=200,
+                            help='Número de consultas')
+        parser.add_argument('--nprobe', default='4,8,16,32',
+                            help='Valores de nprobe separados por coma')
+        parser.add_argument('--top-k', type=int, default=None,
+                            help='Candidatos por consulta (por defecto ann_top_k)')
+        parser.add_argument('--nlist', type=int, default=0,
+                            help='Número de listas IVF (0 = automático)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', default=None,
+                            help='Archivo donde guardar los resultados en JSON')
+
+    def handle(self, *args, **options):
+        config = AdvancedFaceRecognitionService().ADVANCED_CONFIG
+        top_k = options['top_k'] or config['ann_top_k']
+
+        self.stdout.write(f"Generando galería sintética de {options['employees']} empleados...")
+        snapshot, centers, landmark_shapes = synthetic_gallery(options['employees'], seed=options['seed'])
+        probes, probe_landmarks, _ = synthetic_probes(
+            centers, landmark_shapes, options['queries'], seed=options['seed'] + 1
+        )
+
+        index, build_time = timed(IVFIndex.train, snapshot.encodings, nlist=options['nlist'] or None)
+        index.add(snapshot.encodings, snapshot.encoding_owner)
+        self.stdout.write(f'Índice IVF: {index.nlist} listas, entrenado en {build_time:.1f}s')
+
+        # Línea base: escaneo exacto de toda la galería
+        exact_best = []
+        exact_latencies = []
+        for probe, landmarks in zip(probes, probe_landmarks):
+            scores, elapsed = timed(snapshot.score, probe, landmarks, config)
+            exact_best.append(best_match_index(scores))
+            exact_latencies.append(elapsed)
+
+        results = {
+            'employees': snapshot.size,
+            'encodings': int(len(snapshot.encodings)),
+            'queries': len(probes),
+            'nlist': index.nlist,
+            'top_k': top_k,
+            'exact': latency_summary(exact_latencies),
+            'ann': [],
+        }
+        self._report('exacto', results['exact'], None)
+
+        matched_queries = sum(1 for best in exact_best if best >= 0)
+        for nprobe in [int(value) for value in options['nprobe'].split(',')]:
+            latencies = []
+            hits = 0
+            for probe, landmarks, expected in zip(probes, probe_landmarks, exact_best):
+                def ann_match():
+                    candidates = np.sort(index.search(probe, nprobe, top_k))
+                    scores = snapshot.subset(candidates).score(probe, landmarks, config)
+                    best = best_match_index(scores)
+                    return candidates[best] if best >= 0 else -1
+
+                found, elapsed = timed(ann_match)
+                latencies.append(elapsed)
+                hits += expected >= 0 and found == expected
+
+            recall = hits / matched_queries if matched_queries else 1.0
+            summary = latency_summary(latencies)
+            results['ann'].append({'nprobe': nprobe, 'recall': recall, **summary})
+            self._report(f'IVF nprobe={nprobe}', summary, recall)
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
+
+    def _report(self, label, summary, recall):
+        recall_text = f', recall {recall:.1%}' if recall is not None else ''
+        self.stdout.write(
+            f"{label:>16}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms{recall_text}"
+        )
@@ -0,0 +1,182 @@
+import json
+import platform
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from facial_recognition.benchmarks import (
+    StaticGallery, latency_summary, snapshot_nbytes, stored_face_data, synthetic_gallery,
+    synthetic_probes, timed, traced_peak
+)
+from facial_recognition.face_recognition_utils import AdvancedFaceRecognitionService
+
+# Métricas que se comparan contra la línea base al buscar regresiones
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'peak_bytes')
+# Llamadas repetidas bajo tracemalloc para medir el pico de memoria
+MEMORY_TRACED_CALLS = 5
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia y memoria de advanced_face_comparison y de la etapa de matching de advanced_verify'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000,100000',
+                            help='Tamaños de galería sintética separados por coma')
+        parser.add_argument('--queries', type=int, default=50,
+                            help='Consultas por tamaño de galería')
+        parser.add_argument('--legacy-max-employees', type=int, default=1000,
+                            help='Mayor galería en la que se mide el escaneo empleado por empleado '
+                                 'con advanced_face_comparison')
+        parser.add_argument('--legacy-queries', type=int, default=5,
+                            help='Consultas del escaneo empleado por empleado')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', default=None,
+                            help='Archivo donde guardar los resultados en JSON')
+        parser.add_argument('--baseline', default=None,
+                            help='JSON de una ejecución anterior contra el que buscar regresiones')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Aumento relativo permitido respecto a la línea base')
+
+    def handle(self, *args, **options):
+        service = AdvancedFaceRecognitionService()
+        config = service.ADVANCED_CONFIG
+        sizes = [int(value) for value in options['sizes'].split(',')]
+
+        results = {
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+            },
+            'queries': options['queries'],
+            'seed': options['seed'],
+            'sizes': [],
+        }
+
+        for size in sizes:
+            self.stdout.write(f'Generando galería sintética de {size} empleados...')
+            (snapshot, centers, landmark_shapes), build_time = timed(
+                synthetic_gallery, size, seed=options['seed']
+            )
+            probes, probe_landmarks, _ = synthetic_probes(
+                centers, landmark_shapes, options['queries'], seed=options['seed'] + 1
+            )
+            entry = {
+                'employees': snapshot.size,
+                'encodings': int(len(snapshot.encodings)),
+                'adaptations': int(len(snapshot.adaptations)),
+                'gallery_bytes': snapshot_nbytes(snapshot),
+                'build_seconds': build_time,
+            }
+            self.stdout.write(
+                f"  {entry['encodings']} encodings, {entry['gallery_bytes'] / 2 ** 20:.1f} MiB "
+                f'en {build_time:.1f}s'
+            )
+
+            # Etapa de matching de advanced_verify, con y sin la pasada gruesa
+            entry['gallery_match'] = self._measure_match(snapshot, probes, probe_landmarks, config)
+            self._report('gallery_match', entry['gallery_match'])
+            entry['gallery_match_exhaustive'] = self._measure_match(
+                snapshot, probes, probe_landmarks, dict(config, coarse_enabled=False)
+            )
+            self._report('exhaustivo', entry['gallery_match_exhaustive'])
+
+            entry['advanced_face_comparison'] = self._measure_comparison(
+                service, snapshot, probes, probe_landmarks, options['seed']
+            )
+            self._report('por empleado', entry['advanced_face_comparison'])
+
+            if size <= options['legacy_max_employees']:
+                entry['legacy_scan'] = self._measure_legacy_scan(
+                    service, snapshot, probes[:options['legacy_queries']],
+                    probe_landmarks[:options['legacy_queries']]
+                )
+                self._report('escaneo antiguo', entry['legacy_scan'])
+            else:
+                entry['legacy_scan'] = None
+
+            results['sizes'].append(entry)
+            del snapshot
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = find_regressions(baseline, results, options['tolerance'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"  {regression['employees']} empleados, {regression['stage']} {regression['metric']}: "
+                    f"{regression['baseline']:.2f} -> {regression['current']:.2f}"
+                ))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regresiones sobre la línea base')
+            self.stdout.write(self.style.SUCCESS('Sin regresiones respecto a la línea base'))
+
+    def _measure_match(self, snapshot, probes, probe_landmarks, config):
+        gallery = StaticGallery(snapshot)
+        # La primera consulta queda fuera de la medición (calienta cachés de CPU y del índice)
+        gallery.match(probes[0], probe_landmarks[0], config)
+        calls = [(probe, landmarks, config) for probe, landmarks in zip(probes, probe_landmarks)]
+        return measure(gallery.match, calls)
+
+    def _measure_comparison(self, service, snapshot, probes, probe_landmarks, seed):
+        # Una llamada por consulta contra un empleado al azar, incluyendo el parseo del JSON guardado
+        rng = np.random.default_rng(seed + 2)
+        employees = rng.integers(0, snapshot.size, len(probes))
+        calls = [
+            (stored_face_data(snapshot, index), probe, landmarks)
+            for index, probe, landmarks in zip(employees, probes, probe_landmarks)
+        ]
+        return measure(service.advanced_face_comparison, calls)
+
+    def _measure_legacy_scan(self, service, snapshot, probes, probe_landmarks):
+        # Verificación anterior a la galería: advanced_face_comparison contra cada empleado
+        stored = [stored_face_data(snapshot, index) for index in range(snapshot.size)]
+
+        def scan(probe, landmarks):
+            return [service.advanced_face_comparison(data, probe, landmarks) for data in stored]
+
+        return measure(scan, list(zip(probes, probe_landmarks)))
+
+    def _report(self, label, summary):
+        self.stdout.write(
+            f"{label:>18}: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, "
+            f"pico {summary['peak_bytes'] / 2 ** 20:.1f} MiB"
+        )
+
+
+def measure(function, calls, traced_calls=MEMORY_TRACED_CALLS):
+    """Latencia de cada llamada y pico de memoria de las primeras"""
+    # tracemalloc encarece cada asignación, así que la memoria se mide en una pasada aparte
+    latencies = [timed(function, *arguments)[1] for arguments in calls]
+    peak_bytes = max((traced_peak(function, *arguments)[1] for arguments in calls[:traced_calls]), default=0)
+    return dict(latency_summary(latencies), peak_bytes=peak_bytes)
+
+
+def find_regressions(baseline, current, tolerance):
+    """Métricas que empeoraron más que la tolerancia en tamaños medidos por ambas ejecuciones"""
+    baseline_sizes = {entry['employees']: entry for entry in baseline.get('sizes', [])}
+    regressions = []
+    for entry in current['sizes']:
+        previous = baseline_sizes.get(entry['employees'])
+        if previous is None:
+            continue
+        for stage, summary in entry.items():
+            if not isinstance(summary, dict) or not isinstance(previous.get(stage), dict):
+                continue
+            for metric in COMPARED_METRICS:
+                before = previous[stage].get(metric)
+                after = summary.get(metric)
+                if before and after is not None and after > before * (1 + tolerance):
+                    regressions.append({
+                        'employees': entry['employees'],
+                        'stage': stage,
+                        'metric': metric,
+                        'baseline': before,
+                        'current': after,
+                    })
+    return regressions
@@ -0,0 +1,221 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from facial_recognition.benchmarks import latency_summary
+from facial_recognition.face_enhancement import variant_hit_rates
+from facial_recognition.face_images import photo_bytes
+from facial_recognition.face_recognition_utils import AdvancedFaceRecognitionService, extract_probe_features
+from facial_recognition.face_workers import DeadlineExceeded, _initialize_worker
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+BASE64_EXTENSIONS = ('.b64', '.txt')
+
+
+def load_payloads(payloads_dir):
+    """(nombre, bytes) de cada foto capturada: imágenes, base64 (con o sin data URL) o cuerpos JSON"""
+    payloads = []
+    for name in sorted(os.listdir(payloads_dir)):
+        path = os.path.join(payloads_dir, name)
+        extension = os.path.splitext(name)[1].lower()
+        if extension in PHOTO_EXTENSIONS:
+            with open(path, 'rb') as payload_file:
+                payloads.append((name, payload_file.read()))
+        elif extension in BASE64_EXTENSIONS:
+            with open(path) as payload_file:
+                payloads.append((name, photo_bytes(payload_file.read().strip())))
+        elif extension == '.json':
+            # Cuerpo de una solicitud a verify-face/ o verify-face-burst/
+            with open(path) as payload_file:
+                body = json.load(payload_file)
+            photos = body.get('photos') or [body.get('photo')]
+            for index, photo in enumerate(photo for photo in photos if photo):
+                payloads.append((f'{name}[{index}]', photo_bytes(photo)))
+    return payloads
+
+
+def winning_variant(probe):
+    """Variante de mejora con la que se detectó el rostro, 'full_resolution' o None"""
+    for variant_name, found in probe.get('variant_attempts') or []:
+        if found:
+            return variant_name
+    # Ninguna variante del proxy encontró el rostro: solo pudo hacerlo el intento a resolución completa
+    return 'full_resolution' if probe.get('success') else None
+
+
+def peak_rss_bytes():
+    """Pico de memoria residente del proceso actual, o None si la plataforma no lo informa"""
+    if resource is None:
+        return None
+    # ru_maxrss se informa en KiB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def default_worker_counts(cpu_count=None):
+    """1, 2, 4... hasta el número de CPUs, incluyéndolo"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 < cpu_count:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpu_count:
+        counts.append(cpu_count)
+    return counts
+
+
+def replay_payload(data, variant_order, timeout):
+    """Etapas dlib de la verificación sobre una foto; punto de entrada del pool del benchmark"""
+    start = time.perf_counter()
+    try:
+        probe = extract_probe_features(data, variant_order, time.time() + timeout)
+    except DeadlineExceeded:
+        probe = {'success': False, 'reason': 'timeout'}
+    return {
+        'success': probe.get('success', False),
+        'reason': probe.get('reason'),
+        'variant': winning_variant(probe),
+        'timings_ms': (probe.get('stage_timings') or {}).get('timings_ms', {}),
+        'seconds': time.perf_counter() - start,
+        'pid': os.getpid(),
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Reproduce fotos capturadas por decodificación, calidad, mejora, detección y encoding, '
+            'con percentiles por etapa y escalado por número de procesos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payloads-dir', required=True,
+                            help='Directorio con fotos (jpg, png, webp), base64 (.b64, .txt) '
+                                 'o cuerpos JSON de solicitudes')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Repeticiones de cada foto')
+        parser.add_argument('--workers', default=None,
+                            help='Números de procesos a comparar, separados por coma '
+                                 '(por defecto potencias de 2 hasta el número de CPUs)')
+        parser.add_argument('--timeout', type=float, default=None,
+                            help='Plazo por foto en segundos (por defecto verification_timeout)')
+        parser.add_argument('--json', default=None,
+                            help='Archivo donde guardar los resultados en JSON')
+
+    def handle(self, *args, **options):
+        payloads_dir = options['payloads_dir']
+        if not os.path.isdir(payloads_dir):
+            raise CommandError(f'No existe el directorio {payloads_dir}')
+        payloads = load_payloads(payloads_dir)
+        if not payloads:
+            raise CommandError(f'No hay fotos en {payloads_dir}')
+
+        timeout = options['timeout'] or AdvancedFaceRecognitionService().ADVANCED_CONFIG['verification_timeout']
+        variant_order = variant_hit_rates.order()
+        jobs = [data for _, data in payloads for _ in range(options['repeat'])]
+        self.stdout.write(f'{len(payloads)} fotos, {len(jobs)} ejecuciones por configuración')
+
+        # Pasada de referencia en este proceso: percentiles por etapa y variante ganadora
+        results = {
+            'payloads': len(payloads),
+            'repeat': options['repeat'],
+            'cpu_count': os.cpu_count(),
+            'variant_order': variant_order,
+        }
+        replays, elapsed = self._replay_inline(jobs, variant_order, timeout)
+        results['inline'] = self._summarize(replays, elapsed)
+        results['stages'] = stage_percentiles(replays)
+        results['variants'] = dict(Counter(replay['variant'] or 'none' for replay in replays))
+        results['reasons'] = dict(Counter(replay['reason'] or 'ok' for replay in replays))
+
+        self._report('en proceso', results['inline'])
+        for stage, summary in results['stages'].items():
+            self.stdout.write(
+                f"{stage:>22}: p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+                f"p99 {summary['p99_ms']:.1f} ms ({summary['count']})"
+            )
+        self.stdout.write(f"Variantes ganadoras: {results['variants']}")
+        self.stdout.write(f"Resultados: {results['reasons']}")
+
+        # Barrido de procesos: el mismo pool con spawn que usa la verificación
+        results['sweep'] = []
+        baseline_throughput = None
+        worker_counts = (
+            [int(value) for value in options['workers'].split(',')] if options['workers']
+            else default_worker_counts()
+        )
+        for workers in worker_counts:
+            replays, elapsed = self._replay_pool(jobs, variant_order, timeout, workers)
+            summary = dict(self._summarize(replays, elapsed), workers=workers)
+            if baseline_throughput is None:
+                baseline_throughput = summary['throughput'] / workers
+            summary['speedup'] = summary['throughput'] / baseline_throughput
+            summary['efficiency'] = summary['speedup'] / workers
+            results['sweep'].append(summary)
+            self._report(f'{workers} procesos', summary)
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
+
+    def _replay_inline(self, jobs, variant_order, timeout):
+        # Una ejecución previa carga los modelos de dlib fuera de la medición
+        replay_payload(jobs[0], variant_order, timeout)
+        start = time.perf_counter()
+        replays = [replay_payload(data, variant_order, timeout) for data in jobs]
+        return replays, time.perf_counter() - start
+
+    def _replay_pool(self, jobs, variant_order, timeout, workers):
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_initialize_worker
+        )
+        try:
+            # Una foto por proceso antes de medir, para que los modelos ya estén cargados
+            list(executor.map(replay_payload, [jobs[0]] * workers, [variant_order] * workers,
+                              [timeout] * workers))
+            start = time.perf_counter()
+            futures = [executor.submit(replay_payload, data, variant_order, timeout) for data in jobs]
+            replays = [future.result() for future in futures]
+            return replays, time.perf_counter() - start
+        finally:
+            executor.shutdown()
+
+    def _summarize(self, replays, elapsed):
+        rss_by_process = {}
+        for replay in replays:
+            if replay['peak_rss_bytes'] is not None:
+                rss_by_process[replay['pid']] = max(rss_by_process.get(replay['pid'], 0), replay['peak_rss_bytes'])
+        return dict(
+            latency_summary([replay['seconds'] for replay in replays]),
+            throughput=len(replays) / elapsed if elapsed else None,
+            success_rate=sum(replay['success'] for replay in replays) / len(replays),
+            peak_rss_bytes=max(rss_by_process.values()) if rss_by_process else None,
+            total_rss_bytes=sum(rss_by_process.values()) if rss_by_process else None,
+        )
+
+    def _report(self, label, summary):
+        rss = summary['peak_rss_bytes']
+        rss_text = f", RSS máx {rss / 2 ** 20:.0f} MiB" if rss is not None else ''
+        speedup = f", x{summary['speedup']:.2f}" if 'speedup' in summary else ''
+        self.stdout.write(
+            f"{label:>12}: {summary['throughput']:.2f} fotos/s{speedup}, p50 {summary['p50_ms']:.0f} ms, "
+            f"p95 {summary['p95_ms']:.0f} ms, p99 {summary['p99_ms']:.0f} ms{rss_text}"
+        )
+
+
+def stage_percentiles(replays):
+    """Percentiles de cada etapa registrada por FaceAnalysis, en el orden en que aparecen"""
+    stages = {}
+    for replay in replays:
+        for stage, milliseconds in replay['timings_ms'].items():
+            stages.setdefault(stage, []).append(milliseconds / 1000)
+    return {stage: latency_summary(seconds) for stage, seconds in stages.items()}
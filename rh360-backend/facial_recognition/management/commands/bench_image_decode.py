@@ -0,0 +1,107 @@
+import io
+import json
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from facial_recognition.benchmarks import latency_summary, timed
+from facial_recognition.face_images import decode_photo, target_size
+
+# Resoluciones 4:3 típicas de cámaras de teléfono
+PHOTO_SIZES = {
+    3: (2048, 1536),
+    5: (2592, 1944),
+    8: (3264, 2448),
+    12: (4032, 3024),
+}
+
+
+def synthetic_photo(size, seed=0, quality=90):
+    """JPEG con gradientes y ruido, de entropía parecida a una foto real"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        128 + 80 * np.sin(x / 97.0),
+        128 + 80 * np.cos(y / 61.0),
+        128 + 60 * np.sin((x + y) / 143.0),
+    ], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def legacy_decode(data, max_side):
+    """Ruta anterior: decodificación completa, convert, thumbnail y copia a NumPy"""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.width > max_side or image.height > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    return np.array(image)
+
+
+def draft_decode(data, max_side):
+    """Alternativa solo con PIL: draft() con escala DCT y luego LANCZOS"""
+    image = Image.open(io.BytesIO(data))
+    size = target_size(image.size, max_side)
+    image.draft('RGB', size)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    return np.asarray(image)
+
+
+def shared_decode(data, max_side):
+    """Ruta actual del servicio (OpenCV IMREAD_REDUCED_*)"""
+    return np.asarray(decode_photo(data, max_side))
+
+
+DECODERS = {
+    'legacy': legacy_decode,
+    'pil_draft': draft_decode,
+    'decode_photo': shared_decode,
+}
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark de decodificación de fotos de 3 a 12 MP hasta el tamaño de trabajo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-side', type=int, default=1200,
+                            help='Lado máximo de salida (1200 en verificación, 1000 en registro)')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Repeticiones por tamaño y decodificador')
+        parser.add_argument('--json', default=None,
+                            help='Archivo donde guardar los resultados en JSON')
+
+    def handle(self, *args, **options):
+        max_side = options['max_side']
+        results = []
+
+        for megapixels, size in PHOTO_SIZES.items():
+            data = synthetic_photo(size)
+            row = {'megapixels': megapixels, 'size': list(size), 'jpeg_bytes': len(data)}
+
+            for name, decoder in DECODERS.items():
+                latencies = []
+                for _ in range(options['repeat']):
+                    array, elapsed = timed(decoder, data, max_side)
+                    latencies.append(elapsed)
+                row[name] = dict(latency_summary(latencies), output_shape=list(array.shape))
+
+            row['speedup'] = row['legacy']['p50_ms'] / row['decode_photo']['p50_ms']
+            results.append(row)
+            self.stdout.write(
+                f"{megapixels:>2} MP {size[0]}x{size[1]}: "
+                + ', '.join(f"{name} {row[name]['p50_ms']:.1f} ms" for name in DECODERS)
+                + f" (x{row['speedup']:.1f})"
+            )
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump({'max_side': max_side, 'results': results}, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
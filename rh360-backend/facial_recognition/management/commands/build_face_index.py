@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from facial_recognition.face_gallery import face_gallery
+from facial_recognition.face_index import IVFIndex, default_nlist
+from facial_recognition.face_recognition_utils import AdvancedFaceRecognitionService
+
+
+class Command(BaseCommand):
+    help = 'Entrena (o reconstruye) los centroides del índice IVF con la galería facial actual'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nlist', type=int, default=0,
+                            help='Número de listas IVF (0 = automático)')
+        parser.add_argument('--iterations', type=int, default=10,
+                            help='Iteraciones de k-means')
+        parser.add_argument('--sample-size', type=int, default=100000,
+                            help='Máximo de encodings usados para entrenar')
+        parser.add_argument('--output', default=None,
+                            help='Ruta del archivo .npz (por defecto ann_index_path)')
+
+    def handle(self, *args, **options):
+        config = AdvancedFaceRecognitionService().ADVANCED_CONFIG
+        output = options['output'] or config['ann_index_path']
+
+        snapshot = face_gallery.load()
+        if len(snapshot.encodings) == 0:
+            self.stdout.write(self.style.WARNING('No hay rostros registrados; no se construyó el índice'))
+            return
+
+        nlist = options['nlist'] or config['ann_nlist'] or default_nlist(len(snapshot.encodings))
+        start = time.perf_counter()
+        index = IVFIndex.train(
+            snapshot.encodings,
+            nlist=nlist,
+            iterations=options['iterations'],
+            sample_size=options['sample_size']
+        )
+        index.add(snapshot.encodings, snapshot.encoding_owner)
+        elapsed = time.perf_counter() - start
+        index.save(output)
+
+        list_sizes = np.diff(index.list_offsets)
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice IVF guardado en {output}: {index.nlist} listas, '
+            f'{snapshot.size} empleados, {len(snapshot.encodings)} encodings ({elapsed:.1f}s)'
+        ))
+        self.stdout.write(
+            f'Tamaño de listas: min {list_sizes.min()}, mediana {int(np.median(list_sizes))}, '
+            f'max {list_sizes.max()}'
+        )
+
+        # Los procesos que ya tienen la galería cargada usan los nuevos centroides al recargar
+        face_gallery.invalidate()
@@ -0,0 +1,133 @@
+import base64
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from facial_recognition.benchmarks import latency_summary
+
+ENDPOINTS = ('verify-face', 'verify-qr', 'mark-attendance')
+
+
+def build_body(endpoint, options):
+    """Cuerpo JSON de la solicitud, igual al que envían los kioscos"""
+    if endpoint == 'verify-face':
+        if not options['photo']:
+            raise CommandError('verify-face requiere --photo')
+        with open(options['photo'], 'rb') as photo_file:
+            photo = base64.b64encode(photo_file.read()).decode()
+        return {'photo': f'data:image/jpeg;base64,{photo}', 'type': 'entrada'}
+    if endpoint == 'verify-qr':
+        if not options['qr']:
+            raise CommandError('verify-qr requiere --qr')
+        return {'qr_data': options['qr'], 'type': 'entrada'}
+    if not options['employee_id']:
+        raise CommandError('mark-attendance requiere --employee-id')
+    return {'employee_id': options['employee_id'], 'type': 'entrada', 'notes': 'Prueba de carga'}
+
+
+def send(url, body, timeout):
+    """(código HTTP o nombre del error, segundos)"""
+    request = urllib.request.Request(
+        url, data=body, method='POST', headers={'Content-Type': 'application/json'}
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - start
+
+
+def run_load(url, body, total, concurrency, timeout):
+    """Envía total solicitudes con concurrency clientes simultáneos"""
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        start = time.perf_counter()
+        results = list(clients.map(lambda _: send(url, body, timeout), range(total)))
+        elapsed = time.perf_counter() - start
+
+    statuses = Counter(str(status) for status, _ in results)
+    return dict(
+        latency_summary([seconds for _, seconds in results]),
+        requests_per_second=total / elapsed,
+        elapsed_seconds=elapsed,
+        statuses=dict(statuses),
+    )
+
+
+class Command(BaseCommand):
+    help = ('Prueba de carga local: compara solicitudes/s y p95 de las vistas síncronas (WSGI) '
+            'y async (ASGI) con muchos kioscos concurrentes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-url', default=None,
+                            help='Servidor WSGI, p. ej. http://127.0.0.1:8000 '
+                                 '(gunicorn attendance_backend.wsgi -w 4)')
+        parser.add_argument('--async-url', default=None,
+                            help='Servidor ASGI, p. ej. http://127.0.0.1:8001 '
+                                 '(uvicorn attendance_backend.asgi:application --port 8001)')
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='verify-face')
+        parser.add_argument('--photo', default=None,
+                            help='Foto JPEG enviada a verify-face')
+        parser.add_argument('--qr', default=None,
+                            help='Contenido del QR enviado a verify-qr')
+        parser.add_argument('--employee-id', default=None,
+                            help='RUT o ID interno enviado a mark-attendance')
+        parser.add_argument('--concurrency', type=int, default=40,
+                            help='Kioscos enviando a la vez')
+        parser.add_argument('--requests', type=int, default=400,
+                            help='Solicitudes por servidor')
+        parser.add_argument('--timeout', type=float, default=30.0,
+                            help='Plazo de cada solicitud en segundos')
+        parser.add_argument('--json', default=None,
+                            help='Archivo donde guardar los resultados en JSON')
+
+    def handle(self, *args, **options):
+        targets = []
+        if options['sync_url']:
+            targets.append(('sync', f"{options['sync_url'].rstrip('/')}/api/{options['endpoint']}/"))
+        if options['async_url']:
+            targets.append(('async', f"{options['async_url'].rstrip('/')}/api/async/{options['endpoint']}/"))
+        if not targets:
+            raise CommandError('Indica --sync-url, --async-url o ambos')
+
+        # Después del primer registro las siguientes solicitudes son duplicados: igual recorren
+        # reconocimiento y consultas, que es lo que se mide
+        body = json.dumps(build_body(options['endpoint'], options)).encode()
+
+        results = {
+            'endpoint': options['endpoint'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'servers': {},
+        }
+        for mode, url in targets:
+            self.stdout.write(f"{mode}: {options['requests']} solicitudes a {url} "
+                              f"con {options['concurrency']} clientes...")
+            summary = run_load(url, body, options['requests'], options['concurrency'], options['timeout'])
+            summary['url'] = url
+            results['servers'][mode] = summary
+            self.stdout.write(
+                f"{mode:>6}: {summary['requests_per_second']:.1f} sol/s, p50 {summary['p50_ms']:.0f} ms, "
+                f"p95 {summary['p95_ms']:.0f} ms, p99 {summary['p99_ms']:.0f} ms, códigos {summary['statuses']}"
+            )
+
+        if len(results['servers']) == 2:
+            sync, asynchronous = results['servers']['sync'], results['servers']['async']
+            self.stdout.write(
+                f"async/sync: x{asynchronous['requests_per_second'] / sync['requests_per_second']:.2f} sol/s, "
+                f"p95 x{asynchronous['p95_ms'] / sync['p95_ms']:.2f}"
+            )
+
+        if options['json']:
+            with open(options['json'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['json']}"))
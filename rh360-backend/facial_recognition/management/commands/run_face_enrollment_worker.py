@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from facial_recognition.face_enrollment import claim_next_job, requeue_stale_jobs, run_enrollment_job
+from facial_recognition.face_metrics import registry
+from facial_recognition.face_recognition_utils import AdvancedFaceRecognitionService
+from facial_recognition.face_workers import registration_pool
+
+
+class Command(BaseCommand):
+    help = 'Procesa en segundo plano los trabajos de registro facial pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Segundos de espera cuando no hay trabajos pendientes')
+        parser.add_argument('--once', action='store_true',
+                            help='Procesa los trabajos pendientes y termina')
+        parser.add_argument('--metrics-file',
+                            help='Archivo .prom donde escribir las métricas tras cada trabajo '
+                                 '(este proceso no atiende /api/metrics/)')
+
+    def handle(self, *args, **options):
+        service = AdvancedFaceRecognitionService()
+        self.stdout.write('Worker de registro facial iniciado')
+
+        try:
+            while True:
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'{requeued} trabajos abandonados vueltos a la cola'))
+
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f'Procesando registro de {job.employee.name} ({job.id})...')
+                job = run_enrollment_job(job, service)
+                style = self.style.SUCCESS if job.status == 'completed' else self.style.ERROR
+                self.stdout.write(style(f'  {job.status}: {job.message}'))
+                if options['metrics_file']:
+                    self.write_metrics(options['metrics_file'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido')
+        finally:
+            registration_pool.shutdown()
+
+    def write_metrics(self, path):
+        # Escritura atómica para que el recolector nunca lea un archivo a medias
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as metrics_file:
+            metrics_file.write(registry.render())
+        os.replace(temporary, path)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-16 22:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_recognition', '0002_employee_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='face_template',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
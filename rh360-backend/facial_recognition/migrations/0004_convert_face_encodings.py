@@ -0,0 +1,93 @@
+import json
+import struct
+
+import numpy as np
+from django.db import migrations
+
+# Copia congelada del formato de plantilla versión 1 (float32): la migración no debe depender
+# de face_templates.py, cuyo formato puede cambiar. decode_face_template sigue leyendo la versión 1
+ENCODING_SIZE = 128
+TEMPLATE_HEADER = struct.Struct('<4sBBHI')
+
+
+def _as_rows(vectors, width=None):
+    rows = [np.asarray(v, dtype=np.float64).ravel() for v in vectors if v is not None]
+    if width is not None:
+        rows = [row for row in rows if row.shape == (width,)]
+    return rows
+
+
+def encode_face_template(face_data):
+    """encode_face_template tal como era en la versión 1 del formato"""
+    encodings = _as_rows(face_data.get('encodings', []) or [], ENCODING_SIZE)
+
+    adaptations = []
+    adaptation_groups = []
+    for adaptation_group in face_data.get('environmental_adaptations', []) or []:
+        conditions = []
+        for adaptation in adaptation_group:
+            try:
+                if 'encoding' not in adaptation:
+                    continue
+                encoding = np.asarray(adaptation['encoding'], dtype=np.float64).ravel()
+            except Exception:
+                continue
+            if encoding.shape != (ENCODING_SIZE,):
+                continue
+            adaptations.append(encoding)
+            conditions.append({
+                'condition': adaptation.get('condition'),
+                'brightness': adaptation.get('brightness'),
+                'contrast': adaptation.get('contrast'),
+            })
+        adaptation_groups.append(conditions)
+
+    landmarks = _as_rows(face_data.get('landmarks', []) or [])
+
+    metadata = json.dumps({
+        'encoding_size': ENCODING_SIZE,
+        'encodings': len(encodings),
+        'adaptation_groups': adaptation_groups,
+        'landmark_lengths': [len(lm) for lm in landmarks],
+    }, separators=(',', ':')).encode('utf-8')
+
+    # magic, versión 1, tipo de dato 0 (float32 little-endian), reservado, largo de metadatos
+    parts = [TEMPLATE_HEADER.pack(b'RHFT', 1, 0, 0, len(metadata)), metadata]
+    for rows in (encodings, adaptations, landmarks):
+        if rows:
+            parts.append(np.concatenate(rows).astype('<f4').tobytes())
+    return b''.join(parts)
+
+
+def convert_face_encodings(apps, schema_editor):
+    """Convierte el JSON de face_encoding a la plantilla binaria; el JSON se conserva"""
+    Employee = apps.get_model('facial_recognition', 'Employee')
+    employees = Employee.objects.filter(
+        face_encoding__isnull=False,
+        face_template__isnull=True
+    ).exclude(face_encoding='').only('id', 'face_encoding')
+
+    for employee in employees.iterator(chunk_size=200):
+        try:
+            face_data = json.loads(employee.face_encoding)
+        except (TypeError, ValueError):
+            continue
+        Employee.objects.filter(id=employee.id).update(
+            face_template=encode_face_template(face_data)
+        )
+
+
+def clear_face_templates(apps, schema_editor):
+    Employee = apps.get_model('facial_recognition', 'Employee')
+    Employee.objects.filter(face_encoding__isnull=False).update(face_template=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_recognition', '0003_employee_face_template'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_face_encodings, clear_face_templates),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-16 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_recognition', '0004_convert_face_encodings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceGalleryChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('employee_uuid', models.UUIDField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Cambio de Galería Facial',
+                'verbose_name_plural': 'Cambios de Galería Facial',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.23 on 2026-10-16 23:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_recognition', '0005_facegallerychange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEnrollmentJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'Procesando'), ('completed', 'Completado'), ('failed', 'Fallido')], db_index=True, default='pending', max_length=10)),
+                ('message', models.TextField(blank=True)),
+                ('valid_photos', models.IntegerField(default=0)),
+                ('average_quality', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='face_enrollment_jobs', to='facial_recognition.employee')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Registro Facial',
+                'verbose_name_plural': 'Trabajos de Registro Facial',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FaceEnrollmentPhoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('image', models.BinaryField()),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('valid', 'Válida'), ('failed', 'Fallida')], default='pending', max_length=10)),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('quality', models.FloatField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photos', to='facial_recognition.faceenrollmentjob')),
+            ],
+            options={
+                'verbose_name': 'Foto de Registro Facial',
+                'verbose_name_plural': 'Fotos de Registro Facial',
+                'ordering': ['index'],
+                'unique_together': {('job', 'index')},
+            },
+        ),
+    ]
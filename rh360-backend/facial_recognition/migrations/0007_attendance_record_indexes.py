@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_recognition', '0006_faceenrollmentjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['employee', 'attendance_type', 'timestamp'], name='attendance_emp_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['timestamp'], name='attendance_timestamp_idx'),
+        ),
+    ]
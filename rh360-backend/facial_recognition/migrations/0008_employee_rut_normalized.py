@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_recognition', '0007_attendance_record_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='rut_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=12),
+        ),
+    ]
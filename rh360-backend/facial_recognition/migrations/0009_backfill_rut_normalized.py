@@ -0,0 +1,43 @@
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def normalize_rut(rut):
+    """Copia fija de models.normalize_rut: la migración no debe cambiar si cambia el modelo"""
+    return re.sub(r'[^0-9kK]', '', str(rut or '')).upper()
+
+
+def backfill_rut_normalized(apps, schema_editor):
+    """Completa rut_normalized de los empleados existentes (los nuevos lo reciben en save())"""
+    Employee = apps.get_model('facial_recognition', 'Employee')
+
+    pending = []
+    for employee in Employee.objects.only('id', 'rut', 'rut_normalized').iterator(chunk_size=BATCH_SIZE):
+        rut_normalized = normalize_rut(employee.rut)
+        if employee.rut_normalized != rut_normalized:
+            employee.rut_normalized = rut_normalized
+            pending.append(employee)
+        if len(pending) >= BATCH_SIZE:
+            Employee.objects.bulk_update(pending, ['rut_normalized'])
+            pending = []
+    if pending:
+        Employee.objects.bulk_update(pending, ['rut_normalized'])
+
+
+def clear_rut_normalized(apps, schema_editor):
+    Employee = apps.get_model('facial_recognition', 'Employee')
+    Employee.objects.update(rut_normalized='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_recognition', '0008_employee_rut_normalized'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rut_normalized, clear_rut_normalized),
+    ]
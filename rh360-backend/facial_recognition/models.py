@@ -2,11 +2,17 @@ from django.db import models
 import uuid
 import re
 
+
+def normalize_rut(rut):
+    """RUT solo con dígitos y K mayúscula (sin puntos ni guion), para buscar sin importar el formato"""
+    return re.sub(r'[^0-9kK]', '', str(rut or '')).upper()
+
 class Employee(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     employee_id = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=100)
     rut = models.CharField(max_length=12, unique=True, help_text="RUT con formato 12345678-9")
+    rut_normalized = models.CharField(max_length=12, db_index=True, editable=False, default='')  # Ver normalize_rut
     email = models.EmailField()
     department = models.CharField(max_length=50)
     position = models.CharField(max_length=50)
@@ -16,7 +22,8 @@ class Employee(models.Model):
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
     
     # Campos para reconocimiento facial avanzado
-    face_encoding = models.TextField(blank=True, null=True)  # JSON con múltiples encodings
+    face_encoding = models.TextField(blank=True, null=True)  # JSON con múltiples encodings (formato antiguo)
+    face_template = models.BinaryField(blank=True, null=True)  # Plantilla binaria versionada (ver face_templates.py)
     has_face_registered = models.BooleanField(default=False)
     face_quality_score = models.FloatField(default=0)  # Calidad promedio del registro facial (0-1)
     face_registration_date = models.DateTimeField(null=True, blank=True)
@@ -71,6 +78,10 @@ class Employee(models.Model):
     def save(self, *args, **kwargs):
         if self.rut:
             self.rut = self.clean_rut()
+        self.rut_normalized = normalize_rut(self.rut)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'rut' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'rut_normalized'}
         super().save(*args, **kwargs)
     
     class Meta:
@@ -114,6 +125,12 @@ class AttendanceRecord(models.Model):
         ordering = ['-timestamp']
         verbose_name = "Registro de Asistencia"
         verbose_name_plural = "Registros de Asistencia"
+        indexes = [
+            # check_duplicate_attendance: empleado y tipo exactos, rango de timestamp
+            models.Index(fields=['employee', 'attendance_type', 'timestamp'], name='attendance_emp_type_ts_idx'),
+            # get_attendance_records: últimos días ordenados por timestamp
+            models.Index(fields=['timestamp'], name='attendance_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"{self.employee.name} - {self.attendance_type} - {self.timestamp}"
@@ -128,4 +145,72 @@ class AttendanceRecord(models.Model):
         elif self.verification_method == 'manual':
             return "Manual/GPS"
         else:
-            return "Verificación pendiente"
\ No newline at end of file
+            return "Verificación pendiente"
+
+class FaceGalleryChange(models.Model):
+    """Registro de cambios de la galería facial; el id creciente es el número de generación"""
+    employee_uuid = models.UUIDField()  # Sin FK: el empleado puede haber sido eliminado
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Cambio de Galería Facial"
+        verbose_name_plural = "Cambios de Galería Facial"
+
+    def __str__(self):
+        return f"Generación {self.id} - {self.employee_uuid}"
+
+    @classmethod
+    def current_generation(cls):
+        """Último número de generación (0 si no hay cambios registrados)"""
+        return cls.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+class FaceEnrollmentJob(models.Model):
+    """Registro facial procesado en segundo plano por el comando run_face_enrollment_worker"""
+    STATUSES = [
+        ('pending', 'Pendiente'),
+        ('running', 'Procesando'),
+        ('completed', 'Completado'),
+        ('failed', 'Fallido'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='face_enrollment_jobs')
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending', db_index=True)
+    message = models.TextField(blank=True)
+    valid_photos = models.IntegerField(default=0)
+    average_quality = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = "Trabajo de Registro Facial"
+        verbose_name_plural = "Trabajos de Registro Facial"
+
+    def __str__(self):
+        return f"{self.employee.name} - {self.status} - {self.created_at}"
+
+class FaceEnrollmentPhoto(models.Model):
+    """Foto de un trabajo de registro; guarda el avance por foto"""
+    STATUSES = [
+        ('pending', 'Pendiente'),
+        ('valid', 'Válida'),
+        ('failed', 'Fallida'),
+    ]
+
+    job = models.ForeignKey(FaceEnrollmentJob, on_delete=models.CASCADE, related_name='photos')
+    index = models.PositiveSmallIntegerField()
+    image = models.BinaryField()  # Se vacía al terminar el trabajo
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    message = models.CharField(max_length=255, blank=True)
+    quality = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['index']
+        unique_together = [('job', 'index')]
+        verbose_name = "Foto de Registro Facial"
+        verbose_name_plural = "Fotos de Registro Facial"
+
+    def __str__(self):
+        return f"Foto {self.index + 1} - {self.status}"
@@ -0,0 +1,30 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+# Tamaño máximo de una foto enviada como cuerpo binario
+MAX_RAW_IMAGE_BYTES = 20 * 1024 * 1024
+
+
+class RawImageParser(BaseParser):
+    """Cuerpo binario image/* (image/jpeg, image/png...) recibido como el campo 'photo'
+
+    Los demás campos (type, latitude, longitude, address) llegan como parámetros de la URL.
+    """
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            raise ParseError('Cuerpo de imagen vacío')
+
+        request = parser_context['request']
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > MAX_RAW_IMAGE_BYTES:
+            raise ParseError(f'Imagen demasiado grande ({content_length} bytes)')
+
+        photo = stream.read(MAX_RAW_IMAGE_BYTES + 1)
+        if len(photo) > MAX_RAW_IMAGE_BYTES:
+            raise ParseError('Imagen demasiado grande')
+
+        data = request.query_params.dict()
+        data['photo'] = photo
+        return data
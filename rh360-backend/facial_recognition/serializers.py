@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Employee, AttendanceRecord
+from .models import Employee, AttendanceRecord, FaceEnrollmentJob, FaceEnrollmentPhoto
 
 class EmployeeSerializer(serializers.ModelSerializer):
     attendance_count = serializers.SerializerMethodField()
@@ -54,4 +54,26 @@ class AttendanceRecordSerializer(serializers.ModelSerializer):
             'qr': '📱 Código QR',
             'manual': '📝 Manual/GPS'
         }
-        return method_names.get(obj.verification_method, obj.verification_method)
\ No newline at end of file
+        return method_names.get(obj.verification_method, obj.verification_method)
+
+class FaceEnrollmentPhotoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FaceEnrollmentPhoto
+        fields = ['index', 'status', 'message', 'quality']
+
+class FaceEnrollmentJobSerializer(serializers.ModelSerializer):
+    employee_name = serializers.CharField(source='employee.name', read_only=True)
+    photos = FaceEnrollmentPhotoSerializer(many=True, read_only=True)
+    progress = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = FaceEnrollmentJob
+        fields = [
+            'id', 'employee', 'employee_name', 'status', 'message', 'progress', 'photos',
+            'valid_photos', 'average_quality', 'created_at', 'started_at', 'finished_at'
+        ]
+    
+    def get_progress(self, obj):
+        photos = obj.photos.all()
+        processed = sum(1 for photo in photos if photo.status != 'pending')
+        return {'processed': processed, 'total': len(photos)}
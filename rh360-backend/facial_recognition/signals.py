@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .face_gallery import face_gallery
+from .models import Employee, FaceGalleryChange
+
+# Campos que deciden si el empleado está en la galería y con qué rostro; otros cambios (nombre,
+# RUT, foto de perfil) no publican una generación nueva y se ven en la próxima recarga completa
+GALLERY_FIELDS = ('face_encoding', 'face_template', 'has_face_registered', 'is_active')
+
+
+def record_gallery_change(employee, deleted=False):
+    """Aplica el cambio en este proceso y publica una nueva generación para los demás"""
+    employee_uuid = employee.pk  # Django limpia el pk al terminar delete()
+
+    def publish():
+        face_gallery.apply_local_change(employee_uuid, None if deleted else employee)
+        FaceGalleryChange.objects.create(employee_uuid=employee_uuid)
+
+    transaction.on_commit(publish)
+
+
+def _field_value(value):
+    # El BinaryField llega como memoryview desde la base de datos y como bytes al asignarlo
+    return bytes(value) if isinstance(value, memoryview) else value
+
+
+def gallery_fields_changed(instance, update_fields=None):
+    """Si el guardado cambia algún campo de GALLERY_FIELDS respecto de la base de datos"""
+    if update_fields is not None and not set(GALLERY_FIELDS) & set(update_fields):
+        return False
+    if instance._state.adding:
+        return bool(instance.has_face_registered)
+
+    # Los campos diferidos no se asignaron y no cambiaron; leerlos haría una consulta más
+    fields = [field for field in GALLERY_FIELDS if field not in instance.get_deferred_fields()]
+    previous = Employee.objects.filter(pk=instance.pk).values(*fields).first()
+    if previous is None:
+        return True
+    return any(_field_value(previous[field]) != _field_value(getattr(instance, field)) for field in fields)
+
+
+@receiver(pre_save, sender=Employee)
+def employee_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        instance._gallery_changed = gallery_fields_changed(instance, update_fields)
+
+
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, raw=False, **kwargs):
+    if not raw and instance.__dict__.pop('_gallery_changed', True):
+        record_gallery_change(instance)
+
+
+@receiver(post_delete, sender=Employee)
+def employee_deleted(sender, instance, **kwargs):
+    record_gallery_change(instance, deleted=True)
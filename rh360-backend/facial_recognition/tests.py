@@ -1,3 +1,1656 @@
-from django.test import TestCase
+from django.apps import apps as django_apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+import base64
+import importlib
+import io
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+from PIL import Image, ImageFilter
+from scipy.spatial import distance
 
-# Create your tests here.
+from .benchmarks import best_match_index, stored_face_data, synthetic_gallery, synthetic_probes
+from .face_analysis import FaceAnalysis
+from .face_cache import VerificationCache, photo_fingerprint
+from .face_detection import box_iou, detection_proxy, scale_face_location
+from .face_enhancement import ENHANCEMENT_VARIANTS, VariantHitRates, enhanced_variants
+from .face_gallery import GALLERY_RESYNC_SECONDS, FaceGallery, GallerySnapshot
+from .face_images import decode_photo, photo_bytes
+from .face_metrics import FRAME_GATE, STAGE_SECONDS, VERIFICATIONS, MetricsRegistry
+from .face_motion import FrameChangeGate, device_key
+from .face_index import IVFIndex, build_gallery_index
+from .face_recognition_utils import AdvancedFaceRecognitionService
+from .face_tracking import FaceTracker, Track
+from .face_templates import decode_face_template, encode_face_template, parse_face_data, read_face_data
+from .face_workers import (
+    DeadlineExceeded, WorkerPool, WorkerPoolBusy, check_deadline, registration_pool, shutdown_pools
+)
+from .face_enrollment import claim_next_job, run_enrollment_job
+from .kiosk import KioskSession, kiosk_websocket
+from .views import search_employee_by_rut
+from .models import AttendanceRecord, Employee, FaceEnrollmentJob, FaceGalleryChange, normalize_rut
+from .management.commands.bench_face_match import find_regressions
+from .management.commands.bench_attendance_queries import existing_indexes
+from .management.commands.bench_face_pipeline import default_worker_counts, load_payloads, winning_variant
+
+
+def reference_face_comparison(config, stored_data, current_encoding, current_landmarks):
+    """Implementación original, encoding por encoding, usada como referencia de paridad"""
+    stored_encodings = stored_data.get('encodings', [])
+    stored_landmarks = stored_data.get('landmarks', [])
+    environmental_adaptations = stored_data.get('environmental_adaptations', [])
+
+    if not stored_encodings:
+        return False, 0.0
+
+    excellent_matches = high_quality_matches = acceptable_matches = 0
+    all_scores = []
+    all_distances = []
+
+    for stored_enc in stored_encodings:
+        if stored_enc is None:
+            continue
+        stored_enc_array = np.array(stored_enc)
+        euclidean_dist = np.linalg.norm(stored_enc_array - current_encoding)
+        all_distances.append(euclidean_dist)
+
+        if euclidean_dist <= 0.35:
+            excellent_matches += 1
+        if euclidean_dist <= config['base_tolerance']:
+            high_quality_matches += 1
+        if euclidean_dist <= config['max_tolerance']:
+            acceptable_matches += 1
+
+        euclidean_score = max(0, 1 - (euclidean_dist / config['max_euclidean_distance']))
+        cosine_sim = 1 - distance.cosine(stored_enc_array, current_encoding)
+        cosine_sim = max(0, 0.5 if np.isnan(cosine_sim) else cosine_sim)
+        correlation = np.corrcoef(stored_enc_array, current_encoding)[0, 1]
+        correlation = max(0, 0.5 if np.isnan(correlation) else correlation)
+
+        combined_score = euclidean_score * 0.5 + cosine_sim * 0.3 + correlation * 0.2
+        bonus_applied = 0
+        if euclidean_dist <= 0.35:
+            bonus_applied += 0.02
+        if euclidean_dist <= config['base_tolerance'] and cosine_sim >= 0.75:
+            bonus_applied += 0.015
+        if euclidean_dist <= 0.30:
+            bonus_applied += 0.03
+        all_scores.append(min(combined_score + bonus_applied, 1.0))
+
+    for adaptations in environmental_adaptations:
+        for adaptation in adaptations:
+            adapt_dist = np.linalg.norm(np.array(adaptation['encoding']) - current_encoding)
+            if adapt_dist <= config['max_tolerance']:
+                adapt_score = max(0, 1 - (adapt_dist / config['max_tolerance']))
+                if adapt_score >= 0.6:
+                    all_scores.append(adapt_score)
+
+    if not all_scores or acceptable_matches < config['min_matches']:
+        return False, 0.0
+
+    distance_penalty = 0
+    if len(all_distances) > 1:
+        distance_std = np.std(all_distances)
+        if distance_std > config['consistency_threshold']:
+            distance_penalty = min(distance_std * 0.1, 0.05)
+
+    landmark_bonus = 0
+    if current_landmarks is not None and stored_landmarks and config['use_landmarks']:
+        landmark_similarities = []
+        current_lm_flat = np.array(current_landmarks).flatten()
+        for stored_lm_list in stored_landmarks:
+            if stored_lm_list is None:
+                continue
+            stored_lm_array = np.array(stored_lm_list).flatten()
+            min_len = min(len(current_lm_flat), len(stored_lm_array))
+            if min_len > 60:
+                lm_similarity = 1 - distance.cosine(current_lm_flat[:min_len], stored_lm_array[:min_len])
+                if not np.isnan(lm_similarity) and lm_similarity >= 0.5:
+                    landmark_similarities.append(lm_similarity)
+        if landmark_similarities:
+            landmark_score = np.mean(landmark_similarities)
+            if landmark_score >= config['min_landmark_similarity']:
+                landmark_bonus = min(landmark_score * 0.03, 0.03)
+
+    top_scores = sorted(all_scores, reverse=True)[:3]
+    quality_bonus = 0.02 * excellent_matches + 0.01 * high_quality_matches
+    final_confidence = min(np.mean(top_scores) + landmark_bonus + quality_bonus - distance_penalty, 1.0)
+    final_confidence = max(0.0, final_confidence)
+
+    is_match = final_confidence >= config['min_confidence'] and acceptable_matches >= config['min_matches']
+    return is_match, final_confidence
+
+
+def random_stored_data(rng, center):
+    """Datos faciales con 1 a 5 fotos alrededor de center, landmarks de largo variable y adaptaciones"""
+    spread = rng.choice([0.005, 0.02, 0.03, 0.05])
+    count = int(rng.integers(1, 6))
+    encodings = [(center + rng.normal(0, spread, 128)).tolist() for _ in range(count)]
+    landmarks = [rng.uniform(0, 300, int(rng.choice([144, 144, 90, 200]))).tolist() for _ in range(count)]
+    adaptations = [[{'encoding': (np.array(enc) + rng.normal(0, 0.03, 128)).tolist()}
+                    for _ in range(3)] for enc in encodings]
+    return {'encodings': encodings, 'landmarks': landmarks, 'environmental_adaptations': adaptations}
+
+
+def slow_stage(seconds, deadline):
+    """Etapa de prueba para el pool: duerme y revisa el plazo antes y después"""
+    check_deadline(deadline, 'inicio')
+    time.sleep(seconds)
+    check_deadline(deadline, 'fin')
+    return seconds
+
+
+def stuck_stage(seconds, deadline):
+    """Etapa de prueba que ignora el plazo, como una llamada larga a dlib"""
+    time.sleep(seconds)
+    return seconds
+
+
+class BatchedFaceComparisonTests(SimpleTestCase):
+    def setUp(self):
+        self.service = AdvancedFaceRecognitionService()
+        self.rng = np.random.default_rng(360)
+
+    def test_parity_with_reference_on_random_inputs(self):
+        config = self.service.ADVANCED_CONFIG
+        matches = 0
+        for _ in range(300):
+            probe_center = self.rng.normal(0, 0.09, 128)
+            probe = probe_center + self.rng.normal(0, 0.02, 128)
+            center = probe_center if self.rng.random() < 0.5 else self.rng.normal(0, 0.09, 128)
+            stored_data = random_stored_data(self.rng, center)
+            probe_landmarks = self.rng.uniform(0, 300, 144) if self.rng.random() < 0.7 else None
+
+            expected_match, expected_confidence = reference_face_comparison(
+                config, stored_data, probe, probe_landmarks
+            )
+            is_match, confidence, _ = self.service.advanced_face_comparison(
+                stored_data, probe, probe_landmarks
+            )
+
+            self.assertEqual(is_match, expected_match)
+            self.assertAlmostEqual(confidence, expected_confidence, places=9)
+            matches += is_match
+        # El conjunto aleatorio debe ejercitar ambos resultados
+        self.assertTrue(0 < matches < 300)
+
+    def test_batched_returns_per_template_metrics(self):
+        probe = self.rng.normal(0, 0.09, 128)
+        stored = probe + self.rng.normal(0, 0.01, (4, 128))
+
+        result = self.service.batched_face_comparison(stored, probe)
+
+        self.assertEqual(result['templates']['distances'].shape, (4,))
+        np.testing.assert_allclose(
+            result['templates']['distances'], np.linalg.norm(stored - probe, axis=1)
+        )
+        self.assertEqual(result['excellent_matches'], 4)
+        self.assertTrue(result['is_match'])
+
+    def test_empty_stored_data_is_rejected(self):
+        is_match, confidence, details = self.service.advanced_face_comparison(
+            {'encodings': []}, self.rng.normal(0, 0.09, 128), None
+        )
+        self.assertFalse(is_match)
+        self.assertEqual(confidence, 0.0)
+        self.assertEqual(details, "Sin datos de rostro registrados")
+
+
+class GalleryParityTests(SimpleTestCase):
+    """La galería vectorizada toma las mismas decisiones que la comparación empleado por empleado"""
+
+    def setUp(self):
+        self.config = dict(AdvancedFaceRecognitionService().ADVANCED_CONFIG)
+        self.rng = np.random.default_rng(2024)
+        self.probe_center = self.rng.normal(0, 0.09, 128)
+        self.probe = self.probe_center + self.rng.normal(0, 0.02, 128)
+        self.probe_landmarks = self.rng.uniform(0, 300, 144)
+        # Mitad de los empleados parecidos al rostro consultado, para ejercitar matches y rechazos
+        self.stored = [
+            random_stored_data(self.rng, self.probe_center if index % 2 else self.rng.normal(0, 0.09, 128))
+            for index in range(40)
+        ]
+        self.stored.append({'encodings': []})
+
+    def snapshot(self, stored, dtype):
+        employees = [{'id': index} for index in range(len(stored))]
+        return GallerySnapshot(employees, [parse_face_data(data) for data in stored], dtype=dtype)
+
+    def as_float32(self, data):
+        """Los datos tal como los devuelve la plantilla binaria (float32)"""
+        def rounded(vector):
+            return np.asarray(vector, dtype=np.float32).astype(np.float64).tolist()
+        return {
+            'encodings': [rounded(encoding) for encoding in data.get('encodings', [])],
+            'landmarks': [rounded(landmarks) for landmarks in data.get('landmarks', [])],
+            'environmental_adaptations': [
+                [{'encoding': rounded(adaptation['encoding'])} for adaptation in group]
+                for group in data.get('environmental_adaptations', [])
+            ],
+        }
+
+    def assert_parity(self, stored, dtype, config):
+        scores = self.snapshot(stored, dtype).score(self.probe, self.probe_landmarks, config)
+        for index, data in enumerate(stored):
+            expected_match, expected_confidence = reference_face_comparison(
+                config, data, self.probe, self.probe_landmarks
+            )
+            self.assertEqual(bool(scores['is_match'][index]), expected_match, f'empleado {index}')
+            self.assertAlmostEqual(float(scores['confidence'][index]), expected_confidence, places=9)
+        return scores
+
+    def test_float64_gallery_matches_reference(self):
+        scores = self.assert_parity(self.stored, np.float64, self.config)
+        self.assertTrue(0 < scores['is_match'].sum() < len(self.stored))
+
+    def test_float32_gallery_matches_reference_on_stored_template(self):
+        # La galería de producción es float32, igual que la plantilla que leería la comparación por empleado
+        self.assert_parity([self.as_float32(data) for data in self.stored], np.float32, self.config)
+
+    def test_decisions_hold_at_the_threshold(self):
+        stored = [self.as_float32(data) for data in self.stored]
+        confidences = [
+            reference_face_comparison(self.config, data, self.probe, self.probe_landmarks)[1] for data in stored
+        ]
+        near = max(confidences)
+        # Umbral justo encima y justo debajo de la confianza de un empleado
+        for offset in (-1e-9, 1e-9):
+            config = dict(self.config, min_confidence=near + offset)
+            scores = self.assert_parity(stored, np.float32, config)
+            self.assertEqual(bool(scores['is_match'][int(np.argmax(confidences))]), offset < 0)
+
+
+class IVFIndexTests(SimpleTestCase):
+    def test_candidates_contain_exact_best_match(self):
+        config = AdvancedFaceRecognitionService().ADVANCED_CONFIG
+        snapshot, centers, landmark_shapes = synthetic_gallery(500, seed=3)
+        probes, probe_landmarks, owners = synthetic_probes(centers, landmark_shapes, 20, seed=4)
+        index = IVFIndex.train(snapshot.encodings, nlist=32).add(snapshot.encodings, snapshot.encoding_owner)
+
+        for probe, landmarks, owner in zip(probes, probe_landmarks, owners):
+            exact_best = best_match_index(snapshot.score(probe, landmarks, config))
+            self.assertEqual(exact_best, owner)
+
+            candidates = np.sort(index.search(probe, nprobe=8, top_k=10))
+            subset_scores = snapshot.subset(candidates).score(probe, landmarks, config)
+            subset_best = best_match_index(subset_scores)
+            self.assertEqual(candidates[subset_best] if subset_best >= 0 else -1, exact_best)
+
+
+    def test_replace_updates_the_index_incrementally(self):
+        config = dict(AdvancedFaceRecognitionService().ADVANCED_CONFIG,
+                      ann_index_path='/nonexistent/ivf.npz', ann_nlist=16)
+        snapshot, centers, landmark_shapes = synthetic_gallery(300, seed=3)
+        replacement, _, _ = synthetic_gallery(2, seed=9)
+        replacement.employees = [dict(employee, id=f'nuevo-{i}') for i, employee in enumerate(replacement.employees)]
+        index = snapshot.get_index(config)
+
+        updated = snapshot.replace({5, 120, 299}, replacement)
+        self.assertIsNotNone(updated._index)
+        rebuilt = build_gallery_index(updated, config, centroids=index.centroids)
+
+        np.testing.assert_array_equal(updated.get_index(config).list_offsets, rebuilt.list_offsets)
+        for start, end in zip(rebuilt.list_offsets[:-1], rebuilt.list_offsets[1:]):
+            self.assertEqual(sorted(updated._index.owner[start:end]), sorted(rebuilt.owner[start:end]))
+        probes, _, _ = synthetic_probes(centers, landmark_shapes, 10, seed=4)
+        for probe in probes:
+            np.testing.assert_array_equal(updated._index.search(probe, 4, 10), rebuilt.search(probe, 4, 10))
+
+
+class CoarseMatchingTests(SimpleTestCase):
+    def setUp(self):
+        self.config = AdvancedFaceRecognitionService().ADVANCED_CONFIG
+        self.snapshot, centers, landmark_shapes = synthetic_gallery(400, seed=11)
+        self.probes, self.probe_landmarks, self.owners = synthetic_probes(
+            centers, landmark_shapes, 40, seed=12, impostor_ratio=0.25
+        )
+
+    def test_decisions_match_exhaustive_scan(self):
+        gallery = FaceGallery()
+        exhaustive_config = dict(self.config, coarse_enabled=False)
+
+        with mock.patch.object(gallery, 'get_snapshot', return_value=self.snapshot):
+            for probe, landmarks in zip(self.probes, self.probe_landmarks):
+                exhaustive = gallery.match(probe, landmarks, exhaustive_config)
+                coarse = gallery.match(probe, landmarks, self.config)
+                self.assertLess(len(coarse), len(exhaustive))
+
+                expected = {r['employee']['id']: r['confidence'] for r in exhaustive if r['match']}
+                actual = {r['employee']['id']: r['confidence'] for r in coarse if r['match']}
+                self.assertEqual(actual.keys(), expected.keys())
+                for employee_id, confidence in actual.items():
+                    self.assertAlmostEqual(confidence, expected[employee_id], places=9)
+
+    def test_results_list_only_compared_candidates(self):
+        gallery = FaceGallery()
+        probe, landmarks = self.probes[0], self.probe_landmarks[0]
+        with mock.patch.object(gallery, 'get_snapshot', return_value=self.snapshot):
+            results = gallery.match(probe, landmarks, self.config)
+
+        candidates = self.snapshot.coarse_candidates(probe, self.config)
+        self.assertEqual([r['employee']['id'] for r in results], candidates.tolist())
+
+        # Los empleados omitidos no podían ser match con la comparación completa
+        scores = self.snapshot.score(probe, landmarks, self.config)
+        omitted = np.setdiff1d(np.arange(self.snapshot.size), candidates)
+        self.assertTrue(omitted.size)
+        self.assertFalse(scores['is_match'][omitted].any())
+        self.assertTrue((scores['acceptable_matches'][omitted] < self.config['min_matches']).all())
+
+    def test_candidates_include_nearest_and_skip_distant(self):
+        probe = self.probes[0]
+        candidates = self.snapshot.coarse_candidates(probe, self.config)
+        self.assertGreaterEqual(len(candidates), self.config['coarse_top_n'])
+        self.assertLess(len(candidates), self.snapshot.size // 4)
+        if self.owners[0] >= 0:
+            self.assertIn(self.owners[0], candidates)
+
+
+class MatchBenchmarkTests(SimpleTestCase):
+    def test_chunked_gallery_matches_single_build(self):
+        single, _, _ = synthetic_gallery(25, seed=5)
+        chunked, _, _ = synthetic_gallery(25, seed=5, chunk_size=10)
+        for name in ('encodings', 'adaptations', 'landmarks', 'employee_centroids', 'encoding_owner'):
+            np.testing.assert_array_equal(getattr(chunked, name), getattr(single, name))
+        self.assertEqual([e['id'] for e in chunked.employees], list(range(25)))
+
+    def test_stored_face_data_scores_like_gallery(self):
+        service = AdvancedFaceRecognitionService()
+        snapshot, centers, landmark_shapes = synthetic_gallery(20, seed=6)
+        probes, probe_landmarks, _ = synthetic_probes(centers, landmark_shapes, 5, seed=7)
+
+        for index, (probe, landmarks) in enumerate(zip(probes, probe_landmarks)):
+            is_match, confidence, _ = service.advanced_face_comparison(
+                stored_face_data(snapshot, index), probe, landmarks
+            )
+            scores = snapshot.subset([index]).score(probe, landmarks, service.ADVANCED_CONFIG)
+            self.assertEqual(is_match, bool(scores['is_match'][0]))
+            self.assertAlmostEqual(confidence, float(scores['confidence'][0]), places=6)
+
+    def test_find_regressions_flags_only_shared_sizes_over_tolerance(self):
+        baseline = {'sizes': [
+            {'employees': 100, 'gallery_match': {'p50_ms': 1.0, 'p95_ms': 2.0, 'peak_bytes': 1000}},
+            {'employees': 1000, 'gallery_match': {'p50_ms': 5.0, 'p95_ms': 8.0, 'peak_bytes': 1000}},
+        ]}
+        current = {'sizes': [
+            {'employees': 100, 'gallery_match': {'p50_ms': 1.2, 'p95_ms': 3.0, 'peak_bytes': 1000}},
+            {'employees': 10000, 'gallery_match': {'p50_ms': 50.0, 'p95_ms': 80.0, 'peak_bytes': 9000}},
+            {'employees': 1000, 'gallery_match': {'p50_ms': 5.0, 'p95_ms': 8.0, 'peak_bytes': 1000},
+             'legacy_scan': None},
+        ]}
+
+        regressions = find_regressions(baseline, current, tolerance=0.25)
+        self.assertEqual([(r['employees'], r['metric']) for r in regressions], [(100, 'p95_ms')])
+
+
+class PipelineBenchmarkTests(SimpleTestCase):
+    def test_load_payloads_reads_images_base64_and_request_bodies(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), (120, 110, 100)).save(buffer, 'JPEG')
+        photo = buffer.getvalue()
+        encoded = base64.b64encode(photo).decode()
+        with tempfile.TemporaryDirectory() as payloads_dir:
+            with open(os.path.join(payloads_dir, 'a.jpg'), 'wb') as payload_file:
+                payload_file.write(photo)
+            with open(os.path.join(payloads_dir, 'b.b64'), 'w') as payload_file:
+                payload_file.write(f'data:image/jpeg;base64,{encoded}\n')
+            with open(os.path.join(payloads_dir, 'c.json'), 'w') as payload_file:
+                json.dump({'photos': [encoded, encoded]}, payload_file)
+            with open(os.path.join(payloads_dir, 'notas.md'), 'w') as payload_file:
+                payload_file.write('ignorado')
+
+            payloads = load_payloads(payloads_dir)
+
+        self.assertEqual([name for name, _ in payloads], ['a.jpg', 'b.b64', 'c.json[0]', 'c.json[1]'])
+        self.assertTrue(all(data == photo for _, data in payloads))
+
+    def test_winning_variant(self):
+        attempts = [('original', False), ('clahe', True)]
+        self.assertEqual(winning_variant({'success': True, 'variant_attempts': attempts}), 'clahe')
+        self.assertEqual(winning_variant({'success': True, 'variant_attempts': attempts[:1]}), 'full_resolution')
+        self.assertIsNone(winning_variant({'success': False, 'reason': 'no_face', 'variant_attempts': attempts[:1]}))
+
+    def test_default_worker_counts(self):
+        self.assertEqual(default_worker_counts(1), [1])
+        self.assertEqual(default_worker_counts(6), [1, 2, 4, 6])
+        self.assertEqual(default_worker_counts(8), [1, 2, 4, 8])
+
+
+class AttendanceQueryBenchmarkTests(TransactionTestCase):
+    def test_measures_with_and_without_indexes_and_cleans_up(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            output = os.path.join(output_dir, 'resultados.json')
+            call_command('bench_attendance_queries', rows=500, employees=5, days=10, queries=10,
+                         json=output, stdout=io.StringIO())
+            with open(output) as results_file:
+                results = json.load(results_file)
+
+        self.assertEqual(results['rows'], 500)
+        without, with_indexes = results['phases']['without_indexes'], results['phases']['with_indexes']
+        self.assertEqual(without['duplicate_check']['count'], 10)
+        self.assertNotIn('attendance_emp_type_ts_idx', without['duplicate_check']['explain'])
+        self.assertIn('attendance_emp_type_ts_idx', with_indexes['duplicate_check']['explain'])
+        self.assertIn('attendance_timestamp_idx', with_indexes['attendance_records']['explain'])
+
+        self.assertTrue({'attendance_emp_type_ts_idx', 'attendance_timestamp_idx'} <= existing_indexes())
+        self.assertEqual(AttendanceRecord.objects.count(), 0)
+        self.assertFalse(Employee.objects.exists())
+
+    def test_configured_database_needs_a_throwaway_copy_or_i_know(self):
+        command = 'facial_recognition.management.commands.bench_attendance_queries'
+        with mock.patch(f'{command}.using_test_database', return_value=False), \
+                mock.patch(f'{command}.Command.benchmark') as benchmark, \
+                mock.patch('django.db.connection.creation.create_test_db') as create_test_db, \
+                mock.patch('django.db.connection.creation.destroy_test_db') as destroy_test_db:
+            with self.assertRaises(CommandError):
+                call_command('bench_attendance_queries', keep=True, stdout=io.StringIO())
+            self.assertFalse(benchmark.called)
+
+            benchmark.side_effect = RuntimeError
+            with self.assertRaises(RuntimeError):
+                call_command('bench_attendance_queries', stdout=io.StringIO())
+            self.assertEqual((create_test_db.call_count, destroy_test_db.call_count), (1, 1))
+
+            benchmark.side_effect = None
+            call_command('bench_attendance_queries', keep=True, i_know=True, stdout=io.StringIO())
+            self.assertEqual((create_test_db.call_count, benchmark.call_count), (1, 2))
+
+
+class FaceTemplateTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.face_data = {
+            'encodings': [rng.normal(0, 0.09, 128).tolist() for _ in range(5)],
+            'landmarks': [rng.uniform(0, 400, 144).tolist() for _ in range(4)] + [None],
+            'environmental_adaptations': [
+                [{'encoding': rng.normal(0, 0.09, 128).tolist(), 'condition': 'low_light',
+                  'brightness': 0.7, 'contrast': 1.25} for _ in range(3)]
+                for _ in range(5)
+            ],
+        }
+
+    def test_round_trip_matches_json_reader(self):
+        expected = parse_face_data(self.face_data)
+        decoded = decode_face_template(encode_face_template(self.face_data))
+
+        np.testing.assert_allclose(decoded['encodings'], expected['encodings'], atol=1e-6)
+        np.testing.assert_allclose(decoded['adaptations'], expected['adaptations'], atol=1e-6)
+        self.assertEqual(len(decoded['landmarks']), 4)
+        self.assertEqual(decoded['adaptation_groups'][0][0]['condition'], 'low_light')
+
+    def test_template_stores_centroid_and_radius(self):
+        decoded = decode_face_template(encode_face_template(self.face_data, dtype='float16'))
+        encodings = np.asarray(decoded['encodings'], dtype=np.float64)
+
+        np.testing.assert_allclose(decoded['centroid'], encodings.mean(axis=0), atol=1e-3)
+        distances = np.linalg.norm(encodings - decoded['centroid'], axis=1)
+        self.assertAlmostEqual(decoded['radius'], distances.max(), places=6)
+
+    def test_version_1_template_computes_centroid_on_read(self):
+        blob = bytearray(encode_face_template(self.face_data))
+        blob[4] = 1
+        decoded = decode_face_template(bytes(blob))
+
+        np.testing.assert_allclose(decoded['centroid'], np.mean(decoded['encodings'], axis=0), atol=1e-6)
+
+    def test_binary_template_is_much_smaller_than_json(self):
+        blob = encode_face_template(self.face_data, dtype='float16')
+        self.assertLess(len(blob) * 8, len(json.dumps(self.face_data)))
+
+    def test_reader_falls_back_to_json(self):
+        employee = Employee(face_encoding=json.dumps(self.face_data))
+        self.assertEqual(len(read_face_data(employee)['encodings']), 5)
+
+        employee.face_template = encode_face_template(self.face_data)
+        employee.face_encoding = None
+        self.assertEqual(len(read_face_data(employee)['encodings']), 5)
+
+    def test_frozen_migration_encoder_is_readable(self):
+        migration = importlib.import_module('facial_recognition.migrations.0004_convert_face_encodings')
+        blob = migration.encode_face_template(self.face_data)
+        self.assertEqual(blob[4], 1)
+
+        decoded = decode_face_template(blob)
+        current = decode_face_template(encode_face_template(self.face_data))
+        for key in ('encodings', 'adaptations'):
+            np.testing.assert_array_equal(decoded[key], current[key])
+        self.assertEqual(len(decoded['landmarks']), 4)
+        np.testing.assert_allclose(decoded['centroid'], current['centroid'], atol=1e-6)
+
+
+class RutLookupTests(TestCase):
+    def setUp(self):
+        self.employee = Employee.objects.create(
+            name='Ana', rut='12345678-5', employee_id='EMP-1', email='', department='General', position='Empleado'
+        )
+
+    def test_save_keeps_normalized_rut_in_sync(self):
+        self.assertEqual(normalize_rut('12.345.678-k'), '12345678K')
+        self.assertEqual(self.employee.rut_normalized, '123456785')
+
+        self.employee.rut = '11.111.111-1'
+        self.employee.save(update_fields=['rut'])
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.rut_normalized, '111111111')
+
+    def test_search_is_a_single_query_in_any_format(self):
+        for rut in ('12345678-5', '12.345.678-5', '123456785'):
+            with self.assertNumQueries(1):
+                self.assertEqual(search_employee_by_rut(rut), self.employee)
+
+        Employee.objects.filter(id=self.employee.id).update(is_active=False)
+        self.assertIsNone(search_employee_by_rut('12.345.678-5'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(search_employee_by_rut('---'))
+
+    def test_qr_and_profile_update_match_formatted_ruts(self):
+        response = self.client.post('/api/verify-qr/', {'qr_data': '12.345.678-5', 'type': 'entrada'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        other = Employee.objects.create(
+            name='Luis', rut='11111111-1', employee_id='EMP-2', email='', department='General', position='Empleado'
+        )
+        # Mismo RUT con otro formato que el guardado: ya está en uso
+        Employee.objects.filter(id=self.employee.id).update(rut='12.345.678-5')
+        response = self.client.post(f'/api/update-employee-profile/{other.id}/', {'rut': '123456785'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_backfill_migration(self):
+        backfill = importlib.import_module('facial_recognition.migrations.0009_backfill_rut_normalized')
+        for index in range(4):
+            Employee.objects.create(
+                name=f'Empleado {index}', rut=f'1{index}.111.111-k', employee_id=f'EMP-{index + 2}',
+                email='', department='General', position='Empleado'
+            )
+        Employee.objects.update(rut_normalized='')
+
+        # Una consulta de lectura más un UPDATE por lote, no uno por empleado
+        with mock.patch.object(backfill, 'BATCH_SIZE', 2), self.assertNumQueries(4):
+            backfill.backfill_rut_normalized(django_apps, None)
+        for employee in Employee.objects.all():
+            self.assertEqual(employee.rut_normalized, normalize_rut(employee.rut))
+            self.assertEqual(backfill.normalize_rut(employee.rut), normalize_rut(employee.rut))
+        self.assertEqual(Employee.objects.get(employee_id=self.employee.employee_id).rut_normalized, '123456785')
+
+
+class FaceGallerySyncTests(TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(11)
+        self.gallery = FaceGallery()
+
+    def create_employee(self, name, rut):
+        face_data = {'encodings': [self.rng.normal(0, 0.06, 128).tolist() for _ in range(3)]}
+        with self.captureOnCommitCallbacks(execute=True):
+            return Employee.objects.create(
+                name=name, rut=rut, employee_id=f'EMP-{rut}', email='', department='General',
+                position='Empleado', has_face_registered=True,
+                face_template=encode_face_template(face_data)
+            )
+
+    def gallery_names(self):
+        return sorted(employee['name'] for employee in self.gallery.get_snapshot().employees)
+
+    def test_saved_changes_are_applied_incrementally(self):
+        self.create_employee('Ana', '11111111-1')
+        self.assertEqual(self.gallery_names(), ['Ana'])
+
+        # Solo se recarga el empleado modificado y la generación queda al día
+        bruno = self.create_employee('Bruno', '22222222-2')
+        self.assertEqual(self.gallery_names(), ['Ana', 'Bruno'])
+        self.assertEqual(self.gallery.generation, FaceGalleryChange.current_generation())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bruno.is_active = False
+            bruno.save()
+        self.assertEqual(self.gallery_names(), ['Ana'])
+
+    def test_only_gallery_field_changes_publish_a_generation(self):
+        ana = self.create_employee('Ana', '11111111-1')
+        generation = FaceGalleryChange.current_generation()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.department = 'Ventas'
+            ana.save()
+            ana.rut = '22222222-2'
+            ana.save(update_fields=['rut'])
+            Employee.objects.only('id', 'name').get(id=ana.id).save()
+        self.assertEqual(FaceGalleryChange.current_generation(), generation)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.face_template = encode_face_template({'encodings': [self.rng.normal(0, 0.06, 128).tolist()]})
+            ana.save()
+        self.assertEqual(FaceGalleryChange.current_generation(), generation + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.delete()
+        self.assertEqual(FaceGalleryChange.current_generation(), generation + 2)
+
+    def test_full_reload_prunes_old_changes(self):
+        old = FaceGalleryChange.objects.create(employee_uuid=uuid.uuid4())
+        FaceGalleryChange.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=2))
+        recent = FaceGalleryChange.objects.create(employee_uuid=uuid.uuid4())
+
+        self.gallery.load()
+
+        self.assertEqual(list(FaceGalleryChange.objects.values_list('id', flat=True)), [recent.id])
+
+    def test_other_process_changes_are_seen_before_matching(self):
+        ana = self.create_employee('Ana', '11111111-1')
+        self.gallery.get_snapshot()
+
+        # Cambio hecho por otro proceso: no pasa por las señales de este proceso
+        Employee.objects.filter(id=ana.id).update(name='Ana María')
+        FaceGalleryChange.objects.create(employee_uuid=ana.id)
+        self.assertEqual(self.gallery_names(), ['Ana María'])
+
+        Employee.objects.filter(id=ana.id).delete()
+        FaceGalleryChange.objects.create(employee_uuid=ana.id)
+        self.assertEqual(self.gallery_names(), [])
+
+    def test_change_committed_out_of_order_is_not_skipped(self):
+        ana = self.create_employee('Ana', '11111111-1')
+        bruno = self.create_employee('Bruno', '22222222-2')
+        self.gallery.get_snapshot()
+        generation = FaceGalleryChange.current_generation()
+
+        # Otro proceso confirma la generación N+2 antes que la N+1
+        Employee.objects.filter(id=bruno.id).update(name='Bruno B.')
+        FaceGalleryChange.objects.create(id=generation + 2, employee_uuid=bruno.id)
+        self.assertEqual(self.gallery_names(), ['Ana', 'Bruno B.'])
+        self.assertEqual(self.gallery.generation, generation + 2)
+
+        Employee.objects.filter(id=ana.id).update(is_active=False)
+        FaceGalleryChange.objects.create(id=generation + 1, employee_uuid=ana.id)
+        self.assertEqual(self.gallery_names(), ['Bruno B.'])
+
+        # Los cambios ya aplicados de la ventana no se vuelven a aplicar
+        with mock.patch.object(self.gallery, '_replacement_for') as replacement_for:
+            self.gallery.sync()
+        self.assertFalse(replacement_for.called)
+
+    def test_busy_process_still_reloads_periodically(self):
+        self.create_employee('Ana', '11111111-1')
+        self.gallery.load()
+        loaded_at = time.time()
+        with mock.patch.object(self.gallery, 'load', wraps=self.gallery.load) as load:
+            for elapsed in (60, 3600, GALLERY_RESYNC_SECONDS - 1):
+                with mock.patch('facial_recognition.face_gallery.time.time', return_value=loaded_at + elapsed):
+                    self.gallery.sync()
+            self.assertFalse(load.called)
+            with mock.patch('facial_recognition.face_gallery.time.time',
+                            return_value=loaded_at + GALLERY_RESYNC_SECONDS + 1):
+                self.gallery.sync()
+            self.assertEqual(load.call_count, 1)
+
+
+class WorkerPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = WorkerPool('prueba')
+        self.pool.configure(workers=1, queue_size=0)
+        self.addCleanup(self.pool.shutdown)
+
+    def wait_until_idle(self):
+        for _ in range(100):
+            if self.pool.stats()['in_flight'] == 0:
+                return
+            time.sleep(0.05)
+        self.fail("El pool no terminó sus trabajos")
+
+    def test_full_queue_rejects_and_deadline_abandons(self):
+        worker = threading.Thread(
+            target=self.pool.run, args=(slow_stage, 1.0), kwargs={'deadline': time.time() + 30}
+        )
+        worker.start()
+        for _ in range(100):
+            if self.pool.stats()['in_flight']:
+                break
+            time.sleep(0.01)
+
+        with self.assertRaises(WorkerPoolBusy):
+            self.pool.run(slow_stage, 0.0, deadline=time.time() + 30)
+        worker.join()
+        self.assertEqual(self.pool.stats()['rejected'], 1)
+
+        # El cliente deja de esperar al vencer el plazo y el proceso abandona el trabajo
+        start = time.time()
+        with self.assertRaises(DeadlineExceeded):
+            self.pool.run(slow_stage, 1.0, deadline=time.time() + 0.2)
+        self.assertLess(time.time() - start, 0.5)
+        self.wait_until_idle()
+
+        stats = self.pool.stats()
+        self.assertEqual(stats['timed_out'], 1)
+        self.assertEqual(stats['abandoned'], 1)
+        self.assertEqual(self.pool.run(slow_stage, 0.0, deadline=time.time() + 30), 0.0)
+
+    def test_map_waits_for_free_workers_and_keeps_order(self):
+        deadline = time.time() + 30
+        results = self.pool.map(slow_stage, [(0.3, deadline), (0.0, deadline), (0.1, deadline)])
+        self.assertEqual(results, [0.3, 0.0, 0.1])
+        self.assertEqual(self.pool.stats()['rejected'], 0)
+
+    def test_stuck_job_recycles_the_pool(self):
+        self.pool.abandon_grace = 0.2
+        with self.assertRaises(DeadlineExceeded):
+            self.pool.run(stuck_stage, 60.0, deadline=time.time() + 0.2)
+        self.wait_until_idle()
+
+        # El proceso bloqueado se detuvo y las solicitudes nuevas van a un pool nuevo
+        stats = self.pool.stats()
+        self.assertEqual(stats['recycled'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(self.pool.run(slow_stage, 0.0, deadline=time.time() + 30), 0.0)
+
+    def test_shutdown_pools_stops_every_pool(self):
+        self.assertEqual(self.pool.run(slow_stage, 0.0, deadline=time.time() + 30), 0.0)
+        processes = list(self.pool._executor._processes.values())
+        shutdown_pools()
+        self.assertIsNone(self.pool._executor)
+        self.assertTrue(processes)
+        self.assertFalse(any(process.is_alive() for process in processes))
+
+    def test_inline_mode_checks_deadline(self):
+        self.pool.configure(workers=0, queue_size=0)
+        self.assertEqual(self.pool.run(slow_stage, 0.0, deadline=time.time() + 5), 0.0)
+        with self.assertRaises(DeadlineExceeded):
+            self.pool.run(slow_stage, 0.0, deadline=time.time() - 1)
+        self.assertEqual(self.pool.stats()['abandoned'], 1)
+
+
+class EnhancementVariantTests(SimpleTestCase):
+    def test_variants_are_generated_only_when_consumed(self):
+        generated = []
+        variants = {
+            name: (lambda image, array, name=name: generated.append(name) or array)
+            for name in ENHANCEMENT_VARIANTS
+        }
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+
+        with mock.patch.dict(ENHANCEMENT_VARIANTS, variants):
+            for name, _ in enhanced_variants(image, ['clahe', 'original', 'gamma_0.8']):
+                if name == 'original':
+                    break
+            self.assertEqual(generated, ['clahe', 'original'])
+            self.assertEqual(list(enhanced_variants(image, deadline=time.time() - 1)), [])
+
+    def test_order_follows_hit_rates(self):
+        rates = VariantHitRates()
+        self.assertEqual(rates.order(), list(ENHANCEMENT_VARIANTS))
+
+        rates.record([('original', False), ('clahe', True)] * 5)
+        rates.record([('original', True), ('clahe', True)])
+        order = rates.order()
+        self.assertEqual(order[0], 'clahe')
+        self.assertEqual(order[-1], 'original')
+        self.assertEqual(rates.stats()['clahe']['hit_rate'], 1.0)
+
+
+class ProxyDetectionTests(SimpleTestCase):
+    def test_proxy_box_is_mapped_to_source_coordinates(self):
+        image = Image.new('RGB', (1200, 900))
+        proxy, scale_y, scale_x = detection_proxy(image, 400)
+        self.assertEqual(proxy.size, (400, 300))
+        self.assertEqual(scale_face_location((30, 250, 130, 150), scale_y, scale_x, (900, 1200)),
+                         (90, 750, 390, 450))
+        self.assertIs(detection_proxy(image, 0)[0], image)
+
+    def test_detection_runs_on_proxy_and_returns_full_resolution(self):
+        service = AdvancedFaceRecognitionService()
+        image = Image.new('RGB', (1200, 900), (120, 110, 100))
+        calls = []
+
+        def fake_face_locations(image_array, number_of_times_to_upsample=1, model='hog'):
+            calls.append(image_array.shape)
+            return [(30, 250, 130, 150)]
+
+        with mock.patch('facial_recognition.face_recognition_utils.face_recognition.face_locations',
+                        side_effect=fake_face_locations):
+            location, image_array, attempts = service.detect_face_in_variants(image)
+
+        self.assertEqual(calls, [(300, 400, 3)])
+        self.assertEqual(image_array.shape, (900, 1200, 3))
+        self.assertEqual(location, (90, 750, 390, 450))
+        self.assertEqual(attempts, [('original', True)])
+
+
+class FaceAnalysisTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.image_array = rng.integers(0, 255, (240, 320, 3), dtype=np.uint8)
+        self.location = (40, 220, 200, 60)
+
+    def test_matches_face_recognition_with_one_shape_pass(self):
+        import face_recognition
+        analysis = FaceAnalysis(self.image_array)
+        analysis.set_face(self.location, self.image_array)
+
+        encoding = analysis.encode(num_jitters=1)
+        landmarks = analysis.landmarks()
+        analysis.encode(num_jitters=1, image_array=255 - self.image_array)
+
+        expected = face_recognition.face_encodings(self.image_array, [self.location], model='large')[0]
+        np.testing.assert_allclose(encoding, expected, atol=1e-6)
+        self.assertEqual(landmarks, face_recognition.face_landmarks(self.image_array, [self.location])[0])
+        self.assertEqual(analysis.passes, {'detector': 0, 'shape': 1, 'encoding': 2})
+
+    def test_probe_reports_stage_timings_and_passes(self):
+        service = AdvancedFaceRecognitionService()
+        buffer = io.BytesIO()
+        Image.fromarray(self.image_array).save(buffer, 'PNG')
+
+        with mock.patch('facial_recognition.face_recognition_utils.face_recognition.face_locations',
+                        return_value=[self.location]):
+            probe = service.extract_probe(buffer.getvalue(), None, time.time() + 30)
+
+        self.assertTrue(probe['success'], probe.get('error'))
+        self.assertEqual(probe['stage_timings']['passes'], {'detector': 1, 'shape': 1, 'encoding': 1})
+        self.assertEqual(
+            set(probe['stage_timings']['timings_ms']),
+            {'decode', 'quality', 'detection', 'variant.original', 'encoding', 'landmarks'}
+        )
+        self.assertIn('is_frontal', probe['quality_info'])
+
+
+class DecodePhotoTests(SimpleTestCase):
+    def encode(self, image, format='JPEG'):
+        buffer = io.BytesIO()
+        image.save(buffer, format)
+        return buffer.getvalue()
+
+    def test_decodes_to_working_size_in_rgb(self):
+        data = self.encode(Image.new('RGB', (4000, 3000), (200, 30, 30)))
+        image = decode_photo('data:image/jpeg;base64,' + base64.b64encode(data).decode(), 1200)
+
+        self.assertEqual((image.mode, image.size), ('RGB', (1200, 900)))
+        red, green, blue = np.asarray(image)[450, 600]
+        self.assertGreater(red, 150)
+        self.assertLess(blue, 80)
+
+    def test_other_modes_and_small_images(self):
+        image = decode_photo(self.encode(Image.new('RGBA', (300, 200), (10, 200, 10, 128)), 'PNG'), 1200)
+        self.assertEqual((image.mode, image.size), ('RGB', (300, 200)))
+        image = decode_photo(self.encode(Image.new('L', (1000, 500), 90), 'GIF'), 400)
+        self.assertEqual((image.mode, image.size), ('RGB', (400, 200)))
+
+    def test_rejects_images_over_pixel_cap(self):
+        data = self.encode(Image.new('RGB', (1000, 1000)))
+        with self.assertRaises(ValueError):
+            decode_photo(data, 1200, max_pixels=500_000)
+
+
+class PhotoUploadTests(SimpleTestCase):
+    def setUp(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), (120, 110, 100)).save(buffer, 'JPEG')
+        self.jpeg = buffer.getvalue()
+        self.received = []
+
+        def advanced_verify(photo, device_id=None):
+            self.received.append(photo_bytes(photo))
+            return None, 'Rostro no reconocido'
+
+        patcher = mock.patch('facial_recognition.views.face_recognition_service.advanced_verify',
+                             side_effect=advanced_verify)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def received_photo(self):
+        return self.received[-1]
+
+    def test_raw_jpeg_body(self):
+        response = self.client.post('/api/verify-face/?type=salida', self.jpeg, content_type='image/jpeg')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.received_photo(), self.jpeg)
+
+    def test_multipart_upload(self):
+        self.client.post('/api/verify-face/', {
+            'type': 'entrada', 'photo': SimpleUploadedFile('foto.jpg', self.jpeg, 'image/jpeg')
+        })
+        self.assertEqual(self.received_photo(), self.jpeg)
+
+    def test_base64_json_still_accepted(self):
+        photo = 'data:image/jpeg;base64,' + base64.b64encode(self.jpeg).decode()
+        self.client.post('/api/verify-face/', {'photo': photo}, content_type='application/json')
+        self.assertEqual(self.received_photo(), self.jpeg)
+
+
+class BurstVerificationTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(9)
+        sharp = Image.fromarray(rng.integers(40, 220, (480, 640, 3), dtype=np.uint8))
+        self.frames = []
+        for radius in (6, 0, 3):
+            buffer = io.BytesIO()
+            frame = sharp.filter(ImageFilter.GaussianBlur(radius)) if radius else sharp
+            frame.save(buffer, 'JPEG', quality=90)
+            self.frames.append(buffer.getvalue())
+        self.service = AdvancedFaceRecognitionService()
+        self.verified = []
+
+    def verify_with(self, confidences):
+        def advanced_verify(photo, deadline=None):
+            index = self.frames.index(photo)
+            self.verified.append(index)
+            return {'best_match': {'id': 'x'}, 'best_confidence': confidences[index]}, None
+        return mock.patch.object(self.service, 'advanced_verify', side_effect=advanced_verify)
+
+    def test_sharpest_frame_first_with_early_exit(self):
+        with self.verify_with([0.9, 0.9, 0.9]):
+            result, error = self.service.advanced_verify_burst(self.frames)
+
+        self.assertIsNone(error)
+        self.assertEqual(self.verified, [1])
+        self.assertEqual(result['burst']['selected_frame'], 1)
+        self.assertEqual(result['burst']['scored'], 3)
+
+    def test_keeps_best_of_top_candidates(self):
+        with self.verify_with([0.99, 0.78, 0.8]):
+            result, error = self.service.advanced_verify_burst(self.frames + [b'no es una imagen'])
+
+        self.assertEqual(self.verified, [1, 2])
+        self.assertEqual(result['best_confidence'], 0.8)
+        self.assertEqual(result['burst']['selected_frame'], 2)
+        self.assertEqual(result['burst']['frames'], 4)
+        self.assertEqual(result['burst']['scored'], 3)
+
+    def test_endpoint_accepts_multipart_frames(self):
+        received = []
+
+        def advanced_verify_burst(photos):
+            received.extend(photo_bytes(photo) for photo in photos)
+            return None, 'Rostro no reconocido'
+
+        with mock.patch('facial_recognition.views.face_recognition_service.advanced_verify_burst',
+                        side_effect=advanced_verify_burst):
+            response = self.client.post('/api/verify-face-burst/', {
+                'type': 'entrada',
+                'photos': [SimpleUploadedFile(f'cuadro{i}.jpg', frame, 'image/jpeg')
+                           for i, frame in enumerate(self.frames)],
+            })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(received, self.frames)
+
+
+class GroupCheckInTests(TestCase):
+    def setUp(self):
+        self.config = AdvancedFaceRecognitionService().ADVANCED_CONFIG
+        self.snapshot, centers, landmark_shapes = synthetic_gallery(200, seed=21)
+        self.probes, self.probe_landmarks, self.owners = synthetic_probes(
+            centers, landmark_shapes, 6, seed=22, impostor_ratio=0.3
+        )
+
+    def test_batch_match_agrees_with_single_face_scan(self):
+        gallery = FaceGallery()
+        with mock.patch.object(gallery, 'get_snapshot', return_value=self.snapshot):
+            matches = gallery.match_batch(self.probes, self.probe_landmarks, self.config)
+
+        for probe, landmarks, match in zip(self.probes, self.probe_landmarks, matches):
+            expected = best_match_index(self.snapshot.score(probe, landmarks, self.config))
+            self.assertEqual(match['employee']['id'] if match else -1, expected)
+
+    def test_stacked_products_score_like_single_probes(self):
+        products = self.snapshot.probe_products(self.probes, self.probe_landmarks)
+        for probe, landmarks, face_products in zip(self.probes, self.probe_landmarks, products):
+            single = self.snapshot.score(probe, landmarks, self.config)
+            stacked = self.snapshot.score(probe, landmarks, self.config, face_products)
+            np.testing.assert_array_equal(stacked['is_match'], single['is_match'])
+            np.testing.assert_allclose(stacked['confidence'], single['confidence'], rtol=0, atol=1e-12)
+
+    def test_batch_match_equals_per_face_match(self):
+        gallery = FaceGallery()
+        probes = list(self.probes) + [self.probes[0] + 0.01]
+        landmarks = list(self.probe_landmarks) + [None]
+        for config in (self.config, dict(self.config, coarse_enabled=False)):
+            with mock.patch.object(gallery, 'get_snapshot', return_value=self.snapshot):
+                matches = gallery.match_batch(probes, landmarks, config)
+                for probe, face_landmarks, match in zip(probes, landmarks, matches):
+                    single = [r for r in gallery.match(probe, face_landmarks, config) if r['match']]
+                    best = max(single, key=lambda r: r['confidence']) if single else None
+                    self.assertEqual(match['employee']['id'] if match else None,
+                                     best['employee']['id'] if best else None)
+                    if best:
+                        self.assertAlmostEqual(match['confidence'], best['confidence'], places=12)
+                        self.assertEqual(match['details'], best['details'])
+
+    def test_group_frame_encodes_every_face_in_one_batch(self):
+        import face_recognition
+        service = AdvancedFaceRecognitionService()
+        image_array = np.random.default_rng(23).integers(0, 255, (240, 320, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(image_array).save(buffer, 'PNG')
+        locations = [(20, 300, 200, 180), (40, 140, 200, 10)]
+
+        with mock.patch('facial_recognition.face_recognition_utils.face_recognition.face_locations',
+                        return_value=locations):
+            probes = service.extract_group_probes(buffer.getvalue(), None, time.time() + 30)
+
+        self.assertTrue(probes['success'], probes.get('error'))
+        self.assertEqual(probes['face_locations'], locations)
+        expected = face_recognition.face_encodings(image_array, locations, model='large')
+        np.testing.assert_allclose(probes['encodings'], expected, atol=1e-6)
+
+    def test_one_record_per_employee_with_duplicate_check(self):
+        ana, luis = [
+            Employee.objects.create(
+                name=name, rut=rut, employee_id=f'EMP-{rut}', email='', department='General',
+                position='Empleado', has_face_registered=True
+            )
+            for name, rut in (('Ana', '11111111-1'), ('Luis', '22222222-2'))
+        ]
+        AttendanceRecord.objects.create(employee=luis, attendance_type='entrada', verification_method='facial')
+        faces = [
+            {'face_location': (0, 10, 10, 0), 'employee': {'id': ana.id}, 'confidence': 0.9, 'details': ''},
+            {'face_location': (0, 30, 10, 20), 'employee': {'id': luis.id}, 'confidence': 0.8, 'details': ''},
+            {'face_location': (0, 50, 10, 40), 'employee': None, 'confidence': 0.0, 'details': None},
+        ]
+
+        with mock.patch('facial_recognition.views.face_recognition_service.advanced_verify_group',
+                        return_value=({'faces': faces, 'recognized': 2, 'elapsed_time': 0.1}, None)):
+            response = self.client.post('/api/verify-face-group/', {'photo': 'x', 'type': 'entrada'},
+                                        content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['unrecognized_faces'], 1)
+        self.assertEqual(
+            {r['employee']['name']: r['duplicate_found'] for r in body['results']},
+            {'Ana': False, 'Luis': True}
+        )
+        self.assertEqual(AttendanceRecord.objects.filter(employee=ana).count(), 1)
+        self.assertEqual(AttendanceRecord.objects.filter(employee=luis).count(), 1)
+
+    def test_two_faces_matching_one_employee_are_not_counted_as_unrecognized(self):
+        ana = Employee.objects.create(
+            name='Ana', rut='11111111-1', employee_id='EMP-1', email='', department='General',
+            position='Empleado', has_face_registered=True
+        )
+        faces = [
+            {'face_location': (0, 10, 10, 0), 'employee': {'id': ana.id}, 'confidence': 0.8, 'details': ''},
+            {'face_location': (0, 30, 10, 20), 'employee': {'id': ana.id}, 'confidence': 0.9, 'details': ''},
+            {'face_location': (0, 50, 10, 40), 'employee': None, 'confidence': 0.0, 'details': None},
+        ]
+
+        with mock.patch('facial_recognition.views.face_recognition_service.advanced_verify_group',
+                        return_value=({'faces': faces, 'recognized': 1, 'elapsed_time': 0.1}, None)):
+            body = self.client.post('/api/verify-face-group/', {'photo': 'x', 'type': 'entrada'},
+                                    content_type='application/json').json()
+
+        self.assertEqual((body['unrecognized_faces'], body['duplicate_matches']), (1, 1))
+        self.assertEqual([r['face_location'] for r in body['results']], [[0, 30, 10, 20]])
+        self.assertEqual(AttendanceRecord.objects.filter(employee=ana).count(), 1)
+
+    def test_same_employee_on_two_faces_is_recognised_once(self):
+        service = AdvancedFaceRecognitionService()
+        employee = {'id': 1, 'name': 'Ana'}
+        probes = {
+            'success': True, 'face_locations': [(0, 10, 10, 0), (0, 30, 10, 20)],
+            'encodings': [np.zeros(128)] * 2, 'landmarks': [None, None], 'variant_attempts': [],
+        }
+        matches = [
+            {'employee': employee, 'confidence': 0.8, 'details': ''},
+            {'employee': employee, 'confidence': 0.9, 'details': ''},
+        ]
+
+        with mock.patch('facial_recognition.face_recognition_utils.verification_pool.run', return_value=probes), \
+                mock.patch('facial_recognition.face_recognition_utils.face_gallery.match_batch',
+                           return_value=matches):
+            result, error = service.advanced_verify_group(b'foto')
+
+        self.assertEqual(result['recognized'], 1)
+        self.assertIsNone(result['faces'][0]['employee'])
+        self.assertEqual(result['faces'][1]['confidence'], 0.9)
+
+
+class AsyncAttendanceViewTests(TestCase):
+    def setUp(self):
+        self.employee = Employee.objects.create(
+            name='Ana', rut='11111111-1', employee_id='EMP-1', email='', department='General',
+            position='Empleado', has_face_registered=True
+        )
+
+    async def test_qr_creates_record_then_reports_duplicate(self):
+        client = AsyncClient()
+        body = {'qr_data': 'RUN=11111111-1', 'type': 'entrada'}
+
+        first = await client.post('/api/async/verify-qr/', body, content_type='application/json')
+        second = await client.post('/api/async/verify-qr/', body, content_type='application/json')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['record']['employee_name'], 'Ana')
+        self.assertEqual(second.status_code, 400)
+        self.assertTrue(second.json()['duplicate_found'])
+        self.assertEqual(await AttendanceRecord.objects.filter(verification_method='qr').acount(), 1)
+
+    async def test_manual_mark_by_rut_and_unknown_employee(self):
+        client = AsyncClient()
+        response = await client.post('/api/async/mark-attendance/', {'employee_id': '11111111-1', 'type': 'salida'},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['record']['attendance_type'], 'salida')
+
+        missing = await client.post('/api/async/mark-attendance/', {'employee_id': 'NO-EXISTE'},
+                                    content_type='application/json')
+        self.assertEqual(missing.status_code, 400)
+
+        not_allowed = await client.get('/api/async/mark-attendance/')
+        self.assertEqual(not_allowed.status_code, 405)
+
+    async def test_face_verification_does_not_block_the_event_loop(self):
+        result = {'best_match': {'id': self.employee.id}, 'best_confidence': 0.9}
+
+        def slow_verify(photo, deadline, device_id):
+            time.sleep(0.3)
+            return result, None
+
+        client = AsyncClient()
+        with mock.patch('facial_recognition.async_views.face_recognition_service.advanced_verify',
+                        side_effect=slow_verify):
+            start = time.perf_counter()
+            responses = await asyncio.gather(*[
+                client.post('/api/async/verify-face/', {'photo': 'x', 'type': attendance_type},
+                            content_type='application/json')
+                for attendance_type in ('entrada', 'salida')
+            ])
+            elapsed = time.perf_counter() - start
+
+        # En serie tardarían 0.6 s
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(await AttendanceRecord.objects.filter(verification_method='facial').acount(), 2)
+
+    def test_sync_and_async_qr_payloads_match(self):
+        body = {'qr_data': '{"rut": "11111111-1"}', 'type': 'entrada'}
+        sync = self.client.post('/api/verify-qr/', body, content_type='application/json').json()
+        AttendanceRecord.objects.all().delete()
+        asynchronous = self.client.post('/api/async/verify-qr/', body, content_type='application/json').json()
+
+        for payload in (sync, asynchronous):
+            payload['record'].pop('id')
+            for volatile in ('timestamp', 'formatted_timestamp'):
+                payload['record'].pop(volatile)
+            payload.pop('timestamp')
+        self.assertEqual(asynchronous, sync)
+
+
+class FaceTrackerTests(SimpleTestCase):
+    def test_boxes_keep_their_track_across_frames(self):
+        tracker = FaceTracker(iou_threshold=0.3, max_missed=1)
+        first, _ = tracker.update([(10, 60, 60, 10), (10, 200, 60, 150)])
+        second, _ = tracker.update([(12, 202, 62, 152), (12, 62, 62, 12)])
+
+        self.assertEqual([track.id for track in second], [first[1].id, first[0].id])
+        self.assertEqual(second[0].hits, 2)
+
+        # Una caja lejana abre un track nuevo; el que no aparece expira tras max_missed cuadros
+        third, ended = tracker.update([(12, 62, 62, 12), (300, 400, 350, 350)])
+        self.assertEqual(third[0].id, first[0].id)
+        self.assertNotIn(third[1].id, [first[0].id, first[1].id])
+        self.assertEqual(ended, [])
+        _, ended = tracker.update([(12, 62, 62, 12), (300, 400, 350, 350)])
+        self.assertEqual([track.id for track in ended], [first[1].id])
+
+    def test_settled_locations_only_include_resolved_tracks(self):
+        tracker = FaceTracker()
+        tracks, _ = tracker.update([(10, 60, 60, 10), (10, 200, 60, 150)])
+        tracks[0].state = Track.RECOGNIZED
+        self.assertEqual(tracker.settled_locations(), [(10, 60, 60, 10)])
+
+
+class KioskStreamTests(TestCase):
+    def setUp(self):
+        self.employee = Employee.objects.create(
+            name='Ana', rut='11111111-1', employee_id='EMP-1', email='', department='General',
+            position='Empleado', has_face_registered=True
+        )
+
+    def frame_probes(self, face_locations, settled_locations):
+        encoded = [
+            index for index, location in enumerate(face_locations)
+            if all(box_iou(location, settled) < 0.3 for settled in settled_locations)
+        ]
+        return {
+            'success': True,
+            'face_locations': face_locations,
+            'encoded_indices': encoded,
+            'encodings': [np.zeros(128) for _ in encoded],
+            'landmarks': [None for _ in encoded],
+            'frame_size': [480, 360],
+        }
+
+    def patch_pipeline(self, frames, match):
+        """Simula el pool (un cuadro por llamada) y la galería; devuelve el mock de match_batch"""
+        frames = iter(frames)
+
+        def run(function, frame, settled_locations, deadline):
+            return self.frame_probes(next(frames), settled_locations)
+
+        match_batch = mock.Mock(side_effect=lambda encodings, landmarks, config: [match] * len(encodings))
+        patches = [
+            mock.patch('facial_recognition.kiosk.verification_pool.run', side_effect=run),
+            mock.patch('facial_recognition.kiosk.face_gallery.match_batch', match_batch),
+            mock.patch('facial_recognition.kiosk.close_old_connections'),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return match_batch
+
+    async def test_recognizes_once_per_track_and_records_attendance_once(self):
+        match = {'employee': {'id': self.employee.id, 'name': 'Ana'}, 'confidence': 0.9, 'details': None}
+        box = (40, 140, 140, 40)
+        moved = (44, 144, 144, 44)
+        match_batch = self.patch_pipeline([[box], [moved], [box]], match)
+
+        session = KioskSession(attendance_type='entrada', device_id='kiosco-1')
+        events = []
+        for _ in range(3):
+            events.extend(await session.process_frame(b'frame'))
+
+        recognized = [event for event in events if event['event'] == 'recognized']
+        self.assertEqual(len(recognized), 1)
+        self.assertTrue(recognized[0]['attendance']['recorded'])
+        self.assertEqual(match_batch.call_count, 1)
+        self.assertEqual(session.stats['encoded_faces'], 1)
+        self.assertEqual(events[-1]['tracks'][0]['state'], Track.RECOGNIZED)
+        record = await AttendanceRecord.objects.aget()
+        self.assertEqual(record.device_info, 'kiosco-1')
+
+    async def test_unknown_face_stops_matching_after_attempts(self):
+        self.patch_pipeline([[(40, 140, 140, 40)]] * 5, None)
+        session = KioskSession()
+        events = []
+        for _ in range(5):
+            events.extend(await session.process_frame(b'frame'))
+
+        self.assertEqual([event['event'] for event in events if event['event'] == 'unknown'], ['unknown'])
+        self.assertEqual(session.stats['encoded_faces'], session.config['kiosk_recognition_attempts'])
+        self.assertEqual(await AttendanceRecord.objects.acount(), 0)
+
+    async def test_websocket_protocol(self):
+        self.patch_pipeline([[]], None)
+        incoming = asyncio.Queue()
+        outgoing = asyncio.Queue()
+        for message in (
+            {'type': 'websocket.connect'},
+            {'type': 'websocket.receive', 'text': json.dumps({'type': 'config', 'attendance_type': 'Salida'})},
+            {'type': 'websocket.receive', 'bytes': b'frame'},
+        ):
+            incoming.put_nowait(message)
+
+        scope = {'type': 'websocket', 'path': '/ws/kiosk/', 'query_string': b'type=entrada&device_id=k1'}
+        connection = asyncio.create_task(kiosk_websocket(scope, incoming.get, outgoing.put))
+
+        self.assertEqual((await outgoing.get())['type'], 'websocket.accept')
+        ready = json.loads((await outgoing.get())['text'])
+        self.assertEqual(ready['event'], 'ready')
+        tracks = json.loads((await asyncio.wait_for(outgoing.get(), 5))['text'])
+        self.assertEqual(tracks, {'event': 'tracks', 'frame_size': [480, 360], 'tracks': []})
+
+        await incoming.put({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(connection, 5)
+
+
+class VerificationCacheTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(31)
+        self.image = Image.fromarray(rng.integers(0, 255, (48, 64, 3), dtype=np.uint8)).resize((640, 480))
+        self.photo = self.encode(self.image, 90)
+
+    def encode(self, image, quality):
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        return buffer.getvalue()
+
+    def test_fingerprint_separates_recompressed_and_different_photos(self):
+        phash, digest = photo_fingerprint(self.photo)
+        self.assertEqual(photo_fingerprint(self.photo), (phash, digest))
+
+        recompressed = photo_fingerprint(self.encode(self.image, 70))
+        self.assertNotEqual(recompressed[1], digest)
+        other = photo_fingerprint(self.encode(self.image.transpose(Image.Transpose.FLIP_LEFT_RIGHT), 90))
+        self.assertNotEqual(other[0], phash)
+
+    def test_lru_eviction_and_ttl(self):
+        cache = VerificationCache(max_entries=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, 1, {'key': key}, {'ok': True})
+        self.assertEqual(cache.get('a', 1), (None, None))
+        self.assertEqual(cache.get('c', 1), ({'key': 'c'}, {'ok': True}))
+
+        cache.configure(2, ttl=0)
+        time.sleep(0.01)
+        self.assertEqual(cache.get('c', 1), (None, None))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['expired']), (1, 2, 1, 1))
+
+    def test_repeated_photo_skips_pipeline_until_gallery_changes(self):
+        service = AdvancedFaceRecognitionService()
+        probe = {
+            'success': True, 'encoding': np.zeros(128), 'landmarks': None, 'quality_info': {},
+            'variant_attempts': [], 'stage_timings': {},
+        }
+        matches = [{'employee': {'id': 1, 'name': 'Ana'}, 'confidence': 0.9, 'match': True, 'details': ''}]
+        cache = VerificationCache()
+
+        with mock.patch('facial_recognition.face_recognition_utils.verification_cache', cache), \
+                mock.patch('facial_recognition.face_recognition_utils.verification_pool.run',
+                           return_value=probe) as run, \
+                mock.patch('facial_recognition.face_recognition_utils.face_gallery.match',
+                           return_value=matches) as match, \
+                mock.patch('facial_recognition.face_recognition_utils.face_gallery.get_snapshot'), \
+                mock.patch('facial_recognition.face_recognition_utils.face_gallery._generation', 7):
+            first, _ = service.advanced_verify(self.photo)
+            second, _ = service.advanced_verify(self.photo)
+            self.assertEqual((run.call_count, match.call_count), (1, 1))
+            self.assertEqual((first['cache_hit'], second['cache_hit']), (False, True))
+            self.assertEqual(second['best_match'], {'id': 1, 'name': 'Ana'})
+            self.assertEqual((first['compared_employees'], len(first['all_results'])), (1, 1))
+
+            with mock.patch('facial_recognition.face_recognition_utils.face_gallery._generation', 8):
+                third, _ = service.advanced_verify(self.photo)
+            self.assertEqual((run.call_count, match.call_count), (1, 2))
+            self.assertFalse(third['cache_hit'])
+
+        self.assertEqual({k: cache.stats()[k] for k in ('hits', 'probe_hits', 'misses')},
+                         {'hits': 1, 'probe_hits': 1, 'misses': 1})
+
+
+class FrameChangeGateTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.hallway = rng.integers(60, 120, (48, 64, 3), dtype=np.uint8)
+
+    def encode(self, array):
+        buffer = io.BytesIO()
+        Image.fromarray(array).resize((640, 480)).save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue()
+
+    def with_person(self):
+        frame = self.hallway.copy()
+        frame[10:40, 20:44] = 230
+        return frame
+
+    def test_device_key_from_text_or_json(self):
+        self.assertEqual(device_key('kiosco-1'), 'kiosco-1')
+        self.assertEqual(device_key('{"device_id": "kiosco-2", "os": "android"}'), 'kiosco-2')
+        self.assertEqual(device_key({'id': 7}), '7')
+        self.assertIsNone(device_key(''))
+        self.assertIsNone(device_key('{"os": "android"}'))
+
+    def test_skips_unchanged_frames_per_device(self):
+        gate = FrameChangeGate(threshold=0.02)
+        hallway = self.encode(self.hallway)
+
+        self.assertEqual(gate.check('a', hallway), (True, None))
+        gate.accept('a')
+        changed, difference = gate.check('a', self.encode(self.hallway))
+        self.assertFalse(changed)
+        self.assertLess(difference, 0.02)
+        self.assertTrue(gate.check('b', hallway)[0])
+        self.assertTrue(gate.check('a', self.encode(self.with_person()))[0])
+
+        devices = gate.stats()['devices']
+        self.assertEqual(devices['a'], {'frames': 3, 'skipped': 1, 'skip_rate': 0.3333,
+                                        'last_difference': devices['a']['last_difference']})
+        self.assertEqual(devices['b']['skipped'], 0)
+
+    def test_reference_expires_after_max_age(self):
+        gate = FrameChangeGate(max_age=30)
+        hallway = self.encode(self.hallway)
+        with mock.patch('facial_recognition.face_motion.time.time', return_value=1000.0):
+            gate.check('a', hallway)
+            gate.accept('a')
+        with mock.patch('facial_recognition.face_motion.time.time', return_value=1031.0):
+            self.assertTrue(gate.check('a', hallway)[0])
+
+    def test_unchanged_frame_skips_detection(self):
+        service = AdvancedFaceRecognitionService()
+        probe = {'success': False, 'error': 'No se detectó rostro válido', 'reason': 'no_face',
+                 'variant_attempts': [], 'stage_timings': None}
+        hallway = self.encode(self.hallway)
+        skipped_before = FRAME_GATE.value(result='skipped')
+
+        with mock.patch('facial_recognition.face_recognition_utils.frame_change_gate', FrameChangeGate()), \
+                mock.patch.dict(service.ADVANCED_CONFIG, result_cache_enabled=False), \
+                mock.patch('facial_recognition.face_recognition_utils.verification_pool.run',
+                           return_value=probe) as run:
+            self.assertEqual(service.advanced_verify(hallway, device_id='pasillo'), (None, probe['error']))
+            result, error = service.advanced_verify(hallway, device_id='pasillo')
+            service.advanced_verify(hallway)
+
+        self.assertIsNone(error)
+        self.assertTrue(result['no_change'])
+        self.assertIsNone(result['best_match'])
+        # Sin dispositivo no hay filtro
+        self.assertEqual(run.call_count, 2)
+        self.assertEqual(FRAME_GATE.value(result='skipped'), skipped_before + 1)
+
+    def test_unprocessed_frame_does_not_become_the_reference(self):
+        gate = FrameChangeGate()
+        hallway = self.encode(self.hallway)
+        self.assertTrue(gate.check('a', hallway)[0])
+        self.assertTrue(gate.check('a', hallway)[0])
+        gate.accept('a')
+        self.assertFalse(gate.check('a', hallway)[0])
+
+    def test_busy_or_failed_frame_is_retried(self):
+        service = AdvancedFaceRecognitionService()
+        probe = {'success': False, 'error': 'No se detectó rostro válido', 'reason': 'no_face',
+                 'variant_attempts': [], 'stage_timings': None}
+        failure = {'success': False, 'error': 'Error', 'reason': 'error',
+                   'variant_attempts': [], 'stage_timings': None}
+        hallway = self.encode(self.hallway)
+
+        with mock.patch('facial_recognition.face_recognition_utils.frame_change_gate', FrameChangeGate()), \
+                mock.patch.dict(service.ADVANCED_CONFIG, result_cache_enabled=False), \
+                mock.patch('facial_recognition.face_recognition_utils.verification_pool.run',
+                           side_effect=[WorkerPoolBusy(), DeadlineExceeded(), failure, probe]) as run:
+            with self.assertRaises(WorkerPoolBusy):
+                service.advanced_verify(hallway, device_id='pasillo')
+            self.assertTrue(service.advanced_verify(hallway, device_id='pasillo')[1].startswith('TIMEOUT'))
+            self.assertEqual(service.advanced_verify(hallway, device_id='pasillo'), (None, 'Error'))
+            # Cada reintento idéntico se procesó; recién el cuadro procesado filtra al siguiente
+            self.assertEqual(service.advanced_verify(hallway, device_id='pasillo'), (None, probe['error']))
+            result, _ = service.advanced_verify(hallway, device_id='pasillo')
+
+        self.assertEqual(run.call_count, 4)
+        self.assertTrue(result['no_change'])
+
+    def test_view_answers_no_change(self):
+        result = {'best_match': None, 'best_confidence': 0, 'no_change': True}
+        with mock.patch('facial_recognition.views.face_recognition_service.advanced_verify',
+                        return_value=(result, None)) as advanced_verify:
+            response = self.client.post('/api/verify-face/', {'photo': 'x', 'device_info': 'kiosco-1'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['error_type'], 'NO_CHANGE')
+        self.assertEqual(advanced_verify.call_args.kwargs['device_id'], 'kiosco-1')
+        self.assertIn('frame_gate', self.client.get('/api/health/').json())
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_and_counter_text_format(self):
+        registry = MetricsRegistry()
+        latency = registry.histogram('test_seconds', 'Prueba', ('stage',), buckets=(0.1, 1.0))
+        results = registry.counter('test_total', 'Prueba', ('result',))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value, stage='decode')
+        results.inc(result='match')
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{stage="decode",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="decode",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{stage="decode",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum{stage="decode"} 3.65', lines)
+        self.assertIn('test_total{result="match"} 1', lines)
+
+    def test_concurrent_updates_are_not_lost(self):
+        counter = MetricsRegistry().counter('test_total', 'Prueba', ('result',))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(result='ok')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.value(result='ok'), 8000)
+
+    def test_verification_stages_and_outcomes_reach_endpoint(self):
+        service = AdvancedFaceRecognitionService()
+        probe = {
+            'success': False, 'error': 'No se detectó rostro válido', 'reason': 'no_face',
+            'variant_attempts': [], 'stage_timings': {'timings_ms': {'decode': 4.0, 'variant.clahe': 30.0}},
+        }
+        no_face_before = VERIFICATIONS.value(result='no_face')
+        decode_before = STAGE_SECONDS.count(pipeline='verification', stage='decode')
+
+        with mock.patch.dict(service.ADVANCED_CONFIG, result_cache_enabled=False), \
+                mock.patch('facial_recognition.face_recognition_utils.verification_pool.run', return_value=probe):
+            service.advanced_verify(b'foto')
+
+        self.assertEqual(VERIFICATIONS.value(result='no_face'), no_face_before + 1)
+        self.assertEqual(STAGE_SECONDS.count(pipeline='verification', stage='decode'), decode_before + 1)
+
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('face_stage_seconds_count{pipeline="verification",stage="variant.clahe"}', body)
+        self.assertIn('face_verifications_total{result="no_face"}', body)
+
+
+class ParallelRegistrationTests(SimpleTestCase):
+    def test_pool_results_match_sequential_order(self):
+        photos = []
+        for shade in (40, 120, 200):
+            buffer = io.BytesIO()
+            Image.new('RGB', (48, 36), (shade, shade, shade)).save(buffer, 'JPEG')
+            photos.append(base64.b64encode(buffer.getvalue()).decode())
+        photos.insert(1, 'no-es-una-imagen')
+
+        service = AdvancedFaceRecognitionService()
+        self.addCleanup(registration_pool.shutdown)
+        results = {}
+        for workers in (0, 2):
+            service.ADVANCED_CONFIG['registration_workers'] = workers
+            results[workers] = service.process_advanced_registration(photos)
+
+        self.assertFalse(results[2]['success'])
+        self.assertEqual(results[2]['failed_reasons'], results[0]['failed_reasons'])
+        self.assertEqual(results[2]['average_quality'], results[0]['average_quality'])
+        self.assertTrue(results[2]['failed_reasons'][1].startswith('Foto 2: Error'))
+
+
+class FakeRegistrationService:
+    """Registro simulado: la foto 3 falla y el resto entrega un encoding"""
+
+    def __init__(self):
+        self.rng = np.random.default_rng(5)
+
+    def process_advanced_registration(self, photos, on_photo=None):
+        encodings = []
+        for idx, photo in enumerate(photos):
+            encoding = None if idx == 2 else self.rng.normal(0, 0.06, 128).tolist()
+            on_photo(idx, {
+                'encoding': encoding,
+                'quality': 0.8,
+                'failed_reasons': [] if encoding else [f'Foto {idx+1}: No se detectó rostro válido'],
+            })
+            if encoding:
+                encodings.append(encoding)
+        adaptations = [[{'encoding': enc, 'condition': 'low_light', 'brightness': 0.7, 'contrast': 1.25}]
+                       for enc in encodings]
+        return {
+            'success': True, 'encodings': encodings, 'landmarks': [],
+            'environmental_adaptations': adaptations, 'valid_photos': len(encodings),
+            'total_photos': len(photos), 'failed_reasons': [], 'average_quality': 0.8,
+        }
+
+
+class FaceEnrollmentJobTests(TestCase):
+    def setUp(self):
+        self.employee = Employee.objects.create(
+            name='Ana', rut='11111111-1', employee_id='EMP-1', email='', department='General',
+            position='Empleado'
+        )
+        buffer = io.BytesIO()
+        Image.new('RGB', (32, 32)).save(buffer, 'JPEG')
+        self.photo = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+    def test_registration_is_queued_and_processed_by_worker(self):
+        response = self.client.post('/api/register-face/', {
+            'employee_id': str(self.employee.id), 'photos': [self.photo] * 5
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+
+        status = self.client.get(f'/api/register-face/{job_id}/').json()['job']
+        self.assertEqual((status['status'], status['progress']), ('pending', {'processed': 0, 'total': 5}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            job = claim_next_job()
+            self.assertIsNone(claim_next_job())
+            run_enrollment_job(job, FakeRegistrationService())
+
+        status = self.client.get(f'/api/register-face/{job_id}/').json()['job']
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['progress'], {'processed': 5, 'total': 5})
+        self.assertEqual([photo['status'] for photo in status['photos']],
+                         ['valid', 'valid', 'failed', 'valid', 'valid'])
+
+        self.employee.refresh_from_db()
+        self.assertTrue(self.employee.has_face_registered)
+        self.assertEqual(self.employee.face_variations_count, 8)
+        self.assertAlmostEqual(self.employee.face_quality_score, 0.8)
+        self.assertIsNotNone(self.employee.face_registration_date)
+        self.assertEqual(len(read_face_data(self.employee)['encodings']), 4)
+        self.assertEqual(bytes(FaceEnrollmentJob.objects.get(id=job_id).photos.first().image), b'')
+
+    def test_invalid_photos_are_rejected(self):
+        response = self.client.post('/api/register-face/', {
+            'employee_id': str(self.employee.id), 'photos': ['%%%'] * 5
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(FaceEnrollmentJob.objects.exists())
+
+    def queue_job(self):
+        self.client.post('/api/register-face/', {
+            'employee_id': str(self.employee.id), 'photos': [self.photo] * 5
+        }, content_type='application/json')
+        return claim_next_job()
+
+    def test_missing_employee_fails_the_job(self):
+        job = self.queue_job()
+        with mock.patch('facial_recognition.face_enrollment.Employee.objects.get',
+                        side_effect=Employee.DoesNotExist):
+            run_enrollment_job(job, FakeRegistrationService())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.valid_photos), ('failed', 4))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(bytes(job.photos.first().image), b'')
+
+    def test_employee_deleted_during_registration_does_not_recreate_the_job(self):
+        job = self.queue_job()
+        # El trabajo y sus fotos se eliminan en cascada junto con el empleado
+        self.employee.delete()
+        run_enrollment_job(job, FakeRegistrationService())
+        self.assertEqual(job.status, 'failed')
+        self.assertFalse(FaceEnrollmentJob.objects.exists())
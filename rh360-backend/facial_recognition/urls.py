@@ -1,9 +1,10 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Estado del sistema
     path('health/', views.health_check, name='health_check'),
+    path('metrics/', views.metrics, name='metrics'),
     
     # Gestión de empleados
     path('employees/', views.get_employees, name='get_employees'),
@@ -13,7 +14,10 @@ urlpatterns = [
     
     # Reconocimiento facial balanceado (5 fotos)
     path('register-face/', views.register_employee_face, name='register_employee_face'),
+    path('register-face/<uuid:job_id>/', views.face_enrollment_status, name='face_enrollment_status'),
     path('verify-face/', views.verify_attendance_face, name='verify_attendance_face'),
+    path('verify-face-burst/', views.verify_attendance_face_burst, name='verify_attendance_face_burst'),
+    path('verify-face-group/', views.verify_attendance_group, name='verify_attendance_group'),
     
     # Verificación por código QR
     path('verify-qr/', views.verify_qr, name='verify_qr'),
@@ -21,6 +25,11 @@ urlpatterns = [
     # Marcado de asistencia (compatible con todos los métodos)
     path('mark-attendance/', views.mark_attendance, name='mark_attendance'),
     
+    # Versiones async para servir con ASGI (muchos kioscos concurrentes)
+    path('async/verify-face/', async_views.verify_attendance_face, name='async_verify_attendance_face'),
+    path('async/verify-qr/', async_views.verify_qr, name='async_verify_qr'),
+    path('async/mark-attendance/', async_views.mark_attendance, name='async_mark_attendance'),
+    
     # Sincronización offline
     path('sync-offline/', views.sync_offline_records, name='sync_offline_records'),
     
@@ -1,4 +1,5 @@
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
@@ -19,12 +20,19 @@ import time
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.http import HttpRequest
+from django.http import HttpRequest, HttpResponse
 import re
 
-from .models import Employee, AttendanceRecord
-from .serializers import EmployeeSerializer, AttendanceRecordSerializer
+from .models import Employee, AttendanceRecord, FaceEnrollmentJob, normalize_rut
+from .serializers import EmployeeSerializer, AttendanceRecordSerializer, FaceEnrollmentJobSerializer
+from .face_enrollment import create_enrollment_job
 from .face_recognition_utils import AdvancedFaceRecognitionService
+from .face_cache import verification_cache
+from .face_enhancement import variant_hit_rates
+from .face_metrics import registry as metrics_registry, timed_stage
+from .face_motion import device_key, frame_change_gate
+from .face_workers import WorkerPoolBusy, verification_pool
+from .parsers import RawImageParser
 
 face_recognition_service = AdvancedFaceRecognitionService()
 ADVANCED_CONFIG = face_recognition_service.ADVANCED_CONFIG
@@ -32,36 +40,75 @@ ADVANCED_CONFIG = face_recognition_service.ADVANCED_CONFIG
 FACE_IMAGES_DIR = 'media/employee_faces/'
 os.makedirs(FACE_IMAGES_DIR, exist_ok=True)
 
+# Fotos en JSON (base64), multipart/form-data o cuerpo binario image/*
+PHOTO_PARSERS = [JSONParser, MultiPartParser, FormParser, RawImageParser]
+
+SERVER_BUSY_PAYLOAD = {
+    'success': False,
+    'message': 'Servidor ocupado, intenta nuevamente en unos segundos',
+    'error_type': 'SERVER_BUSY',
+    'system_mode': 'BALANCED'
+}
+
+def _duplicate_queryset(employee, attendance_type, timestamp_str, tolerance_minutes):
+    """Registros del mismo tipo dentro del margen de tolerancia alrededor del timestamp"""
+    # Convertir timestamp string a datetime
+    if isinstance(timestamp_str, str):
+        # Manejar diferentes formatos de timestamp
+        if timestamp_str.endswith('Z'):
+            timestamp_str = timestamp_str.replace('Z', '+00:00')
+        target_time = timezone.datetime.fromisoformat(timestamp_str)
+    else:
+        target_time = timestamp_str
+        
+    # Buscar registros similares dentro del margen de tolerancia
+    time_start = target_time - timedelta(minutes=tolerance_minutes)
+    time_end = target_time + timedelta(minutes=tolerance_minutes)
+    
+    return AttendanceRecord.objects.filter(
+        employee=employee,
+        attendance_type=attendance_type.lower(),
+        timestamp__range=(time_start, time_end)
+    )
+
 def check_duplicate_attendance(employee, attendance_type, timestamp_str, tolerance_minutes=5):
     """
     Verifica si ya existe un registro similar dentro de un margen de tiempo
     """
     try:
-        # Convertir timestamp string a datetime
-        if isinstance(timestamp_str, str):
-            # Manejar diferentes formatos de timestamp
-            if timestamp_str.endswith('Z'):
-                timestamp_str = timestamp_str.replace('Z', '+00:00')
-            target_time = timezone.datetime.fromisoformat(timestamp_str)
-        else:
-            target_time = timestamp_str
-            
-        # Buscar registros similares dentro del margen de tolerancia
-        time_start = target_time - timedelta(minutes=tolerance_minutes)
-        time_end = target_time + timedelta(minutes=tolerance_minutes)
-        
-        existing = AttendanceRecord.objects.filter(
-            employee=employee,
-            attendance_type=attendance_type.lower(),
-            timestamp__range=(time_start, time_end)
-        ).first()
-        
-        return existing
+        return _duplicate_queryset(employee, attendance_type, timestamp_str, tolerance_minutes).first()
         
     except Exception as e:
         print(f"Error verificando duplicado: {str(e)}")
         return None
 
+def _record_timestamp(is_offline_sync, offline_timestamp):
+    """Hora del registro: la del cliente en sincronizaciones offline, si es válida, o la actual"""
+    if is_offline_sync and offline_timestamp:
+        try:
+            # Intenta convertir el timestamp ISO del cliente a un objeto de zona horaria consciente
+            record_timestamp = datetime.fromisoformat(offline_timestamp.replace('Z', '+00:00'))
+            if record_timestamp.tzinfo is None:
+                record_timestamp = timezone.make_aware(record_timestamp)
+            return record_timestamp
+        except (ValueError, TypeError):
+            pass
+    return timezone.now()
+
+def _manual_record_values(employee, attendance_type, location_lat, location_lng, address, notes, is_offline_sync, offline_timestamp):
+    """Campos de un registro manual/GPS, compartidos por la vista síncrona y la async"""
+    return {
+        'employee': employee,
+        'attendance_type': attendance_type,
+        'timestamp': _record_timestamp(is_offline_sync, offline_timestamp),
+        'location_lat': location_lat,
+        'location_lng': location_lng,
+        'address': address,
+        'verification_method': 'manual',
+        'notes': notes or 'Registro manual/GPS',
+        'is_offline_sync': is_offline_sync,
+    }
+
 def _create_manual_attendance_record(employee, attendance_type, location_lat, location_lng, address, notes, is_offline_sync, offline_timestamp):
     """
     Función auxiliar para crear un registro de asistencia manual.
@@ -83,28 +130,9 @@ def _create_manual_attendance_record(employee, attendance_type, location_lat, lo
         return existing_record  # Retorna el registro existente en lugar de crear uno nuevo
     
     # Si no hay duplicado, crear el registro normal
-    if is_offline_sync and offline_timestamp:
-        try:
-            # Intenta convertir el timestamp ISO del cliente a un objeto de zona horaria consciente
-            record_timestamp = datetime.fromisoformat(offline_timestamp.replace('Z', '+00:00'))
-            if record_timestamp.tzinfo is None:
-                record_timestamp = timezone.make_aware(record_timestamp)
-        except (ValueError, TypeError):
-            record_timestamp = timezone.now()
-    else:
-        record_timestamp = timezone.now()
-    
-    attendance_record = AttendanceRecord.objects.create(
-        employee=employee,
-        attendance_type=attendance_type,
-        timestamp=record_timestamp,
-        location_lat=location_lat,
-        location_lng=location_lng,
-        address=address,
-        verification_method='manual',
-        notes=notes or 'Registro manual/GPS',
-        is_offline_sync=is_offline_sync
-    )
+    attendance_record = AttendanceRecord.objects.create(**_manual_record_values(
+        employee, attendance_type, location_lat, location_lng, address, notes, is_offline_sync, offline_timestamp
+    ))
     
     print(f"✅ Nuevo registro creado para {employee.name} - {attendance_type}")
     return attendance_record
@@ -164,23 +192,46 @@ def format_rut_for_storage(rut):
 def search_employee_by_rut(rut):
     """Buscar empleado por RUT con flexibilidad en formato"""
     try:
-        # Formato estándar
-        employee = Employee.objects.filter(rut=rut, is_active=True).first()
-        if employee:
-            return employee
-        
-        # Búsqueda flexible sin puntos ni guiones
-        clean_search = re.sub(r'[^0-9kK]', '', rut).upper()
-        for emp in Employee.objects.filter(is_active=True):
-            clean_emp_rut = re.sub(r'[^0-9kK]', '', emp.rut).upper()
-            if clean_emp_rut == clean_search:
-                return emp
-        
-        return None
+        # Sin puntos ni guiones, contra la columna indexada rut_normalized
+        clean_search = normalize_rut(rut)
+        if not clean_search:
+            return None
+        return Employee.objects.filter(rut_normalized=clean_search, is_active=True).first()
     except Exception as e:
         print(f"Error buscando empleado por RUT: {str(e)}")
         return None
 
+def extract_rut_from_qr(qr_data):
+    """RUT contenido en un código QR (texto, JSON o el RUT directo), o None"""
+    rut_from_qr = None
+    
+    
+    # Estrategia 1: Buscar patrón de RUT en el texto
+    rut_pattern = r'(\d{7,8}[-]?[0-9kK])'
+    rut_matches = re.findall(rut_pattern, qr_data, re.IGNORECASE)
+    
+    if rut_matches:
+        rut_from_qr = rut_matches[0]
+        print(f"RUT encontrado por patrón: {rut_from_qr}")
+    else:
+        # Estrategia 2: Intentar como JSON
+        try:
+            qr_json = json.loads(qr_data)
+            rut_from_qr = qr_json.get('rut') or qr_json.get('RUT') or qr_json.get('run') or qr_json.get('RUN')
+        except:
+            # Estrategia 3: Asumir que el QR contiene directamente el RUT
+            clean_data = re.sub(r'[^0-9kK-]', '', qr_data).upper()
+            if len(clean_data) >= 8:
+                rut_from_qr = clean_data
+            else:
+                # Estrategia 4: Buscar cualquier secuencia de números seguida de dígito
+                number_pattern = r'(\d{7,8}[0-9kK])'
+                number_matches = re.findall(number_pattern, qr_data, re.IGNORECASE)
+                if number_matches:
+                    rut_from_qr = number_matches[0]
+    
+    return rut_from_qr
+
 @api_view(['GET'])
 def health_check(request):
     """Estado del sistema"""
@@ -196,6 +247,10 @@ def health_check(request):
             'offline_sync': True,
             'web_panel': True
         },
+        'verification_pool': verification_pool.stats(),
+        'enhancement_variants': variant_hit_rates.stats(),
+        'verification_cache': verification_cache.stats(),
+        'frame_gate': frame_change_gate.stats(),
         'config': {
             'photos_required': ADVANCED_CONFIG['min_photos'],
             'face_tolerance': f"{ADVANCED_CONFIG['base_tolerance']} (balanceado)",
@@ -221,6 +276,10 @@ def health_check(request):
         }
     })
 
+def metrics(request):
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @api_view(['POST'])
 def create_employee_basic(request):
     """Crear empleado básico sin registro facial"""
@@ -246,7 +305,7 @@ def create_employee_basic(request):
                 'message': f'RUT inválido: {rut}. Verifica el formato y dígito verificador.'
             }, status=400)
         
-        if Employee.objects.filter(rut=formatted_rut).exists():
+        if Employee.objects.filter(rut_normalized=normalize_rut(formatted_rut)).exists():
             return Response({
                 'success': False,
                 'message': f'Ya existe un empleado con RUT {formatted_rut}'
@@ -279,13 +338,20 @@ def create_employee_basic(request):
             'message': f'Error: {str(e)}'
         }, status=500)
 
+def get_request_photos(data):
+    """Fotos de registro: lista base64 en JSON o varios campos 'photos' en multipart"""
+    if hasattr(data, 'getlist'):
+        return data.getlist('photos')
+    return data.get('photos', [])
+
 @api_view(['POST'])
+@parser_classes(PHOTO_PARSERS)
 def register_employee_face(request):
     """Registrar rostro de empleado con 5 fotos (balanceado)"""
     try:
         data = request.data
         employee_id = data.get('employee_id')
-        photos = data.get('photos', [])
+        photos = get_request_photos(data)
         
         if not employee_id:
             return Response({'success': False, 'message': 'ID de empleado requerido'}, status=400)
@@ -298,32 +364,147 @@ def register_employee_face(request):
         
         employee = Employee.objects.get(id=employee_id)
         
-        # Procesar y guardar fotos con el servicio avanzado
-        result = face_recognition_service.register_employee_optimized(employee_id, employee.name, photos)
+        # El registro pesado lo procesa run_face_enrollment_worker en segundo plano
+        try:
+            job = create_enrollment_job(employee, photos)
+        except ValueError:
+            return Response({'success': False, 'message': 'Las fotos enviadas no son válidas'}, status=400)
         
-        if result['success']:
-            employee.has_face_registered = True
-            employee.save()
-            
-            return Response({
-                'success': True,
-                'message': f'✅ Rostro de {employee.name} registrado exitosamente',
-                'details': result.get('details', {}),
-                'system_mode': 'BALANCED'
-            })
-        else:
-            return Response({
-                'success': False,
-                'message': result.get('message', 'Error registrando rostro'),
-                'system_mode': 'BALANCED'
-            }, status=400)
+        return Response({
+            'success': True,
+            'message': f'Registro facial de {employee.name} en proceso',
+            'job_id': str(job.id),
+            'status': job.status,
+            'status_url': f'/api/register-face/{job.id}/',
+            'system_mode': 'BALANCED'
+        }, status=202)
             
     except Employee.DoesNotExist:
         return Response({'success': False, 'message': 'Empleado no encontrado'}, status=404)
     except Exception as e:
         return Response({'success': False, 'message': f'Error: {str(e)}'}, status=500)
 
+@api_view(['GET'])
+def face_enrollment_status(request, job_id):
+    """Estado de un registro facial en segundo plano, con avance por foto"""
+    try:
+        job = FaceEnrollmentJob.objects.select_related('employee').prefetch_related('photos').get(id=job_id)
+    except FaceEnrollmentJob.DoesNotExist:
+        return Response({'success': False, 'message': 'Trabajo de registro no encontrado'}, status=404)
+    
+    return Response({
+        'success': True,
+        'job': FaceEnrollmentJobSerializer(job).data
+    })
+
+def _employee_payload(employee):
+    """Datos del empleado incluidos en las respuestas de asistencia"""
+    return {
+        'id': str(employee.id),
+        'name': employee.name,
+        'employee_id': employee.employee_id,
+        'rut': employee.rut,
+        'department': employee.department,
+        'profile_image_url': employee.profile_image.url if employee.profile_image else None
+    }
+
+def _face_not_recognized_payload(error):
+    return {
+        'success': False,
+        'message': error or 'Rostro no reconocido',
+        'error_type': 'FACE_NOT_RECOGNIZED',
+        'system_mode': 'BALANCED'
+    }
+
+# Con 200: para el kiosco no es un error, solo no hay nada nuevo que reconocer
+NO_CHANGE_PAYLOAD = {
+    'success': False,
+    'no_change': True,
+    'message': 'Sin cambios desde el último cuadro procesado',
+    'error_type': 'NO_CHANGE',
+    'system_mode': 'BALANCED'
+}
+
+def _face_record_values(employee_obj, attendance_type, best_confidence, location_lat, location_lng, address):
+    """Campos del registro de una asistencia facial"""
+    return {
+        'employee': employee_obj,
+        'attendance_type': attendance_type,
+        'timestamp': timezone.now(),
+        'location_lat': location_lat,
+        'location_lng': location_lng,
+        'address': address,
+        'verification_method': 'facial',
+        'face_confidence': best_confidence,
+        'notes': f'Reconocimiento facial - Confianza: {best_confidence:.1%}'
+    }
+
+def _face_attendance_payload(employee_obj, attendance_type, best_confidence, elapsed_time, attendance_record):
+    """Respuesta de una asistencia facial; sin registro nuevo es la de un duplicado reciente"""
+    if attendance_record is None:
+        return {
+            'success': True,  # ← CAMBIAR A True
+            'message': f'✅ {attendance_type.upper()} REGISTRADA',
+            'employee': _employee_payload(employee_obj),
+            'verification': {
+                'confidence': f'{best_confidence:.1%}',
+                'method': 'FACIAL_RECOGNITION_BALANCED'
+            },
+            'duplicate_found': True  # ← Solo para saber internamente
+        }
+    
+    return {
+        'success': True,
+        'message': f'✅ {attendance_type.upper()} REGISTRADA',
+        'employee': _employee_payload(employee_obj),
+        'verification': {
+            'confidence': f'{best_confidence:.1%}',
+            'method': 'FACIAL_RECOGNITION_BALANCED',
+            'elapsed_time': f'{elapsed_time:.1f}s',
+            'security_level': 'BALANCEADO',
+            'system_version': 'BALANCED_v1.0'
+        },
+        'record': AttendanceRecordSerializer(attendance_record).data,
+        'timestamp': timezone.now().strftime('%d/%m/%Y %H:%M:%S')
+    }
+
+def _face_attendance_response(verification_result, error, elapsed_time, attendance_type,
+                              location_lat, location_lng, address):
+    """Registra la asistencia del mejor match de una verificación facial y arma la respuesta"""
+    if verification_result and verification_result.get('no_change'):
+        return Response(NO_CHANGE_PAYLOAD)
+    if error or not verification_result or not verification_result.get('best_match'):
+        return Response(_face_not_recognized_payload(error), status=400)
+
+    # Encontrar empleado
+    best_match = verification_result['best_match']
+    employee_obj = Employee.objects.get(id=best_match['id'])
+    best_confidence = verification_result['best_confidence']
+    
+    # Verificar duplicados antes de crear
+    with timed_stage('verification', 'db_write'):
+        existing_record = check_duplicate_attendance(
+            employee=employee_obj,
+            attendance_type=attendance_type,
+            timestamp_str=timezone.now(),
+            tolerance_minutes=5
+        )
+    
+    if existing_record:
+        return Response(_face_attendance_payload(employee_obj, attendance_type, best_confidence, elapsed_time, None))
+            
+    # Crear registro de asistencia
+    with timed_stage('verification', 'db_write'):
+        attendance_record = AttendanceRecord.objects.create(**_face_record_values(
+            employee_obj, attendance_type, best_confidence, location_lat, location_lng, address
+        ))
+    
+    return Response(
+        _face_attendance_payload(employee_obj, attendance_type, best_confidence, elapsed_time, attendance_record)
+    )
+
 @api_view(['POST'])
+@parser_classes(PHOTO_PARSERS)
 def verify_attendance_face(request):
     """Verificar asistencia por reconocimiento facial balanceado"""
     try:
@@ -347,85 +528,160 @@ def verify_attendance_face(request):
         start_time = time.time()
         
         # Usar el servicio de reconocimiento facial balanceado
-        verification_result, error = face_recognition_service.advanced_verify(photo_data)
+        try:
+            verification_result, error = face_recognition_service.advanced_verify(
+                photo_data, device_id=device_key(data.get('device_info'))
+            )
+        except WorkerPoolBusy:
+            return Response(SERVER_BUSY_PAYLOAD, status=503)
         
         elapsed_time = time.time() - start_time
         
-        if error or not verification_result or not verification_result.get('best_match'):
-            return Response({
+        return _face_attendance_response(
+            verification_result, error, elapsed_time, attendance_type, location_lat, location_lng, address
+        )
+        
+    except Exception as e:
+        return Response({
             'success': False,
-            'message': error or 'Rostro no reconocido',
-            'error_type': 'FACE_NOT_RECOGNIZED',
+            'message': f'Error crítico: {str(e)}',
+            'error_type': 'SYSTEM_ERROR',
             'system_mode': 'BALANCED'
-        }, status=400)
+        }, status=500)
 
-        # Encontrar empleado
-        best_match = verification_result['best_match']
-        employee_obj = Employee.objects.get(id=best_match['id'])
-        best_confidence = verification_result['best_confidence']
+@api_view(['POST'])
+@parser_classes([JSONParser, MultiPartParser, FormParser])
+def verify_attendance_face_burst(request):
+    """Verificar asistencia con una ráfaga de cuadros; solo los más nítidos se comparan"""
+    try:
+        data = request.data
+        photos = get_request_photos(data)
+        attendance_type = data.get('type', 'entrada').lower()
+        location_lat = data.get('latitude')
+        location_lng = data.get('longitude')
+        address = data.get('address', '')
         
-        # Verificar duplicados antes de crear
-        existing_record = check_duplicate_attendance(
-            employee=employee_obj,
-            attendance_type=attendance_type,
-            timestamp_str=timezone.now(),
-            tolerance_minutes=5
+        if not photos:
+            return Response({
+                'success': False,
+                'message': 'Se requiere al menos un cuadro para verificación'
+            }, status=400)
+        
+        start_time = time.time()
+        
+        try:
+            verification_result, error = face_recognition_service.advanced_verify_burst(photos)
+        except WorkerPoolBusy:
+            return Response(SERVER_BUSY_PAYLOAD, status=503)
+        
+        elapsed_time = time.time() - start_time
+        
+        response = _face_attendance_response(
+            verification_result, error, elapsed_time, attendance_type, location_lat, location_lng, address
         )
+        if verification_result:
+            response.data['burst'] = verification_result['burst']
+        return response
         
-        if existing_record:
+    except Exception as e:
+        return Response({
+            'success': False,
+            'message': f'Error crítico: {str(e)}',
+            'error_type': 'SYSTEM_ERROR',
+            'system_mode': 'BALANCED'
+        }, status=500)
+
+@api_view(['POST'])
+@parser_classes(PHOTO_PARSERS)
+def verify_attendance_group(request):
+    """Marcaje grupal: un registro de asistencia por cada empleado reconocido en el cuadro"""
+    try:
+        data = request.data
+        photo_data = data.get('photo', '')
+        attendance_type = data.get('type', 'entrada').lower()
+        location_lat = data.get('latitude')
+        location_lng = data.get('longitude')
+        address = data.get('address', '')
+        
+        if not photo_data:
             return Response({
-                'success': True,  # ← CAMBIAR A True
-                'message': f'✅ {attendance_type.upper()} REGISTRADA',
-                'employee': {
-                    'id': str(employee_obj.id),
-                    'name': employee_obj.name,
-                    'employee_id': employee_obj.employee_id,
-                    'rut': employee_obj.rut,
-                    'department': employee_obj.department,
-                    'profile_image_url': employee_obj.profile_image.url if employee_obj.profile_image else None
-                },
-                'verification': {
-                    'confidence': f'{best_confidence:.1%}',
-                    'method': 'FACIAL_RECOGNITION_BALANCED'
-                },
-                'duplicate_found': True  # ← Solo para saber internamente
-            })
-                
-        # Crear registro de asistencia
-        attendance_record = AttendanceRecord.objects.create(
-            employee=employee_obj,
-            attendance_type=attendance_type,
-            timestamp=timezone.now(),
-            location_lat=location_lat,
-            location_lng=location_lng,
-            address=address,
-            verification_method='facial',
-            face_confidence=best_confidence,
-            notes=f'Reconocimiento facial - Confianza: {best_confidence:.1%}'
-        )
+                'success': False,
+                'message': 'Foto requerida para verificación'
+            }, status=400)
+        
+        try:
+            verification_result, error = face_recognition_service.advanced_verify_group(photo_data)
+        except WorkerPoolBusy:
+            return Response(SERVER_BUSY_PAYLOAD, status=503)
+        
+        if error or not verification_result or not verification_result['recognized']:
+            return Response({
+                'success': False,
+                'message': error or 'Ningún rostro reconocido',
+                'error_type': 'FACE_NOT_RECOGNIZED',
+                'faces_detected': len(verification_result['faces']) if verification_result else 0,
+                'system_mode': 'BALANCED'
+            }, status=400)
         
-        serializer = AttendanceRecordSerializer(attendance_record)
+        # Un registro por empleado: si dos rostros coinciden con el mismo se usa el de mayor confianza
+        # y el otro se informa como coincidencia duplicada, no como rostro sin reconocer
+        recognized = {}
+        unrecognized_faces = 0
+        duplicate_matches = 0
+        for face in verification_result['faces']:
+            if not face['employee']:
+                unrecognized_faces += 1
+                continue
+            current = recognized.get(face['employee']['id'])
+            if current is not None:
+                duplicate_matches += 1
+                if current['confidence'] >= face['confidence']:
+                    continue
+            recognized[face['employee']['id']] = face
+        employees = Employee.objects.in_bulk(list(recognized))
+        now = timezone.now()
+        
+        results = []
+        with timed_stage('group', 'db_write'), transaction.atomic():
+            for employee_id, face in recognized.items():
+                employee_obj = employees.get(employee_id)
+                if employee_obj is None:
+                    continue
+                existing_record = check_duplicate_attendance(
+                    employee=employee_obj,
+                    attendance_type=attendance_type,
+                    timestamp_str=now,
+                    tolerance_minutes=5
+                )
+                record = None
+                if not existing_record:
+                    values = _face_record_values(
+                        employee_obj, attendance_type, face['confidence'], location_lat, location_lng, address
+                    )
+                    # Todos los registros del cuadro con la misma hora
+                    values['timestamp'] = now
+                    values['notes'] = f'Reconocimiento facial grupal - Confianza: {face["confidence"]:.1%}'
+                    record = AttendanceRecord.objects.create(**values)
+                results.append({
+                    'employee': _employee_payload(employee_obj),
+                    'confidence': f'{face["confidence"]:.1%}',
+                    'face_location': face['face_location'],
+                    'duplicate_found': bool(existing_record),
+                    'record': AttendanceRecordSerializer(record).data if record else None
+                })
         
         return Response({
             'success': True,
-            'message': f'✅ {attendance_type.upper()} REGISTRADA',
-            'employee': {
-                'id': str(employee_obj.id),
-                'name': employee_obj.name,
-                'employee_id': employee_obj.employee_id,
-                'rut': employee_obj.rut,
-                'department': employee_obj.department,
-                'profile_image_url': employee_obj.profile_image.url if employee_obj.profile_image else None
-            },
+            'message': f'✅ {attendance_type.upper()} REGISTRADA para {len(results)} empleado(s)',
+            'results': results,
+            'faces_detected': len(verification_result['faces']),
+            'unrecognized_faces': unrecognized_faces,
+            'duplicate_matches': duplicate_matches,
             'verification': {
-                'confidence': f'{best_confidence:.1%}',
-                'method': 'FACIAL_RECOGNITION_BALANCED',
-                'elapsed_time': f'{elapsed_time:.1f}s',
-                'security_level': 'BALANCEADO',
-                'system_version': 'BALANCED_v1.0'
+                'method': 'FACIAL_RECOGNITION_GROUP',
+                'elapsed_time': f'{verification_result["elapsed_time"]:.1f}s'
             },
-            'record': serializer.data,
-            'timestamp': timezone.now().strftime('%d/%m/%Y %H:%M:%S')
+            'timestamp': now.strftime('%d/%m/%Y %H:%M:%S')
         })
         
     except Exception as e:
@@ -436,6 +692,61 @@ def verify_attendance_face(request):
             'system_mode': 'BALANCED'
         }, status=500)
 
+def _qr_rut(qr_data):
+    """(RUT formateado, None) del código QR, o (None, mensaje de error)"""
+    rut_from_qr = extract_rut_from_qr(qr_data)
+    if not rut_from_qr:
+        return None, f'No se pudo extraer RUT del código QR. Contenido: {qr_data[:50]}...'
+    
+    # Formatear RUT para búsqueda
+    formatted_rut = format_rut_for_storage(rut_from_qr)
+    print(f"RUT formateado: {formatted_rut}")
+    
+    # Validar RUT
+    if not validate_chilean_rut(formatted_rut):
+        return None, f'RUT extraído del QR no es válido: {formatted_rut}'
+    return formatted_rut, None
+
+def _qr_duplicate_payload(employee, attendance_type, existing_record):
+    return {
+        'success': False,
+        'message': f'Ya existe un registro de {attendance_type} reciente para {employee.name}. Última entrada registrada hace menos de 5 minutos.',
+        'duplicate_found': True,
+        'existing_record': {
+            'timestamp': existing_record.timestamp.strftime('%d/%m/%Y %H:%M:%S'),
+            'type': existing_record.attendance_type
+        }
+    }
+
+def _qr_record_values(employee, attendance_type, formatted_rut, location_lat, location_lng, address):
+    """Campos del registro de una asistencia por QR"""
+    return {
+        'employee': employee,
+        'attendance_type': attendance_type,
+        'timestamp': timezone.now(),
+        'location_lat': location_lat,
+        'location_lng': location_lng,
+        'address': address,
+        'verification_method': 'qr',
+        'qr_verified': True,
+        'notes': f'Verificación QR exitosa - RUT: {formatted_rut}'
+    }
+
+def _qr_attendance_payload(employee, attendance_type, formatted_rut, qr_data, attendance_record):
+    return {
+        'success': True,
+        'message': f'✅ {attendance_type.upper()} REGISTRADA VIA QR',
+        'employee': _employee_payload(employee),
+        'verification': {
+            'method': 'QR_CODE_VERIFIED',
+            'rut_verified': formatted_rut,
+            'qr_content': qr_data[:100],
+            'security_level': 'ALTO'
+        },
+        'record': AttendanceRecordSerializer(attendance_record).data,
+        'timestamp': timezone.now().strftime('%d/%m/%Y %H:%M:%S')
+    }
+
 @api_view(['POST'])
 def verify_qr(request):
     """Verificar asistencia por código QR + RUT"""
@@ -455,50 +766,10 @@ def verify_qr(request):
         
         print(f"\n🆔 Verificando QR: {qr_data}")
         
-        # Extraer RUT del código QR con múltiples estrategias
-        rut_from_qr = None
-        
-        # Estrategia 1: Buscar patrón de RUT en el texto
-        import re
-        rut_pattern = r'(\d{7,8}[-]?[0-9kK])'
-        rut_matches = re.findall(rut_pattern, qr_data, re.IGNORECASE)
-        
-        if rut_matches:
-            rut_from_qr = rut_matches[0]
-            print(f"RUT encontrado por patrón: {rut_from_qr}")
-        else:
-            # Estrategia 2: Intentar como JSON
-            try:
-                qr_json = json.loads(qr_data)
-                rut_from_qr = qr_json.get('rut') or qr_json.get('RUT') or qr_json.get('run') or qr_json.get('RUN')
-            except:
-                # Estrategia 3: Asumir que el QR contiene directamente el RUT
-                clean_data = re.sub(r'[^0-9kK-]', '', qr_data).upper()
-                if len(clean_data) >= 8:
-                    rut_from_qr = clean_data
-                else:
-                    # Estrategia 4: Buscar cualquier secuencia de números seguida de dígito
-                    number_pattern = r'(\d{7,8}[0-9kK])'
-                    number_matches = re.findall(number_pattern, qr_data, re.IGNORECASE)
-                    if number_matches:
-                        rut_from_qr = number_matches[0]
-        
-        if not rut_from_qr:
-            return Response({
-                'success': False,
-                'message': f'No se pudo extraer RUT del código QR. Contenido: {qr_data[:50]}...'
-            }, status=400)
-        
-        # Formatear RUT para búsqueda
-        formatted_rut = format_rut_for_storage(rut_from_qr)
-        print(f"RUT formateado: {formatted_rut}")
-        
-        # Validar RUT
-        if not validate_chilean_rut(formatted_rut):
-            return Response({
-                'success': False,
-                'message': f'RUT extraído del QR no es válido: {formatted_rut}'
-            }, status=400)
+        # Extraer, formatear y validar el RUT del código QR
+        formatted_rut, error = _qr_rut(qr_data)
+        if error:
+            return Response({'success': False, 'message': error}, status=400)
         
         # Buscar empleado por RUT
         employee = search_employee_by_rut(formatted_rut)
@@ -517,51 +788,14 @@ def verify_qr(request):
         )
         
         if existing_record:
-            return Response({
-                'success': False,
-                'message': f'Ya existe un registro de {attendance_type} reciente para {employee.name}. Última entrada registrada hace menos de 5 minutos.',
-                'duplicate_found': True,
-                'existing_record': {
-                    'timestamp': existing_record.timestamp.strftime('%d/%m/%Y %H:%M:%S'),
-                    'type': existing_record.attendance_type
-                }
-            }, status=400)
+            return Response(_qr_duplicate_payload(employee, attendance_type, existing_record), status=400)
         
         # Crear registro de asistencia
-        attendance_record = AttendanceRecord.objects.create(
-            employee=employee,
-            attendance_type=attendance_type,
-            timestamp=timezone.now(),
-            location_lat=location_lat,
-            location_lng=location_lng,
-            address=address,
-            verification_method='qr',
-            qr_verified=True,
-            notes=f'Verificación QR exitosa - RUT: {formatted_rut}'
-        )
+        attendance_record = AttendanceRecord.objects.create(**_qr_record_values(
+            employee, attendance_type, formatted_rut, location_lat, location_lng, address
+        ))
         
-        serializer = AttendanceRecordSerializer(attendance_record)
-        
-        return Response({
-            'success': True,
-            'message': f'✅ {attendance_type.upper()} REGISTRADA VIA QR',
-            'employee': {
-                'id': str(employee.id),
-                'name': employee.name,
-                'employee_id': employee.employee_id,
-                'rut': employee.rut,
-                'department': employee.department,
-                'profile_image_url': employee.profile_image.url if employee.profile_image else None
-            },
-            'verification': {
-                'method': 'QR_CODE_VERIFIED',
-                'rut_verified': formatted_rut,
-                'qr_content': qr_data[:100],
-                'security_level': 'ALTO'
-            },
-            'record': serializer.data,
-            'timestamp': timezone.now().strftime('%d/%m/%Y %H:%M:%S')
-        })
+        return Response(_qr_attendance_payload(employee, attendance_type, formatted_rut, qr_data, attendance_record))
         
     except Exception as e:
         return Response({
@@ -570,6 +804,21 @@ def verify_qr(request):
             'error_type': 'QR_VERIFICATION_ERROR'
         }, status=500)
 
+def _manual_attendance_payload(employee, attendance_record):
+    return {
+        'success': True,
+        'message': f'✅ {attendance_record.attendance_type.upper()} registrada manualmente',
+        'record': AttendanceRecordSerializer(attendance_record).data,
+        'employee': {
+            'id': str(employee.id),
+            'name': employee.name,
+            'employee_id': employee.employee_id,
+            'rut': employee.rut,
+            'department': employee.department
+        },
+        'method': 'MANUAL/GPS'
+    }
+
 @api_view(['POST'])
 def mark_attendance(request):
     """Marcar asistencia manual o procesar verificación"""
@@ -635,21 +884,7 @@ def mark_attendance(request):
             offline_timestamp=data.get('offline_timestamp')
         )
         
-        serializer = AttendanceRecordSerializer(attendance_record)
-        
-        return Response({
-            'success': True,
-            'message': f'✅ {attendance_record.attendance_type.upper()} registrada manualmente',
-            'record': serializer.data,
-            'employee': {
-                'id': str(employee.id),
-                'name': employee.name,
-                'employee_id': employee.employee_id,
-                'rut': employee.rut,
-                'department': employee.department
-            },
-            'method': 'MANUAL/GPS'
-        })
+        return Response(_manual_attendance_payload(employee, attendance_record))
         
     except Exception as e:
         return Response({'success': False, 'message': f'Error: {str(e)}'}, status=500)
@@ -926,7 +1161,7 @@ def update_employee_profile(request, employee_id):
                     'message': f'RUT inválido: {new_rut}'
                 }, status=400)
             
-            if Employee.objects.filter(rut=formatted_rut).exclude(id=employee.id).exists():
+            if Employee.objects.filter(rut_normalized=normalize_rut(formatted_rut)).exclude(id=employee.id).exists():
                 return Response({
                     'success': False,
                     'message': f'El RUT {formatted_rut} ya está en uso por otro empleado'
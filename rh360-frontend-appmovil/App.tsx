@@ -29,6 +29,8 @@ const API_BASE_URL = 'https://bc60faf8d7e5.ngrok-free.app/api';
 
 const PHOTOS_FOR_REGISTRATION = 8;
 const VERIFICATION_TIMEOUT = 15;
+const ENROLLMENT_POLL_INTERVAL = 1500;
+const ENROLLMENT_TIMEOUT = 180;
 
 interface Employee {
   id: string;
@@ -41,6 +43,36 @@ interface Employee {
   profile_image?: string;
 }
 
+interface FaceEnrollmentJob {
+  id: string;
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  message: string;
+  valid_photos?: number;
+  progress: { processed: number; total: number };
+}
+
+// El registro facial se procesa en segundo plano: se consulta su estado hasta que termine
+const waitForEnrollmentJob = async (jobId: string): Promise<FaceEnrollmentJob | null> => {
+  const deadline = Date.now() + ENROLLMENT_TIMEOUT * 1000;
+  while (Date.now() < deadline) {
+    await new Promise(resolve => setTimeout(resolve, ENROLLMENT_POLL_INTERVAL));
+    try {
+      const response = await fetch(`${API_BASE_URL}/register-face/${jobId}/`);
+      if (response.status === 404) {
+        // El trabajo se elimina junto con el empleado
+        return { id: jobId, status: 'failed', message: 'Registro facial no encontrado', progress: { processed: 0, total: 0 } };
+      }
+      const data = await response.json();
+      if (data.success && (data.job.status === 'completed' || data.job.status === 'failed')) {
+        return data.job;
+      }
+    } catch (error) {
+      // Falla de red momentánea: se vuelve a consultar en el próximo intervalo
+    }
+  }
+  return null;
+};
+
 interface AttendanceRecord {
   id: string;
   employee_name: string;
@@ -446,7 +478,15 @@ export default function App() {
       });
 
       const data = await response.json();
-      if (data.success) {
+      if (!data.success) {
+        Alert.alert('❌ Error', data.message || 'Error registrando rostro');
+        return;
+      }
+
+      const job = await waitForEnrollmentJob(data.job_id);
+      if (!job) {
+        Alert.alert('⏳ En proceso', `El registro facial de ${employee.name} sigue en proceso. Revisa su estado más tarde.`);
+      } else if (job.status === 'completed') {
         setEmployees(prev => prev.map(emp =>
           emp.id === employee.id
             ? { ...emp, has_face_registered: true }
@@ -457,9 +497,9 @@ export default function App() {
           setSelectedEmployee({ ...employee, has_face_registered: true });
         }
 
-        Alert.alert('✅ ¡Registrado!', `Rostro de ${employee.name} registrado con ${data.photos_processed} fotos válidas`);
+        Alert.alert('✅ ¡Registrado!', `Rostro de ${employee.name} registrado con ${job.valid_photos} fotos válidas`);
       } else {
-        Alert.alert('❌ Error', data.message || 'Error registrando rostro');
+        Alert.alert('❌ Error', job.message || 'Error registrando rostro');
       }
     } catch (error) {
       Alert.alert('❌ Error', 'Error de conexión registrando rostro');
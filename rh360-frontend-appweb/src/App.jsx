@@ -14,6 +14,9 @@ const API_BASE_URL = 'https://6mj3964p-8000.brs.devtunnels.ms/';
 const NGROK_HEADERS = {
     'ngrok-skip-browser-warning': 'true'
 };
+// Cuadros por verificación y separación entre ellos
+const BURST_FRAMES = 4;
+const BURST_INTERVAL_MS = 120;
 const successAudio = new Audio(successSound);
 const contadorAudio = new Audio(contadorSound);
 
@@ -206,23 +209,29 @@ const App = () => {
             canvas.width = video.videoWidth;
             canvas.height = video.videoHeight;
             const ctx = canvas.getContext('2d');
-            ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
-            // Convertir a base64
-            const imageData = canvas.toDataURL('image/jpeg', 0.85);
+            // Ráfaga de cuadros: el servidor elige el más nítido y evita un reintento por foto movida
+            const frames = [];
+            for (let i = 0; i < BURST_FRAMES; i++) {
+                if (i > 0) {
+                    await new Promise(resolve => setTimeout(resolve, BURST_INTERVAL_MS));
+                }
+                ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+                frames.push(canvas.toDataURL('image/jpeg', 0.85));
+            }
             
             // Guardar la foto capturada para mostrarla en la confirmación
-            setCapturedPhoto(imageData);
+            setCapturedPhoto(frames[0]);
 
             // Enviar al servidor
-            const response = await fetch(`${API_BASE_URL}/api/verify-face/`, {
+            const response = await fetch(`${API_BASE_URL}/api/verify-face-burst/`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                     ...NGROK_HEADERS
                 },
                 body: JSON.stringify({
-                    photo: imageData,
+                    photos: frames,
                     type: currentProcess,
                     latitude: null,
                     longitude: null,
@@ -231,6 +240,9 @@ const App = () => {
             });
 
             const data = await response.json();
+            if (data.burst && data.burst.selected_frame !== null && frames[data.burst.selected_frame]) {
+                setCapturedPhoto(frames[data.burst.selected_frame]);
+            }
 
             if (response.ok && (data.success || data.duplicate_found)) {
                 // Reconocimiento exitoso